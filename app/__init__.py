@@ -6,6 +6,16 @@ import sys
 
 db = SQLAlchemy()
 
+def _versionar_estaticos(app):
+    def adicionar_versao(endpoint, values):
+        if endpoint == 'static' and 'filename' in values and 'v' not in values:
+            caminho = os.path.join(app.static_folder, values['filename'])
+            try:
+                values['v'] = int(os.path.getmtime(caminho))
+            except OSError:
+                pass
+    return adicionar_versao
+
 def create_app():
     if getattr(sys, 'frozen', False):
         base_dir = os.path.dirname(sys.executable)
@@ -19,17 +29,44 @@ def create_app():
     os.makedirs(app.instance_path, exist_ok=True)
 
     db_path = os.path.join(app.instance_path, 'imoveis.db')
-    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
+    # IMOVEIS_DATABASE_URI permite apontar para outro banco (ex.: um banco temporário nos benchmarks).
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('IMOVEIS_DATABASE_URI', f'sqlite:///{db_path}')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['SECRET_KEY'] = 'uma_chave_secreta_muito_segura'
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 30}}
+    app.config['HISTORICO_RETENCAO_DIAS'] = 365
+    app.config['TAREFAS_WORKERS'] = 1
+    app.config['RASPAGEM_WORKERS'] = 1
+    app.config['ENRIQUECIMENTO_WORKERS'] = 4
+    app.config['RETRATO_VALIDADE_DIAS'] = 7
+    # Arquivos de app/static ficam em cache no navegador por um ano; as URLs
+    # geradas por url_for levam a data de modificação (?v=...), então uma
+    # versão nova do CSS/JS muda a URL e não é servida do cache antigo.
+    app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 365 * 24 * 3600
 
     db.init_app(app)
 
+    from . import respostas
+    app.json = respostas.OrjsonProvider(app)
+    app.after_request(respostas.comprimir)
+    app.url_defaults(_versionar_estaticos(app))
+
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
     with app.app_context():
-        from . import models
-        db.create_all()
+        from . import models, migracoes
+        versao_anterior = migracoes.aplicar(db.engine, db.metadata)
+        if versao_anterior < 2:
+            # Bancos anteriores às chaves de identidade podem ter o mesmo imóvel
+            # gravado com duas MATRICULAs. Só avisa: a mesclagem apaga registros
+            # e fica a cargo de quem roda `python -m app.cli deduplicar`.
+            from . import identidade
+            duplicatas = identidade.contar_duplicatas()
+            if duplicatas:
+                logging.warning(
+                    f"{duplicatas} imóveis parecem duplicados (mesmo número da Caixa ou endereço). "
+                    f"Confira com 'python -m app.cli deduplicar --simular' e mescle com 'python -m app.cli deduplicar'."
+                )
 
         from . import routes
         app.register_blueprint(routes.bp)
@@ -0,0 +1,155 @@
+from app import db
+from app.models import Imovel, EstatisticaRegiao
+from sqlalchemy import bindparam, delete, insert, update
+import logging
+import time
+
+# Preço por m² e "score de valor" de cada imóvel ativo em relação à sua região.
+# O score é a distância robusta até a mediana do bairro (ou da cidade, quando o
+# bairro tem poucos imóveis): (mediana - preço/m²) / IQR. Quanto maior, mais
+# barato o imóvel está em relação aos vizinhos.
+STATUS_ATIVOS = ['Novo', 'Existente', 'Atualizado']
+AMOSTRA_MINIMA = 3
+
+def converter_area(serie):
+    """Converte áreas como '100,50 m²' (raspagem) ou '100.5' (Excel) em float; inválidas viram NaN."""
+    import pandas as pd
+
+    texto = serie.astype('string').str.lower().str.replace('m²', '', regex=False).str.strip()
+    com_virgula = texto.str.contains(',', regex=False, na=False)
+    texto = texto.where(~com_virgula, texto.str.replace('.', '', regex=False).str.replace(',', '.', regex=False))
+    return pd.to_numeric(texto, errors='coerce')
+
+def _estatisticas(df, chaves):
+    if df.empty:
+        import pandas as pd
+        return pd.DataFrame(columns=chaves + ['q1', 'mediana', 'q3', 'quantidade', 'iqr'])
+    grupos = df.groupby(chaves)['PRECO_M2']
+    resultado = grupos.quantile([0.25, 0.5, 0.75]).unstack()
+    resultado.columns = ['q1', 'mediana', 'q3']
+    resultado['quantidade'] = grupos.size()
+    resultado['iqr'] = resultado['q3'] - resultado['q1']
+    return resultado.reset_index()
+
+def _score(preco_m2, mediana, iqr):
+    escala = iqr.where(iqr > 0, mediana)
+    return ((mediana - preco_m2) / escala).round(3)
+
+def recalcular(ufs=None):
+    """
+    Recalcula preço/m², as estatísticas por cidade e bairro e o score dos
+    imóveis de 'ufs' (None: todas) em uma passada vetorizada. As regiões não
+    cruzam UFs, então uma sincronização só precisa recalcular as UFs que
+    gravou. Roda dentro da transação de quem chamou (sem commit) e não altera
+    updated_at: são valores derivados.
+    """
+    import pandas as pd
+
+    inicio = time.perf_counter()
+    colunas = ['UF', 'MATRICULA', 'CIDADE', 'BAIRRO', 'PRECO', 'AREA_PRIVATIVA', 'AREA_DO_TERRENO',
+               'Status', 'PRECO_M2', 'SCORE_VALOR']
+    query = db.session.query(*[getattr(Imovel, c) for c in colunas])
+    remocao = delete(EstatisticaRegiao)
+    if ufs is not None:
+        ufs = sorted(set(ufs))
+        query = query.filter(Imovel.UF.in_(ufs))
+        remocao = remocao.where(EstatisticaRegiao.UF.in_(ufs))
+    df = pd.DataFrame(query.all(), columns=colunas)
+    if df.empty:
+        db.session.execute(remocao)
+        return 0
+
+    area = converter_area(df['AREA_PRIVATIVA'])
+    area = area.where(area > 0, converter_area(df['AREA_DO_TERRENO']))
+    preco = pd.to_numeric(df['PRECO'], errors='coerce')
+    valido = (area > 0) & (preco > 0)
+    df['novo_m2'] = (preco / area).where(valido).round(2)
+
+    ativos = df[df['Status'].isin(STATUS_ATIVOS) & df['novo_m2'].notna()].copy()
+    ativos['PRECO_M2'] = ativos['novo_m2']
+    ativos['cidade_norm'] = ativos['CIDADE'].fillna('').str.strip().str.upper()
+    ativos['bairro_norm'] = ativos['BAIRRO'].fillna('').str.strip().str.upper()
+
+    por_cidade = _estatisticas(ativos, ['UF', 'cidade_norm'])
+    por_bairro = _estatisticas(ativos[ativos['bairro_norm'] != ''], ['UF', 'cidade_norm', 'bairro_norm'])
+
+    # Score contra o bairro quando ele tem amostra suficiente; senão, contra a cidade.
+    ativos = ativos.merge(
+        por_bairro[por_bairro['quantidade'] >= AMOSTRA_MINIMA][['UF', 'cidade_norm', 'bairro_norm', 'mediana', 'iqr']],
+        on=['UF', 'cidade_norm', 'bairro_norm'], how='left'
+    ).merge(
+        por_cidade[por_cidade['quantidade'] >= AMOSTRA_MINIMA][['UF', 'cidade_norm', 'mediana', 'iqr']],
+        on=['UF', 'cidade_norm'], how='left', suffixes=('_bairro', '_cidade')
+    )
+    usa_bairro = ativos['mediana_bairro'].notna()
+    mediana = ativos['mediana_bairro'].where(usa_bairro, ativos['mediana_cidade'])
+    iqr = ativos['iqr_bairro'].where(usa_bairro, ativos['iqr_cidade'])
+    ativos['novo_score'] = _score(ativos['novo_m2'], mediana, iqr)
+
+    df = df.merge(ativos[['UF', 'MATRICULA', 'novo_score']], on=['UF', 'MATRICULA'], how='left')
+    df['novo_score'] = df['novo_score'].where(df['novo_score'].notna(), None)
+    df['novo_m2'] = df['novo_m2'].where(df['novo_m2'].notna(), None)
+
+    # Só grava as linhas cujo valor mudou.
+    def diferente(atual, novo):
+        return ~((atual.isna() & novo.isna()) | (atual.astype('float64') == novo.astype('float64')))
+    mudou = diferente(df['PRECO_M2'], df['novo_m2']) | diferente(df['SCORE_VALOR'], df['novo_score'])
+    alterados = df[mudou]
+    if not alterados.empty:
+        tabela = Imovel.__table__
+        comando = update(tabela).where(
+            tabela.c.UF == bindparam('b_uf'), tabela.c.MATRICULA == bindparam('b_matricula')
+        ).values(
+            PRECO_M2=bindparam('b_m2'), SCORE_VALOR=bindparam('b_score'),
+            updated_at=tabela.c.updated_at
+        )
+        db.session.execute(comando, [
+            {'b_uf': uf, 'b_matricula': matricula,
+             'b_m2': None if pd.isna(m2) else float(m2), 'b_score': None if pd.isna(score) else float(score)}
+            for uf, matricula, m2, score in alterados[['UF', 'MATRICULA', 'novo_m2', 'novo_score']].itertuples(index=False)
+        ])
+
+    registros = []
+    for nivel, tabela_estat in (('cidade', por_cidade), ('bairro', por_bairro)):
+        for linha in tabela_estat.itertuples(index=False):
+            registros.append({
+                'nivel': nivel, 'UF': linha.UF, 'CIDADE': linha.cidade_norm,
+                'BAIRRO': getattr(linha, 'bairro_norm', ''), 'quantidade': int(linha.quantidade),
+                'mediana': round(float(linha.mediana), 2), 'q1': round(float(linha.q1), 2),
+                'q3': round(float(linha.q3), 2), 'iqr': round(float(linha.iqr), 2),
+            })
+    db.session.execute(remocao)
+    if registros:
+        db.session.execute(insert(EstatisticaRegiao), registros)
+
+    escopo = f" ({', '.join(ufs)})" if ufs is not None else ''
+    logging.info(
+        f"Análise de valor{escopo}: {len(ativos)} imóveis com preço/m², {len(registros)} regiões, "
+        f"{len(alterados)} linhas atualizadas em {time.perf_counter() - inicio:.2f}s."
+    )
+    return len(alterados)
+
+def get_melhores_ofertas(uf=None, cidade=None, tipo=None, score_minimo=None, limite=100):
+    """Imóveis ativos com maior score de valor (mais baratos que a região), via índice de SCORE_VALOR."""
+    # recalcular só dá score a imóveis ativos, então o filtro de status já está
+    # implícito em SCORE_VALOR IS NOT NULL e a ordenação percorre o índice.
+    query = Imovel.query.filter(Imovel.SCORE_VALOR.isnot(None))
+    if uf:
+        query = query.filter(Imovel.UF == uf.upper())
+    if cidade:
+        query = query.filter(db.func.upper(db.func.trim(Imovel.CIDADE)) == cidade.upper())
+    if tipo:
+        query = query.filter(db.func.upper(db.func.trim(Imovel.TIPO)) == tipo.upper())
+    if score_minimo is not None:
+        query = query.filter(Imovel.SCORE_VALOR >= score_minimo)
+    return query.order_by(Imovel.SCORE_VALOR.desc()).limit(limite).all()
+
+def get_estatisticas_regiao(uf=None, cidade=None, nivel=None):
+    query = EstatisticaRegiao.query
+    if nivel:
+        query = query.filter(EstatisticaRegiao.nivel == nivel)
+    if uf:
+        query = query.filter(EstatisticaRegiao.UF == uf.upper())
+    if cidade:
+        query = query.filter(EstatisticaRegiao.CIDADE == cidade.upper())
+    return [e.to_dict() for e in query.order_by(EstatisticaRegiao.UF, EstatisticaRegiao.CIDADE, EstatisticaRegiao.BAIRRO)]
@@ -0,0 +1,48 @@
+from app import db
+from app.models import Imovel
+from app.migracoes import FTS_TABELA
+from sqlalchemy import Float, Integer, literal_column, or_, text
+import re
+
+_fts_disponivel = None
+
+def fts_disponivel():
+    """Indica se o índice FTS5 existe no banco (resultado guardado por processo)."""
+    global _fts_disponivel
+    if _fts_disponivel is None:
+        _fts_disponivel = db.session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :nome"),
+            {'nome': FTS_TABELA}
+        ).first() is not None
+    return _fts_disponivel
+
+def _termos(texto):
+    return re.findall(r'\w+', texto.lower())
+
+def montar_expressao_fts(texto):
+    """Converte o texto digitado em uma expressão FTS5 segura: cada palavra vira
+    um prefixo entre aspas e todas precisam aparecer ("rua flo" -> "rua"* "flo"*)."""
+    return ' '.join(f'"{termo}"*' for termo in _termos(texto))
+
+def filtrar_por_texto(query, texto):
+    """
+    Restringe a query aos imóveis que casam com 'texto' em endereço, bairro,
+    cidade ou descrição. Retorna (query, coluna_de_relevancia); a coluna é None
+    quando o FTS não está disponível e a busca cai para LIKE.
+    """
+    expressao = montar_expressao_fts(texto)
+    if not expressao:
+        return query, None
+
+    if fts_disponivel():
+        busca = text(
+            f"SELECT rowid AS rowid, bm25({FTS_TABELA}, 4.0, 2.0, 2.0, 1.0) AS rank "
+            f"FROM {FTS_TABELA} WHERE {FTS_TABELA} MATCH :expressao"
+        ).bindparams(expressao=expressao).columns(rowid=Integer, rank=Float).subquery('busca')
+        query = query.join(busca, literal_column('imoveis.rowid') == busca.c.rowid)
+        return query, busca.c.rank
+
+    colunas = [Imovel.ENDERECO, Imovel.BAIRRO, Imovel.CIDADE, Imovel.DESCRICAO]
+    for termo in _termos(texto):
+        query = query.filter(or_(*[coluna.ilike(f'%{termo}%') for coluna in colunas]))
+    return query, None
@@ -0,0 +1,144 @@
+from app import busca, datalogic, db
+from app.models import BuscaSalva, Execucao, Imovel, ResultadoBusca, converter_data
+from datetime import datetime
+from sqlalchemy import delete, func, insert, literal, tuple_
+import json
+import logging
+
+# Buscas salvas: combinações de filtros de /api/data que se repetem ao longo do
+# dia. Os imóveis que atendem cada uma ficam em resultados_busca e, a cada
+# sincronização, são conferidos só os imóveis que ela gravou (updated_at desde o
+# início da execução, pelo índice ix_imoveis_updated_at_status), não a tabela
+# inteira. encontrado_em marca quando o imóvel passou a atender a busca; os
+# encontrados depois da última visualização são os "novos".
+PARAMETROS = ['status', *datalogic.FILTROS_TEXTO, 'preco_min', 'preco_max', 'data_inicio', 'data_fim', 'q']
+
+def validar_filtros(filtros):
+    """
+    Filtros {parâmetro de /api/data: valor} com os valores em texto e sem os
+    vazios. ValueError para parâmetro desconhecido ou valor inválido.
+    """
+    if not isinstance(filtros, dict):
+        raise ValueError("'filtros' deve ser um objeto {parâmetro: valor}.")
+    desconhecidos = sorted(set(filtros) - set(PARAMETROS))
+    if desconhecidos:
+        raise ValueError(f"Parâmetros desconhecidos: {', '.join(desconhecidos)}.")
+    limpos = {chave: str(valor).strip() for chave, valor in filtros.items() if valor is not None and str(valor).strip()}
+    if 'status' in limpos and limpos['status'] not in datalogic.FILTROS_STATUS:
+        raise ValueError(f"Status inválido: '{limpos['status']}'. Use {', '.join(datalogic.FILTROS_STATUS)}.")
+    for chave in ('preco_min', 'preco_max'):
+        if chave in limpos:
+            try:
+                float(limpos[chave])
+            except ValueError:
+                raise ValueError(f"Valor inválido para {chave}: '{limpos[chave]}'.")
+    for chave in ('data_inicio', 'data_fim'):
+        if chave in limpos and converter_data(limpos[chave]) is None:
+            raise ValueError(f"Data inválida para {chave}: '{limpos[chave]}'. Use aaaa-mm-dd ou dd/mm/aaaa.")
+    return limpos
+
+def _atendem(busca_salva, *condicoes):
+    """Query (UF, MATRICULA) dos imóveis que atendem a busca, entre os de 'condicoes'."""
+    filtros = json.loads(busca_salva.filtros)
+    query = db.session.query(Imovel.UF, Imovel.MATRICULA).filter(*datalogic.filtros_imoveis(filtros), *condicoes)
+    if filtros.get('q'):
+        query, _ = busca.filtrar_por_texto(query, filtros['q'])
+    return query
+
+def _avaliar(busca_salva, agora, *condicoes):
+    """
+    Acerta resultados_busca para os imóveis de 'condicoes' (sem elas, todos):
+    sai quem deixou de atender a busca, entra quem passou a atender, com
+    encontrado_em = 'agora'. Quem já estava mantém a data. Devolve (entraram, sairam).
+    """
+    atendem = _atendem(busca_salva, *condicoes)
+    chave = tuple_(ResultadoBusca.UF, ResultadoBusca.MATRICULA)
+    remocao = delete(ResultadoBusca).where(ResultadoBusca.busca_id == busca_salva.id, chave.notin_(atendem.statement))
+    if condicoes:
+        conferidos = db.session.query(Imovel.UF, Imovel.MATRICULA).filter(*condicoes)
+        remocao = remocao.where(chave.in_(conferidos.statement))
+    sairam = db.session.execute(remocao).rowcount
+    entraram = db.session.execute(insert(ResultadoBusca).prefix_with('OR IGNORE').from_select(
+        ['busca_id', 'UF', 'MATRICULA', 'encontrado_em'],
+        atendem.with_entities(literal(busca_salva.id), Imovel.UF, Imovel.MATRICULA, literal(agora, db.DateTime)).statement
+    )).rowcount
+    busca_salva.avaliada_em = agora
+    return entraram, sairam
+
+def atualizar(execucao_id):
+    """
+    Chamada por toda execução que grava imóveis (sincronização, planilha,
+    reprocessamento de páginas e enriquecimento), antes do commit: confere
+    todas as buscas salvas contra os imóveis inseridos, alterados ou
+    expirados pela execução.
+    """
+    buscas = BuscaSalva.query.all()
+    if not buscas:
+        return
+    execucao = db.session.get(Execucao, execucao_id)
+    # updated_at é texto do SQLite (CURRENT_TIMESTAMP), como em /api/changes.
+    alterado = Imovel.updated_at >= literal(execucao.iniciado_em.strftime('%Y-%m-%d %H:%M:%S'), db.String)
+    agora = datetime.utcnow()
+    entraram = sairam = 0
+    for busca_salva in buscas:
+        novos, removidos = _avaliar(busca_salva, agora, alterado)
+        entraram += novos
+        sairam += removidos
+    logging.info(f"Buscas salvas: {len(buscas)} conferidas, {entraram} imóveis novos, {sairam} deixaram de atender.")
+
+def criar(nome, filtros):
+    """Grava a busca e já calcula os imóveis que a atendem (nenhum conta como novo). Faz commit."""
+    agora = datetime.utcnow()
+    busca_salva = BuscaSalva(
+        nome=nome, filtros=json.dumps(validar_filtros(filtros), ensure_ascii=False, sort_keys=True),
+        visualizada_em=agora,
+    )
+    db.session.add(busca_salva)
+    db.session.flush()
+    _avaliar(busca_salva, agora)
+    db.session.commit()
+    return busca_salva
+
+def remover(busca_id):
+    """Apaga a busca e os resultados dela; False se não existe. Faz commit."""
+    busca_salva = db.session.get(BuscaSalva, busca_id)
+    if busca_salva is None:
+        return False
+    db.session.execute(delete(ResultadoBusca).where(ResultadoBusca.busca_id == busca_id))
+    db.session.delete(busca_salva)
+    db.session.commit()
+    return True
+
+def listar():
+    """Buscas salvas com o total de imóveis e quantos são novos desde a última visualização."""
+    novo = db.case((ResultadoBusca.encontrado_em > BuscaSalva.visualizada_em, 1), else_=0)
+    query = db.session.query(
+        BuscaSalva, func.count(ResultadoBusca.busca_id), func.coalesce(func.sum(novo), 0)
+    ).outerjoin(ResultadoBusca, ResultadoBusca.busca_id == BuscaSalva.id).group_by(BuscaSalva.id).order_by(BuscaSalva.id)
+    return [{**busca_salva.to_dict(), 'total': total, 'novos': novos} for busca_salva, total, novos in query]
+
+def contar(busca_salva):
+    """Quantos imóveis atendem a busca agora."""
+    return db.session.query(func.count()).select_from(ResultadoBusca).filter(ResultadoBusca.busca_id == busca_salva.id).scalar()
+
+def resultados(busca_salva, limite=None, deslocamento=0, novos=False):
+    """
+    Imóveis que atendem a busca, os encontrados mais recentemente primeiro
+    (depois por preço), como tuplas (colunas públicas de Imovel..., encontrado_em).
+    Com 'novos', só os encontrados depois da última visualização.
+    """
+    query = db.session.query(
+        *[getattr(Imovel, coluna) for coluna in Imovel.colunas_publicas()], ResultadoBusca.encontrado_em
+    ).join(
+        Imovel, db.and_(Imovel.UF == ResultadoBusca.UF, Imovel.MATRICULA == ResultadoBusca.MATRICULA)
+    ).filter(ResultadoBusca.busca_id == busca_salva.id).order_by(ResultadoBusca.encontrado_em.desc(), Imovel.PRECO)
+    if novos:
+        query = query.filter(ResultadoBusca.encontrado_em > busca_salva.visualizada_em)
+    if limite is not None:
+        query = query.limit(limite).offset(deslocamento)
+    return query.all()
+
+def marcar_visualizada(busca_salva):
+    """A partir de agora os imóveis atuais deixam de ser novos. Faz commit."""
+    busca_salva.visualizada_em = datetime.utcnow()
+    db.session.commit()
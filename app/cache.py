@@ -0,0 +1,96 @@
+from app import db, metricas
+from app.models import VersaoDados
+from flask import current_app, g, make_response, request, Response
+from functools import wraps
+from collections import OrderedDict
+import hashlib
+import threading
+
+# Cache em memória das respostas de leitura, indexado por (endpoint, argumentos,
+# versão dos dados). Como a versão muda a cada sincronização, nenhuma entrada
+# precisa ser invalidada explicitamente: ao detectar versão nova o cache é esvaziado.
+CACHE_MAX_PADRAO = 256
+
+_cache = OrderedDict()
+_versao_em_cache = None
+_lock = threading.Lock()
+
+def versao_atual():
+    registro = db.session.get(VersaoDados, 1)
+    return registro.versao if registro else 0
+
+def incrementar_versao():
+    """Incrementa a versão dos dados; deve rodar na mesma transação da sincronização."""
+    registro = db.session.get(VersaoDados, 1)
+    if registro is None:
+        db.session.add(VersaoDados(id=1, versao=1))
+    else:
+        registro.versao = VersaoDados.versao + 1
+
+def nao_armazenar():
+    """Marca a resposta atual (ex.: fallback de erro) para não ir ao cache nem receber ETag."""
+    g.nao_armazenar_resposta = True
+
+def limpar():
+    """Esvazia o cache (ex.: ao trocar o banco usado pelo processo)."""
+    global _versao_em_cache
+    with _lock:
+        _cache.clear()
+        _versao_em_cache = None
+
+def _obter(chave, versao):
+    global _versao_em_cache
+    with _lock:
+        if _versao_em_cache != versao:
+            _cache.clear()
+            _versao_em_cache = versao
+            return None
+        entrada = _cache.get(chave)
+        if entrada is not None:
+            _cache.move_to_end(chave)
+        return entrada
+
+def _armazenar(chave, entrada):
+    limite = current_app.config.get('RESPOSTAS_CACHE_MAX', CACHE_MAX_PADRAO)
+    with _lock:
+        _cache[chave] = entrada
+        _cache.move_to_end(chave)
+        while len(_cache) > limite:
+            _cache.popitem(last=False)
+
+def resposta_versionada(view):
+    """
+    Decorator para endpoints de leitura: responde 304 quando o If-None-Match
+    confere com a versão atual dos dados e reaproveita o corpo já serializado
+    enquanto a versão não mudar.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        versao = versao_atual()
+        chave = (
+            request.endpoint,
+            # '_' é o cache-buster do jQuery/DataTables e não altera a resposta
+            tuple(sorted((k, v) for k, v in request.args.items(multi=True) if k != '_')),
+            tuple(sorted(kwargs.items()))
+        )
+        etag = hashlib.sha1(repr((chave, versao)).encode('utf-8')).hexdigest()[:24]
+
+        if request.if_none_match.contains_weak(etag):
+            metricas.CACHE_RESPOSTAS.inc(resultado='not_modified')
+            resposta = Response(status=304)
+        else:
+            entrada = _obter(chave, versao)
+            metricas.CACHE_RESPOSTAS.inc(resultado='hit' if entrada is not None else 'miss')
+            if entrada is not None:
+                corpo, mimetype = entrada
+                resposta = Response(corpo, mimetype=mimetype)
+            else:
+                resposta = make_response(view(*args, **kwargs))
+                if resposta.status_code != 200 or g.get('nao_armazenar_resposta'):
+                    return resposta
+                _armazenar(chave, (resposta.get_data(), resposta.mimetype))
+
+        resposta.set_etag(etag, weak=True)
+        resposta.headers['Cache-Control'] = 'no-cache'
+        return resposta
+    return wrapper
@@ -0,0 +1,233 @@
+"""
+Linha de comando para rodar a atualização sem o navegador (ex.: via cron).
+
+    python -m app.cli refresh --states SP,RJ --workers 8
+    python -m app.cli refresh --states SP --completo      # raspa também as linhas inalteradas
+    python -m app.cli reprocessar --states SP --limit 500
+    python -m app.cli analisar
+    python -m app.cli deduplicar --simular             # só conta os duplicados
+    python -m app.cli deduplicar
+    python -m app.cli compactar                        # VACUUM + reconstrução da busca textual
+    python -m app.cli enriquecer --states SP --workers 8
+
+Códigos de saída: 0 sucesso, 1 algum estado falhou, 2 argumentos inválidos.
+"""
+import argparse
+import logging
+import sys
+import time
+from app import analise, cache, create_app, db, identidade, migracoes, pipeline, reprocessamento, scraper, tarefas
+
+INTERVALO_PROGRESSO = 5
+
+def _formatar_duracao(segundos):
+    minutos, segundos = divmod(int(segundos), 60)
+    return f"{minutos:02d}:{segundos:02d}"
+
+def _imprimir_evento(evento, ultimo_percentual):
+    """Imprime um evento do pipeline; o progresso por item só a cada INTERVALO_PROGRESSO%."""
+    tipo = evento.get('type')
+    if tipo == 'state_progress':
+        total = evento.get('total') or 0
+        percentual = int(evento.get('current', 0) * 100 / total) if total else 0
+        estado = evento.get('state')
+        if percentual - ultimo_percentual.get(estado, -INTERVALO_PROGRESSO) >= INTERVALO_PROGRESSO:
+            ultimo_percentual[estado] = percentual
+            print(f"  {estado}: {evento['current']}/{total} ({percentual}%)", flush=True)
+    elif tipo == 'error':
+        print(f"  ERRO: {evento.get('message')}", file=sys.stderr, flush=True)
+    elif tipo == 'state_completed':
+        resultado = evento.get('result', {})
+        print(
+            f"  {evento['state']} concluído em {_formatar_duracao(evento.get('elapsed', 0))}: "
+            f"{resultado.get('total_processed', 0)} processados, "
+            f"{resultado.get('new', 0)} novos, {resultado.get('updated', 0)} atualizados, "
+            f"{resultado.get('unchanged', 0)} inalterados",
+            flush=True
+        )
+    elif tipo in ('download_start', 'download_completed', 'csv_processed', 'csv_diff', 'db_start'):
+        print(f"  {evento.get('message')}", flush=True)
+
+def comando_refresh(args):
+    estados = [uf.strip().upper() for uf in args.states.split(',') if uf.strip()]
+    invalidos = [uf for uf in estados if uf not in pipeline.UFS_VALIDAS]
+    if not estados or invalidos:
+        print(f"Estados inválidos: {', '.join(invalidos) or '(nenhum informado)'}", file=sys.stderr)
+        return 2
+
+    if args.base_url:
+        scraper.URL_BASE = args.base_url.rstrip('/')
+
+    app = create_app()
+    inicio = time.monotonic()
+    falhas = []
+    with app.app_context():
+        for i, estado in enumerate(estados):
+            print(f"[{i + 1}/{len(estados)}] {estado}", flush=True)
+            ultimo_percentual = {}
+            try:
+                # Pela tabela de tarefas: não roda junto com um job do dashboard (ou de outro cron) para a mesma UF.
+                eventos = tarefas.executar(estado, workers=args.workers, indice=i + 1, total_estados=len(estados), completo=args.completo)
+                for evento in eventos:
+                    _imprimir_evento(evento, ultimo_percentual)
+            except tarefas.TarefaEmAndamento as e:
+                print(f"  IGNORADO: {e}", file=sys.stderr, flush=True)
+                falhas.append(estado)
+            except Exception as e:
+                logging.error(f"Erro no processamento do estado {estado}: {e}", exc_info=True)
+                print(f"  ERRO: {estado}: {e}", file=sys.stderr, flush=True)
+                falhas.append(estado)
+        total_imoveis = pipeline.contar_imoveis()
+
+    print(
+        f"Finalizado em {_formatar_duracao(time.monotonic() - inicio)}: "
+        f"{len(estados) - len(falhas)}/{len(estados)} estados, {total_imoveis} imóveis no banco.",
+        flush=True
+    )
+    if falhas:
+        print(f"Estados com falha: {', '.join(falhas)}", file=sys.stderr)
+        return 1
+    return 0
+
+def comando_reprocessar(args):
+    estados = [uf.strip().upper() for uf in (args.states or '').split(',') if uf.strip()]
+    invalidos = [uf for uf in estados if uf not in pipeline.UFS_VALIDAS]
+    if invalidos:
+        print(f"Estados inválidos: {', '.join(invalidos)}", file=sys.stderr)
+        return 2
+
+    app = create_app()
+    falhas = []
+    totais = {'total_processed': 0, 'recovered': 0, 'failed': 0, 'updated': 0}
+    with app.app_context():
+        for estado in estados or reprocessamento.ufs_pendentes():
+            try:
+                # Pela tabela de tarefas, como o refresh: um job por UF entre todos os processos.
+                for evento in tarefas.executar(estado, workers=args.workers, tipo='reprocessamento', limite=args.limit):
+                    if evento.get('type') == 'state_completed':
+                        for chave in totais:
+                            totais[chave] += evento['result'].get(chave, 0)
+            except tarefas.TarefaEmAndamento as e:
+                print(f"  IGNORADO: {e}", file=sys.stderr, flush=True)
+                falhas.append(estado)
+            except Exception as e:
+                logging.error(f"Erro no reprocessamento de {estado}: {e}", exc_info=True)
+                print(f"  ERRO: {estado}: {e}", file=sys.stderr, flush=True)
+                falhas.append(estado)
+    print(
+        f"{totais['total_processed']} páginas pendentes: {totais['recovered']} recuperadas, "
+        f"{totais['failed']} ainda com falha, {totais['updated']} imóveis atualizados.",
+        flush=True
+    )
+    return 1 if falhas else 0
+
+def comando_analisar(args):
+    app = create_app()
+    with app.app_context():
+        try:
+            alterados = analise.recalcular()
+            if alterados:
+                cache.incrementar_versao()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Erro ao recalcular a análise de valor: {e}", exc_info=True)
+            print(f"ERRO: {e}", file=sys.stderr)
+            return 1
+    print(f"Preço/m² e score de valor recalculados: {alterados} imóveis alterados.", flush=True)
+    return 0
+
+def comando_enriquecer(args):
+    estados = [uf.strip().upper() for uf in (args.states or '').split(',') if uf.strip()]
+    invalidos = [uf for uf in estados if uf not in pipeline.UFS_VALIDAS]
+    if invalidos:
+        print(f"Estados inválidos: {', '.join(invalidos)}", file=sys.stderr)
+        return 2
+
+    app = create_app()
+    falhas = []
+    with app.app_context():
+        for estado in estados or reprocessamento.ufs_incompletas():
+            ultimo_percentual = {}
+            try:
+                for evento in tarefas.executar(estado, workers=args.workers, tipo='enriquecimento'):
+                    _imprimir_evento(evento, ultimo_percentual)
+            except tarefas.TarefaEmAndamento as e:
+                print(f"  IGNORADO: {e}", file=sys.stderr, flush=True)
+                falhas.append(estado)
+            except Exception as e:
+                logging.error(f"Erro no enriquecimento de {estado}: {e}", exc_info=True)
+                print(f"  ERRO: {estado}: {e}", file=sys.stderr, flush=True)
+                falhas.append(estado)
+    return 1 if falhas else 0
+
+def comando_deduplicar(args):
+    app = create_app()
+    with app.app_context():
+        if args.simular:
+            print(f"{identidade.contar_duplicatas()} imóveis duplicados seriam mesclados.", flush=True)
+            return 0
+        try:
+            removidos = identidade.mesclar_duplicatas()
+            if removidos:
+                analise.recalcular()
+                cache.incrementar_versao()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Erro ao mesclar imóveis duplicados: {e}", exc_info=True)
+            print(f"ERRO: {e}", file=sys.stderr)
+            return 1
+    print(f"{removidos} imóveis duplicados mesclados.", flush=True)
+    return 0
+
+def comando_compactar(args):
+    app = create_app()
+    with app.app_context():
+        try:
+            migracoes.compactar(db.engine)
+        except Exception as e:
+            logging.error(f"Erro ao compactar o banco: {e}", exc_info=True)
+            print(f"ERRO: {e}", file=sys.stderr)
+            return 1
+    print("Banco compactado e índice de busca textual reconstruído.", flush=True)
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m app.cli', description='Bot Caixa sem interface web.')
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    refresh = subparsers.add_parser('refresh', help='Baixa, raspa e sincroniza os estados informados.')
+    refresh.add_argument('--states', required=True, help='UFs separadas por vírgula, ex.: SP,RJ')
+    refresh.add_argument('--workers', type=int, default=1, help='Páginas de detalhe buscadas em paralelo (padrão: 1)')
+    refresh.add_argument('--completo', action='store_true',
+                         help='Raspa todas as linhas do CSV, não só as que mudaram desde a última execução')
+    refresh.add_argument('--base-url', help='Servidor das listas CSV (padrão: CAIXA_BASE_URL ou o site da Caixa)')
+    refresh.set_defaults(func=comando_refresh)
+
+    reprocessar = subparsers.add_parser('reprocessar', help='Tenta de novo as páginas de detalhe que falharam.')
+    reprocessar.add_argument('--states', help='Restringe às UFs informadas, ex.: SP,RJ (padrão: todas com páginas pendentes)')
+    reprocessar.add_argument('--limit', type=int, default=500, help='Máximo de páginas por estado nesta rodada (padrão: 500)')
+    reprocessar.add_argument('--workers', type=int, default=1, help='Páginas buscadas em paralelo (padrão: 1)')
+    reprocessar.set_defaults(func=comando_reprocessar)
+
+    analisar = subparsers.add_parser('analisar', help='Recalcula preço/m², estatísticas por região e score de valor.')
+    analisar.set_defaults(func=comando_analisar)
+
+    enriquecer = subparsers.add_parser('enriquecer', help='Busca as páginas de detalhe dos imóveis importados por planilha.')
+    enriquecer.add_argument('--states', help='Restringe às UFs informadas (padrão: todas com imóveis incompletos)')
+    enriquecer.add_argument('--workers', type=int, default=reprocessamento.WORKERS_ENRIQUECIMENTO, help='Páginas buscadas em paralelo (padrão: 4)')
+    enriquecer.set_defaults(func=comando_enriquecer)
+
+    deduplicar = subparsers.add_parser('deduplicar', help='Mescla imóveis gravados com mais de uma MATRICULA.')
+    deduplicar.add_argument('--simular', action='store_true', help='Só informa quantos imóveis seriam mesclados')
+    deduplicar.set_defaults(func=comando_deduplicar)
+
+    compactar = subparsers.add_parser('compactar', help='VACUUM do banco e reconstrução do índice de busca textual.')
+    compactar.set_defaults(func=comando_compactar)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,148 @@
+import logging
+import os
+import threading
+import time
+from http.cookiejar import DefaultCookiePolicy
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+from app import metricas
+
+# Cliente HTTP do scraper: uma sessão por processo, compartilhada pelas threads
+# de download e de páginas de detalhe, com pool de conexões keep-alive. Sem
+# ela, cada requests.get abria uma conexão TCP + TLS nova com a Caixa.
+#
+# Com httpx e h2 instalados (pip install httpx[http2]) a sessão usa HTTP/2,
+# que multiplexa as páginas numa única conexão; sem eles, requests com
+# HTTP/1.1. Para quem chama, os dois se comportam igual: a resposta tem
+# status_code, headers e content, e falhas de rede viram requests.Timeout /
+# requests.ConnectionError (as demais do httpx, requests.RequestException).
+# CAIXA_HTTP2=0 força o requests.
+#
+# Timeouts separados: TIMEOUT_CONEXAO para abrir a conexão (site fora do ar
+# falha rápido) e o de leitura, escolhido por quem chama (página x lista CSV).
+TAMANHO_POOL = int(os.environ.get('CAIXA_HTTP_POOL', 32))
+TIMEOUT_CONEXAO = 10
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+_cliente = None
+_lock = threading.Lock()
+
+def _cabecalhos():
+    # gzip/deflate sempre; br e zstd quando o urllib3 tem os decodificadores instalados.
+    cabecalhos = make_headers(accept_encoding=True)
+    cabecalhos['User-Agent'] = USER_AGENT
+    return cabecalhos
+
+class _ClienteRequests:
+    """Sessão do requests com pool dimensionado e sem cookies (cada GET independe dos anteriores)."""
+    protocolo = 'HTTP/1.1'
+
+    def __init__(self, tamanho_pool):
+        self.sessao = requests.Session()
+        self.sessao.headers.update(_cabecalhos())
+        self.sessao.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=tamanho_pool, max_retries=0)
+        self.sessao.mount('http://', adaptador)
+        self.sessao.mount('https://', adaptador)
+        self._conexoes_vistas = {}
+        self._lock = threading.Lock()
+
+    def get(self, url, timeout):
+        resposta = self.sessao.get(url, timeout=timeout)
+        # elapsed: do envio até os cabeçalhos chegarem (inclui a conexão, quando ela é nova).
+        return resposta, resposta.elapsed.total_seconds()
+
+    def conexoes_novas(self, url):
+        """Conexões abertas desde a última chamada, somadas dos pools do urllib3 (um por host)."""
+        pools = self.sessao.get_adapter(url).poolmanager.pools
+        novas = 0
+        with self._lock:
+            for chave in pools.keys():
+                pool = pools.get(chave)
+                if pool is None:
+                    continue
+                novas += pool.num_connections - self._conexoes_vistas.get(id(pool), 0)
+                self._conexoes_vistas[id(pool)] = pool.num_connections
+        return max(0, novas)
+
+    def fechar(self):
+        self.sessao.close()
+
+class _ClienteHttpx:
+    """httpx com HTTP/2; todas as exceções dele traduzidas para as do requests, que o scraper já trata."""
+    protocolo = 'HTTP/2'
+
+    def __init__(self, tamanho_pool):
+        import httpx
+
+        self.httpx = httpx
+        self.cliente = httpx.Client(
+            http2=True, headers=_cabecalhos(), follow_redirects=True,
+            limits=httpx.Limits(max_connections=tamanho_pool, max_keepalive_connections=tamanho_pool),
+        )
+
+    def get(self, url, timeout):
+        conexao, leitura = timeout
+        inicio = time.perf_counter()
+        try:
+            with self.cliente.stream('GET', url, timeout=self.httpx.Timeout(leitura, connect=conexao)) as resposta:
+                primeiro_byte = time.perf_counter() - inicio
+                resposta.read()
+        except self.httpx.TimeoutException as e:
+            raise requests.Timeout(str(e)) from e
+        except self.httpx.TransportError as e:
+            raise requests.ConnectionError(str(e)) from e
+        except (self.httpx.HTTPError, self.httpx.InvalidURL, self.httpx.StreamError) as e:
+            # TooManyRedirects, DecodingError, URL inválida...: falha só desta
+            # requisição, tratada pelo scraper como as do requests.
+            raise requests.RequestException(str(e)) from e
+        return resposta, primeiro_byte
+
+    def conexoes_novas(self, url):
+        # O httpx não expõe a contagem de conexões do pool.
+        return 0
+
+    def fechar(self):
+        self.cliente.close()
+
+def _criar():
+    if os.environ.get('CAIXA_HTTP2', '1') != '0':
+        try:
+            import httpx  # noqa: F401
+            import h2  # noqa: F401
+        except ImportError:
+            pass
+        else:
+            return _ClienteHttpx(TAMANHO_POOL)
+    return _ClienteRequests(TAMANHO_POOL)
+
+def cliente():
+    global _cliente
+    if _cliente is None:
+        with _lock:
+            if _cliente is None:
+                _cliente = _criar()
+                logging.info(f"Cliente HTTP do scraper: {_cliente.protocolo}, pool de {TAMANHO_POOL} conexões.")
+    return _cliente
+
+def get(url, timeout_leitura, uf=None):
+    """
+    GET pela sessão compartilhada. Registra o tempo até o primeiro byte e as
+    conexões novas (as demais requisições reaproveitaram o pool) por UF.
+    """
+    atual = cliente()
+    resposta, primeiro_byte = atual.get(url, (TIMEOUT_CONEXAO, timeout_leitura))
+    metricas.HTTP_PRIMEIRO_BYTE.observar(primeiro_byte, uf=uf)
+    novas = atual.conexoes_novas(url)
+    if novas:
+        metricas.HTTP_CONEXOES.inc(novas, uf=uf)
+    return resposta
+
+def fechar():
+    """Fecha a sessão e as conexões do pool (a próxima chamada cria outra)."""
+    global _cliente
+    with _lock:
+        if _cliente is not None:
+            _cliente.fechar()
+            _cliente = None
@@ -1,15 +1,35 @@
-from app import db, create_app
-from app.models import Imovel, Atualizacao
-from sqlalchemy import func
-import pandas as pd
+from app import db, create_app, analise, cache, historico, identidade, metricas
+from app.models import Imovel, Atualizacao, ChaveExecucao, Execucao, HistoricoAlteracao, PaginaPendente
+from app.models import BAIRRO_NORMALIZADO, CIDADE_NORMALIZADA, converter_data
+from flask import has_app_context
+from sqlalchemy import UnaryExpression, and_, delete, exists, func, insert, literal, or_, select, update
+from sqlalchemy.sql import operators
+from collections import Counter
+from contextlib import nullcontext
 import logging
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
 
 logging.basicConfig(level=logging.INFO)
 
+# pandas e o scraper (requests/BeautifulSoup) só são importados nas funções que
+# os usam, para não pesar na inicialização do dashboard.
+_app = None
+
+def _contexto():
+    """
+    App context para as consultas: reaproveita o da requisição/tarefa atual ou,
+    fora de um, um app criado uma única vez por processo.
+    """
+    global _app
+    if has_app_context():
+        return nullcontext()
+    if _app is None:
+        _app = create_app()
+    return _app.app_context()
+
 def get_summary_stats():
-    app = create_app()
-    with app.app_context():
+    with _contexto():
         total_imoveis = db.session.query(Imovel).count()
         novos_imoveis = db.session.query(Imovel).filter(Imovel.Status == 'Novo').count()
         atualizados = db.session.query(Imovel).filter(Imovel.Status == 'Atualizado').count()
@@ -30,15 +50,16 @@ def get_summary_stats():
         }
 
 def get_uf_summary():
-    app = create_app()
-    with app.app_context():
+    with _contexto():
+        # Lido só do índice (UF, Status), já agrupado por UF; a ordem por total
+        # (poucas linhas) fica para o Python, sem B-tree temporária no SQLite.
         query = db.session.query(
             Imovel.UF,
-            db.func.count(Imovel.MATRICULA).label('Total'),
+            db.func.count().label('Total'),
             db.func.sum(db.case((Imovel.Status == 'Novo', 1), else_=0)).label('Novos'),
             db.func.sum(db.case((Imovel.Status == 'Atualizado', 1), else_=0)).label('Atualizados'),
             db.func.sum(db.case((Imovel.Status == 'Expirado', 1), else_=0)).label('Expirados')
-        ).group_by(Imovel.UF).order_by(db.desc('Total'))
+        ).group_by(Imovel.UF)
 
         resultado = []
         for row in query.all():
@@ -49,140 +70,496 @@ def get_uf_summary():
                 'Atualizados': row.Atualizados or 0,
                 'Expirados': row.Expirados or 0
             })
+        resultado.sort(key=lambda r: r['Total'], reverse=True)
         return resultado
 
-def process_scraped_data(data):
-    app = create_app()
-    with app.app_context():
+def _sincronizar_paginas_pendentes(ufs, pendentes):
+    """
+    Atualiza a fila de páginas de detalhe a repetir: entra quem falhou nesta
+    execução e sai quem foi lido com sucesso ou deixou de estar na lista.
+    """
+    existentes = {(p.UF, p.MATRICULA): p for p in PaginaPendente.query.filter(PaginaPendente.UF.in_(ufs))}
+    for chave, pendente in existentes.items():
+        if chave not in pendentes:
+            db.session.delete(pendente)
+    for chave, dados in pendentes.items():
+        pendente = existentes.get(chave)
+        if pendente is None:
+            db.session.add(PaginaPendente(tentativas=1, **dados))
+        else:
+            pendente.tentativas += 1
+            pendente.LINK = dados['LINK']
+            pendente.MODALIDADE = dados['MODALIDADE']
+            pendente.ultimo_erro = dados['ultimo_erro']
+    if pendentes:
+        logging.info(f"{len(pendentes)} páginas de detalhe com falha foram agendadas para nova tentativa.")
+
+# Linhas por lote quando process_scraped_data recebe a lista inteira de uma vez.
+TAMANHO_LOTE_SINCRONIZACAO = 500
+
+class Sincronizacao:
+    """
+    Sincronização de uma raspagem em lotes. Cada lote é gravado e confirmado
+    assim que chega, junto com as chaves vistas (tabela chaves_execucao);
+    finalizar() expira quem não apareceu direto no banco. Memória e tempo de
+    commit não dependem do tamanho da tabela. Precisa de app context do início
+    ao fim.
+    """
+
+    def __init__(self, ufs, origem='raspagem'):
+        self.ufs = sorted({str(uf) for uf in ufs if uf})
+        self.origem = origem
+        self.inicio = time.perf_counter()
+        self.contagem = Counter()
+        self.paginas_pendentes = {}
+        self.linhas_recebidas = 0
+
+        logging.info(f"Iniciando processamento para os estados: {self.ufs}")
+        Atualizacao.query.filter(Atualizacao.UF.in_(self.ufs)).delete(synchronize_session=False)
+        _limpar_chaves_abandonadas()
+        self.execucao_id = historico.iniciar_execucao(origem, self.ufs)
+        db.session.commit()
+
+    def processar_lote(self, data):
+        """Grava um lote de linhas raspadas (novas e alteradas) e faz commit."""
+        import pandas as pd
+        from app import scraper
+
         if not data:
-            logging.warning("Nenhum dado recebido para processamento.")
             return
-
+        self.linhas_recebidas += len(data)
         df_novos = pd.DataFrame(data)
-        if df_novos.empty:
-            logging.info("DataFrame de novos imóveis está vazio. Nenhum dado para processar.")
-            return
-
         df_novos.drop_duplicates(subset=['MATRICULA'], keep='last', inplace=True)
         df_novos = df_novos.where(pd.notnull(df_novos), None)
-
-        ufs_processados = df_novos['UF'].unique().tolist()
-        logging.info(f"Iniciando processamento para os estados: {ufs_processados}")
-
-        if not ufs_processados:
-            return
-
-        imoveis_db_list = Imovel.query.filter(Imovel.UF.in_(ufs_processados)).all()
-        imoveis_db_dict = {(imovel.UF, imovel.MATRICULA): imovel for imovel in imoveis_db_list}
-
-        Atualizacao.query.filter(Atualizacao.UF.in_(ufs_processados)).delete(synchronize_session=False)
-        db.session.commit()
-
-        chaves_processadas = set()
-
-        for _, row in df_novos.iterrows():
-            imovel_dict = row.to_dict()
+        linhas = df_novos.to_dict('records')
+        del df_novos
+
+        for linha in linhas:
+            # Lotes que não vieram do scraper (ex.: benchmarks) podem não trazer as chaves secundárias.
+            if not linha.get('NUMERO_CAIXA'):
+                linha['NUMERO_CAIXA'] = identidade.numero_caixa(linha.get('LINK'))
+            if not linha.get('CHAVE_ENDERECO'):
+                linha['CHAVE_ENDERECO'] = identidade.chave_endereco(linha.get('ENDERECO'))
+
+        ufs_lote = {str(linha.get('UF')) for linha in linhas}
+        matriculas_lote = {str(linha.get('MATRICULA')) for linha in linhas}
+        imoveis_db_dict = {
+            (imovel.UF, imovel.MATRICULA): imovel
+            for imovel in Imovel.query.filter(Imovel.UF.in_(ufs_lote), Imovel.MATRICULA.in_(matriculas_lote))
+        }
+        faltantes = [l for l in linhas if (str(l.get('UF')), str(l.get('MATRICULA'))) not in imoveis_db_dict]
+        equivalencias = self._indice_equivalencia(faltantes)
+
+        for imovel_dict in linhas:
+            uf, matricula = str(imovel_dict.get('UF')), str(imovel_dict.get('MATRICULA'))
+            if (uf, matricula) not in imoveis_db_dict and equivalencias is not None:
+                # Chave nova para um imóvel já conhecido (página de detalhe não lida,
+                # endereço reescrito, planilha com outra chave): usa a chave gravada.
+                equivalente = equivalencias.buscar(
+                    uf, imovel_dict.get('NUMERO_CAIXA'), imovel_dict.get('CIDADE'), imovel_dict.get('CHAVE_ENDERECO')
+                )
+                if equivalente is not None:
+                    imovel_dict['MATRICULA'] = equivalente.MATRICULA
+                    imoveis_db_dict.setdefault((uf, equivalente.MATRICULA), equivalente)
+
+        # Chaves que lotes anteriores desta execução já gravaram.
+        chaves_vistas = self._chaves_ja_vistas({str(l.get('MATRICULA')) for l in linhas})
+        chaves_novas = []
+
+        alteracoes_historico = []
+        novos = []
+        _abrir_transacao()
+        for imovel_dict in linhas:
+            falha_detalhe = imovel_dict.pop('FALHA_DETALHE', None)
+            if not isinstance(falha_detalhe, str):
+                falha_detalhe = None
             matricula = str(imovel_dict.get('MATRICULA'))
             uf = str(imovel_dict.get('UF'))
+            campos_ignorados = ()
+
+            if falha_detalhe:
+                # Sem a página de detalhe, os campos dela são só os padrões do CSV:
+                # mantém o que já está no banco.
+                campos_ignorados = scraper.campos_da_pagina(imovel_dict.get('MODALIDADE'))
+
             chave_composta = (uf, matricula)
 
-            if not matricula or not uf or chave_composta in chaves_processadas:
+            if not matricula or not uf or chave_composta in chaves_vistas:
                 continue
 
-            chaves_processadas.add(chave_composta)
+            chaves_vistas.add(chave_composta)
+            chaves_novas.append({'execucao_id': self.execucao_id, 'UF': uf, 'MATRICULA': matricula})
+            if falha_detalhe and imovel_dict.get('LINK'):
+                self.paginas_pendentes[chave_composta] = {
+                    'UF': uf, 'MATRICULA': matricula, 'LINK': imovel_dict['LINK'],
+                    'MODALIDADE': imovel_dict.get('MODALIDADE'), 'ultimo_erro': str(falha_detalhe)[:500]
+                }
             imovel_existente = imoveis_db_dict.get(chave_composta)
             changed_fields = []
             change_type = None
-            final_status = None
 
             if imovel_existente:
                 for key, new_value in imovel_dict.items():
-                    if hasattr(imovel_existente, key) and key not in ['MATRICULA', 'UF', 'updated_at', 'Status']:
+                    if key in identidade.COLUNAS:
+                        # Chaves secundárias não são mudança do imóvel: só completa as que faltam.
+                        if new_value and getattr(imovel_existente, key) != new_value:
+                            setattr(imovel_existente, key, new_value)
+                        continue
+                    if key in scraper.CAMPOS_LEILAO:
+                        # Detalhe das rodadas: a mudança visível já aparece em PRECO e DATA_DISPUTA.
+                        if key not in campos_ignorados and getattr(imovel_existente, key) != new_value:
+                            setattr(imovel_existente, key, new_value)
+                        continue
+                    if (hasattr(imovel_existente, key) and key not in ['MATRICULA', 'UF', 'updated_at', 'Status']
+                            and key not in campos_ignorados):
                         old_value = getattr(imovel_existente, key)
                         if str(old_value) != str(new_value):
                             changed_fields.append(key)
+                            historico.registrar(alteracoes_historico, uf, matricula, key, old_value, new_value)
                             setattr(imovel_existente, key, new_value)
 
                 if changed_fields:
                     final_status = 'Atualizado'
                     change_type = 'Atualizado'
                 else:
-                    if imovel_existente.Status == 'Atualizado':
-                        final_status = 'Existente'
-                    elif imovel_existente.Status == 'Novo':
-                        final_status = 'Existente'
-                    else:
-                        final_status = 'Existente'
+                    final_status = 'Existente'
 
+                historico.registrar(alteracoes_historico, uf, matricula, 'Status', imovel_existente.Status, final_status)
                 imovel_existente.Status = final_status
 
-                if chave_composta in imoveis_db_dict:
-                    imoveis_db_dict.pop(chave_composta)
-
             else:
-                imovel_existente_check = db.session.query(Imovel).filter_by(UF=uf, MATRICULA=matricula).first()
-                if not imovel_existente_check:
-                    imovel_novo_dict = {k: v for k, v in imovel_dict.items() if hasattr(Imovel, k)}
-                    imovel_novo_dict['Status'] = 'Novo'
-
-                    try:
-                        novo_imovel = Imovel(**imovel_novo_dict)
-                        db.session.add(novo_imovel)
-                        db.session.flush()
-                        change_type = 'Novo'
-                        final_status = 'Novo'
-                    except Exception as e:
-                        logging.warning(f"Erro ao inserir imóvel {uf}-{matricula}: {e}")
-                        db.session.rollback()
-                        continue
-                else:
-                    for key, new_value in imovel_dict.items():
-                        if hasattr(imovel_existente_check, key) and key not in ['MATRICULA', 'UF', 'updated_at', 'Status']:
-                            old_value = getattr(imovel_existente_check, key)
-                            if str(old_value) != str(new_value):
-                                changed_fields.append(key)
-                                setattr(imovel_existente_check, key, new_value)
-
-                    if changed_fields:
-                        imovel_existente_check.Status = 'Atualizado'
-                        change_type = 'Atualizado'
-                    else:
-                        imovel_existente_check.Status = 'Existente'
-
-            if change_type:
-                atualizacao_dados = {
-                    k: imovel_dict.get(k) for k in ['MATRICULA', 'UF', 'TIPO', 'CIDADE', 'PRECO', 'LINK']
-                    if k in imovel_dict
-                }
-                atualizacao_dados['Change'] = change_type
-                atualizacao_dados['ChangedFields'] = ",".join(changed_fields) if changed_fields else ""
+                imovel_novo_dict = {k: v for k, v in imovel_dict.items() if hasattr(Imovel, k)}
+                imovel_novo_dict['Status'] = 'Novo'
+                novos.append((chave_composta, imovel_novo_dict, imovel_dict))
+                continue
 
-                existing_update = Atualizacao.query.filter_by(UF=uf, MATRICULA=matricula).first()
-                if existing_update:
-                    for key, value in atualizacao_dados.items():
-                        setattr(existing_update, key, value)
-                else:
-                    db.session.add(Atualizacao(**atualizacao_dados))
+            self._registrar_resultado(uf, change_type, imovel_dict, changed_fields)
 
-        if imoveis_db_dict:
-            chaves_expiradas = list(imoveis_db_dict.keys())
-            logging.info(f"Marcando {len(chaves_expiradas)} imóveis como expirados.")
+        inseridos, falhas = self._inserir_novos(novos)
+        for (uf, matricula), imovel_novo_dict, imovel_dict in inseridos:
+            historico.registrar(alteracoes_historico, uf, matricula, 'Status', None, 'Novo')
+            historico.registrar(alteracoes_historico, uf, matricula, 'PRECO', None, imovel_novo_dict.get('PRECO'))
+            self._registrar_resultado(uf, 'Novo', imovel_dict)
+        if falhas:
+            # Não gravados: nem chave vista, nem página pendente.
+            nao_gravados = {chave for chave, _, _ in falhas}
+            chaves_novas = [c for c in chaves_novas if (c['UF'], c['MATRICULA']) not in nao_gravados]
+            for chave in nao_gravados:
+                self.paginas_pendentes.pop(chave, None)
 
-            for (uf, matricula), imovel in imoveis_db_dict.items():
-                imovel.Status = 'Expirado'
+        try:
+            db.session.flush()
+            if chaves_novas:
+                db.session.execute(insert(ChaveExecucao).prefix_with('OR IGNORE'), chaves_novas)
+            historico.gravar(self.execucao_id, alteracoes_historico)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Erro ao salvar lote: {e}")
+            raise
 
+    def _registrar_resultado(self, uf, change_type, imovel_dict, changed_fields=()):
+        self.contagem[(uf, {'Novo': 'nova', 'Atualizado': 'atualizada'}.get(change_type, 'inalterada'))] += 1
+        if change_type:
+            atualizacao_dados = {
+                k: imovel_dict.get(k) for k in ['MATRICULA', 'UF', 'TIPO', 'CIDADE', 'PRECO', 'LINK']
+                if k in imovel_dict
+            }
+            atualizacao_dados['Change'] = change_type
+            atualizacao_dados['ChangedFields'] = ",".join(changed_fields) if changed_fields else ""
+            # As atualizações das UFs foram apagadas em __init__ e cada chave só
+            # passa uma vez por execução: não há registro anterior a procurar.
+            db.session.add(Atualizacao(**atualizacao_dados))
+
+    def _inserir_novos(self, novos):
+        """
+        INSERT dos imóveis novos do lote, todos juntos. Cada tentativa roda em
+        um SAVEPOINT: se alguma linha é recusada, só ela fica de fora (as demais
+        são inseridas uma a uma) e o resto do lote segue. Devolve (inseridos, falhas).
+        """
+        if not novos:
+            return [], []
+        # Alterações pendentes dos imóveis existentes vão antes, fora dos SAVEPOINTs.
+        db.session.flush()
+        try:
+            with db.session.begin_nested():
+                db.session.add_all([Imovel(**imovel_novo_dict) for _, imovel_novo_dict, _ in novos])
+            return novos, []
+        except Exception:
+            pass
+        inseridos, falhas = [], []
+        for novo in novos:
+            (uf, matricula), imovel_novo_dict, _ = novo
+            try:
+                with db.session.begin_nested():
+                    db.session.add(Imovel(**imovel_novo_dict))
+                inseridos.append(novo)
+            except Exception as e:
+                logging.warning(f"Erro ao inserir imóvel {uf}-{matricula}: {e}")
+                falhas.append(novo)
+        return inseridos, falhas
+
+    def _chaves_ja_vistas(self, matriculas):
+        if not matriculas:
+            return set()
+        consulta = db.session.query(ChaveExecucao.UF, ChaveExecucao.MATRICULA).filter(
+            ChaveExecucao.execucao_id == self.execucao_id, ChaveExecucao.MATRICULA.in_(matriculas)
+        )
+        return {(uf, matricula) for uf, matricula in consulta}
+
+    def marcar_inalterados(self, uf, numeros_caixa):
+        """
+        Dá como vistos, sem passar por processar_lote, os imóveis ativos de 'uf'
+        cuja linha do CSV não mudou desde a última raspagem (ver app/retrato.py):
+        entram em chaves_execucao e passam a Existente, como um lote sem
+        alterações faria. Devolve quantos foram marcados.
+        """
+        tabela = Imovel.__table__
+        numeros = sorted({str(n) for n in numeros_caixa if n})
+        marcados = 0
+        for inicio in range(0, len(numeros), TAMANHO_LOTE_SINCRONIZACAO):
+            filtro = and_(
+                tabela.c.UF == uf, tabela.c.NUMERO_CAIXA.in_(numeros[inicio:inicio + TAMANHO_LOTE_SINCRONIZACAO]),
+                tabela.c.Status != 'Expirado',
+                ~exists().where(
+                    ChaveExecucao.execucao_id == self.execucao_id,
+                    ChaveExecucao.UF == tabela.c.UF, ChaveExecucao.MATRICULA == tabela.c.MATRICULA,
+                )
+            )
+            db.session.execute(update(tabela).where(filtro, tabela.c.Status != 'Existente').values(Status='Existente'))
+            resultado = db.session.execute(insert(ChaveExecucao).prefix_with('OR IGNORE').from_select(
+                ['execucao_id', 'UF', 'MATRICULA'],
+                select(literal(self.execucao_id), tabela.c.UF, tabela.c.MATRICULA).where(filtro)
+            ))
+            marcados += resultado.rowcount
+        db.session.commit()
+        self.contagem[(uf, 'inalterada')] += marcados
+        return marcados
+
+    def _indice_equivalencia(self, linhas):
+        numeros = {l['NUMERO_CAIXA'] for l in linhas if l.get('NUMERO_CAIXA')}
+        chaves = {l['CHAVE_ENDERECO'] for l in linhas if l.get('CHAVE_ENDERECO')}
+        condicoes = []
+        if numeros:
+            condicoes.append(Imovel.NUMERO_CAIXA.in_(numeros))
+        if chaves:
+            condicoes.append(Imovel.CHAVE_ENDERECO.in_(chaves))
+        if not condicoes:
+            return None
+        return identidade.IndiceEquivalencia(Imovel.query.filter(Imovel.UF.in_(self.ufs), db.or_(*condicoes)))
+
+    def _expirar_ausentes(self):
+        """
+        Marca como Expirado, em três comandos sobre o banco, os imóveis das UFs
+        que não estão em chaves_execucao: contagem por UF, histórico
+        (Status -> Expirado) e o UPDATE.
+        """
+        tabela = Imovel.__table__
+        ausente = and_(
+            tabela.c.UF.in_(self.ufs), tabela.c.Status != 'Expirado',
+            ~exists().where(
+                ChaveExecucao.execucao_id == self.execucao_id,
+                ChaveExecucao.UF == tabela.c.UF, ChaveExecucao.MATRICULA == tabela.c.MATRICULA,
+            )
+        )
+        por_uf = db.session.execute(
+            select(tabela.c.UF, func.count()).where(ausente).group_by(tabela.c.UF)
+        ).all()
+        total = sum(n for _, n in por_uf)
+        if not total:
+            return
+        logging.info(f"Marcando {total} imóveis como expirados.")
+        for uf, n in por_uf:
+            self.contagem[(uf, 'expirada')] += n
+        colunas = ['UF', 'MATRICULA', 'execucao_id', 'campo', 'valor_antigo', 'valor_novo']
+        db.session.execute(insert(HistoricoAlteracao).from_select(colunas, select(
+            tabela.c.UF, tabela.c.MATRICULA, literal(self.execucao_id), literal('Status'),
+            tabela.c.Status, literal('Expirado')
+        ).where(ausente)))
+        db.session.execute(update(tabela).where(ausente).values(Status='Expirado'))
+
+    def finalizar(self):
+        """
+        Expira os imóveis das UFs que não vieram em nenhum lote, atualiza a fila
+        de páginas pendentes, fecha a execução e devolve o id dela.
+        """
         try:
+            self._expirar_ausentes()
+            _sincronizar_paginas_pendentes(self.ufs, self.paginas_pendentes)
+            db.session.execute(delete(ChaveExecucao).where(ChaveExecucao.execucao_id == self.execucao_id))
             db.session.flush()
+            duracao = time.perf_counter() - self.inicio
+            por_resultado = Counter()
+            for (_, resultado), n in self.contagem.items():
+                por_resultado[resultado] += n
+            gravadas = sum(n for resultado, n in por_resultado.items() if resultado != 'expirada')
+            historico.finalizar_execucao(self.execucao_id, {
+                'sincronizacao_segundos': round(duracao, 3),
+                'linhas_sincronizadas': gravadas,
+                'linhas_por_segundo': round(gravadas / duracao, 2) if duracao else None,
+                'resultado_linhas': dict(por_resultado),
+                'paginas_pendentes': len(self.paginas_pendentes),
+            })
+            historico.compactar()
+            analise.recalcular(self.ufs)
+            from app import buscas_salvas
+            buscas_salvas.atualizar(self.execucao_id)
+            cache.incrementar_versao()
             db.session.commit()
-            logging.info(f"Processamento concluído para os estados: {ufs_processados}")
+            for (uf, resultado), n in self.contagem.items():
+                metricas.LINHAS_SINCRONIZADAS.inc(n, origem=self.origem, uf=uf, resultado=resultado)
+            metricas.SYNC_SEGUNDOS.observar(duracao, origem=self.origem)
+            logging.info(f"Processamento concluído para os estados: {self.ufs}")
+            return self.execucao_id
         except Exception as e:
             db.session.rollback()
             logging.error(f"Erro ao salvar dados: {e}")
             raise
 
+def _abrir_transacao():
+    """
+    BEGIN explícito, se a sessão ainda não abriu transação no SQLite. O pysqlite
+    só faz BEGIN antes de INSERT/UPDATE/DELETE: um SAVEPOINT emitido antes disso
+    vira a própria transação, e o RELEASE dele já grava no banco.
+    """
+    conexao = db.session.connection()
+    if not conexao.connection.dbapi_connection.in_transaction:
+        conexao.exec_driver_sql('BEGIN')
+
+def _limpar_chaves_abandonadas(horas=24):
+    """Chaves de execuções já encerradas ou interrompidas há mais de 'horas' (ex.: processo morto)."""
+    corte = datetime.utcnow() - timedelta(hours=horas)
+    antigas = select(Execucao.id).where(or_(Execucao.finalizado_em.isnot(None), Execucao.iniciado_em < corte))
+    db.session.execute(delete(ChaveExecucao).where(ChaveExecucao.execucao_id.in_(antigas)))
+
+def process_scraped_data(data):
+    """Sincroniza de uma vez uma lista de linhas raspadas e devolve o id da execução criada."""
+    with _contexto():
+        if not data:
+            logging.warning("Nenhum dado recebido para processamento.")
+            return
+
+        # A última ocorrência de cada chave vence, como no drop_duplicates de cada lote.
+        data = list({str(linha.get('MATRICULA')): linha for linha in data}.values())
+        ufs = {linha.get('UF') for linha in data if linha.get('UF')}
+        if not ufs:
+            return
+
+        sincronizacao = Sincronizacao(ufs)
+        for inicio in range(0, len(data), TAMANHO_LOTE_SINCRONIZACAO):
+            sincronizacao.processar_lote(data[inicio:inicio + TAMANHO_LOTE_SINCRONIZACAO])
+        return sincronizacao.finalizar()
+
+def _sem_indice(coluna):
+    """'+coluna': mesmo valor, mas o SQLite deixa de considerar índices dessa coluna."""
+    return UnaryExpression(coluna, operator=operators.custom_op('+'))
+
+# Filtros de texto de /api/data: parâmetro -> coluna comparada sem caixa/espaços.
+# UF (já gravada em maiúsculas), cidade e bairro usam as formas que os índices
+# cobrem (ver models).
+FILTROS_TEXTO = {
+    'uf': Imovel.UF,
+    'cidade': CIDADE_NORMALIZADA,
+    'bairro': BAIRRO_NORMALIZADO,
+    'tipo': func.upper(func.trim(Imovel.TIPO)),
+    'modalidade': func.upper(func.trim(Imovel.MODALIDADE)),
+    'fgts': func.upper(func.trim(Imovel.FGTS)),
+    'financiamento': func.upper(func.trim(Imovel.FINANCIAMENTO)),
+}
+FILTROS_STATUS = {
+    'Ativos': analise.STATUS_ATIVOS,
+    'Apenas Novos': ['Novo'],
+    'Apenas Atualizados': ['Atualizado'],
+    'Expirado': ['Expirado'],
+}
+
+def filtros_imoveis(args, paginando=False):
+    """
+    Condições de /api/data a partir dos parâmetros da requisição ('args':
+    status, textos, preço e datas). Com 'paginando' o Status vai sem índice:
+    a página ordenada percorre o índice de preço até completar o limite, em
+    vez de buscar todos os ativos e ordená-los; a contagem usa o de Status.
+    """
+    filtros = []
+    status = FILTROS_STATUS.get(args.get('status', '').strip())
+    if status:
+        coluna_status = _sem_indice(Imovel.Status) if paginando else Imovel.Status
+        filtros.append(coluna_status.in_(status))
+
+    for param, coluna in FILTROS_TEXTO.items():
+        valor = args.get(param, '').strip()
+        if valor:
+            filtros.append(coluna == valor.upper())
+
+    try:
+        preco_min = args.get('preco_min', '').strip()
+        if preco_min:
+            filtros.append(Imovel.PRECO >= float(preco_min))
+    except (ValueError, TypeError):
+        pass
+    try:
+        preco_max = args.get('preco_max', '').strip()
+        if preco_max:
+            filtros.append(Imovel.PRECO <= float(preco_max))
+    except (ValueError, TypeError):
+        pass
+
+    # Datas 'aaaa-mm-dd' (input date) ou 'dd/mm/aaaa', comparadas na coluna indexada.
+    data_inicio = converter_data(args.get('data_inicio', ''))
+    data_fim = converter_data(args.get('data_fim', ''))
+    if data_inicio:
+        filtros.append(Imovel.DATA_DISPUTA_DT >= data_inicio)
+    if data_fim:
+        filtros.append(Imovel.DATA_DISPUTA_DT <= data_fim)
+    return filtros
+
+COLUNAS_AGENDA = ['MATRICULA', 'CIDADE', 'BAIRRO', 'TIPO', 'MODALIDADE', 'PRECO', 'DESCONTO',
+                  'DATA_LEILAO_1', 'PRECO_LEILAO_1', 'DATA_LEILAO_2', 'PRECO_LEILAO_2', 'LINK']
+
+def get_agenda(inicio, fim, uf=None, detalhes=False, limite=500):
+    """
+    Disputas de imóveis ativos entre as datas 'inicio' e 'fim' (inclusive),
+    agrupadas por dia e UF. As contagens saem só do índice
+    ix_imoveis_data_disputa; com 'detalhes', cada grupo traz também os imóveis
+    (até 'limite' no total, mais baratos primeiro).
+    """
+    with _contexto():
+        # Sem ANALYZE o SQLite prefere os índices de Status ou UF (igualdade) ao de
+        # datas, mas o intervalo de poucos dias é sempre o filtro mais seletivo.
+        filtros = [Imovel.DATA_DISPUTA_DT.between(inicio, fim), _sem_indice(Imovel.Status).in_(analise.STATUS_ATIVOS)]
+        if uf:
+            filtros.append(_sem_indice(Imovel.UF) == uf.upper())
+
+        dias = {}
+        grupos = {}
+        contagens = db.session.query(Imovel.DATA_DISPUTA_DT, Imovel.UF, func.count()).filter(*filtros).group_by(
+            Imovel.DATA_DISPUTA_DT, Imovel.UF
+        ).order_by(Imovel.DATA_DISPUTA_DT, Imovel.UF)
+        for dia, uf_grupo, quantidade in contagens:
+            registro_dia = dias.setdefault(dia, {'data': dia.isoformat(), 'total': 0, 'ufs': []})
+            registro_dia['total'] += quantidade
+            grupo = {'UF': uf_grupo, 'quantidade': quantidade}
+            if detalhes:
+                grupo['imoveis'] = []
+            registro_dia['ufs'].append(grupo)
+            grupos[(dia, uf_grupo)] = grupo
+
+        if detalhes and grupos:
+            colunas = [getattr(Imovel, coluna) for coluna in COLUNAS_AGENDA]
+            linhas = db.session.query(Imovel.DATA_DISPUTA_DT, Imovel.UF, *colunas).filter(*filtros).order_by(
+                Imovel.DATA_DISPUTA_DT, Imovel.UF, Imovel.PRECO
+            ).limit(limite)
+            for dia, uf_grupo, *valores in linhas:
+                grupos[(dia, uf_grupo)]['imoveis'].append(dict(zip(COLUNAS_AGENDA, valores)))
+
+        return {
+            'inicio': inicio.isoformat(), 'fim': fim.isoformat(),
+            'total': sum(d['total'] for d in dias.values()),
+            'dias': list(dias.values()),
+        }
+
 def get_imoveis_agrupados_por_bairro():
-    app = create_app()
-    with app.app_context():
+    with _contexto():
         imoveis = Imovel.query.filter(
             Imovel.Status.in_(['Novo', 'Existente', 'Atualizado'])
         ).order_by(Imovel.UF, Imovel.CIDADE, Imovel.BAIRRO, Imovel.PRECO).all()
@@ -215,28 +592,60 @@ def get_imoveis_agrupados_por_bairro():
 
         return resultado_final
 
-def get_filter_options():
-    app = create_app()
-    with app.app_context():
-        normalized_city = func.upper(func.trim(Imovel.CIDADE))
-        cidades_query = db.session.query(normalized_city).distinct().filter(
-            Imovel.CIDADE.isnot(None) & (func.trim(Imovel.CIDADE) != '')
-        ).order_by(normalized_city)
+def _distintos(expressao, *filtros):
+    """
+    Valores distintos, não nulos e não vazios de 'expressao', em ordem. Em vez
+    de DISTINCT, que percorre o índice inteiro, salta de um valor ao seguinte
+    (min(expressao) > anterior) numa CTE recursiva: uma busca no índice por
+    valor. Exige um índice que comece pelos 'filtros' de igualdade e, em
+    seguida, pela 'expressao'.
+    """
+    valores = select(func.min(expressao).label('valor')).where(expressao > '', *filtros).cte('valores', recursive=True)
+    seguinte = select(func.min(expressao)).where(expressao > valores.c.valor, *filtros).scalar_subquery()
+    valores = valores.union_all(select(seguinte).where(valores.c.valor.isnot(None)))
+    return list(db.session.scalars(select(valores.c.valor).where(valores.c.valor.isnot(None))))
 
+def get_filter_options():
+    with _contexto():
         return {
-            'ufs': [r[0] for r in db.session.query(Imovel.UF).distinct().order_by(Imovel.UF).all() if r[0]],
-            'cidades': [r[0] for r in cidades_query.all()],
-            'tipos': [r[0] for r in db.session.query(Imovel.TIPO).distinct().order_by(Imovel.TIPO).all() if r[0]],
-            'modalidades': [r[0] for r in db.session.query(Imovel.MODALIDADE).distinct().order_by(Imovel.MODALIDADE).all() if r[0]]
+            'ufs': _distintos(Imovel.UF),
+            'cidades': _distintos(CIDADE_NORMALIZADA),
+            'tipos': _distintos(Imovel.TIPO),
+            'modalidades': _distintos(Imovel.MODALIDADE),
         }
 
-def get_imoveis_abaixo_de_100k(filtros=None):
+def get_faixa_preco():
+    """Menor e maior preço positivos; cada um é uma ponta do índice ix_imoveis_preco."""
+    with _contexto():
+        minimo = db.session.query(func.min(Imovel.PRECO)).filter(Imovel.PRECO > 0).scalar()
+        maximo = db.session.query(func.max(Imovel.PRECO)).filter(Imovel.PRECO > 0).scalar()
+        return minimo, maximo
+
+def get_cidades_por_uf(uf):
+    """Cidades (normalizadas) de uma UF, pelo índice ix_imoveis_uf_cidade_bairro."""
+    with _contexto():
+        return _distintos(CIDADE_NORMALIZADA, Imovel.UF == uf.upper())
+
+def get_bairros_por_cidade(cidade=None, uf=None):
+    """Bairros (normalizados), opcionalmente de uma cidade e/ou UF."""
+    with _contexto():
+        if cidade and uf:
+            # O caso do dashboard (cidade escolhida depois da UF), coberto pelo índice.
+            return _distintos(BAIRRO_NORMALIZADO, Imovel.UF == uf.upper(), CIDADE_NORMALIZADA == cidade.upper())
+        query = db.session.query(BAIRRO_NORMALIZADO).distinct().filter(BAIRRO_NORMALIZADO != '')
+        if cidade:
+            query = query.filter(CIDADE_NORMALIZADA == cidade.upper())
+        if uf:
+            query = query.filter(Imovel.UF == uf.upper())
+        return [r[0] for r in query.order_by(BAIRRO_NORMALIZADO).all()]
+
+def get_imoveis_abaixo_de_100k(filtros=None, limite=None):
     """
     Busca imóveis com preço abaixo de 100k, aplicando filtros dinâmicos.
-    'filtros' é um dicionário com os critérios de busca.
+    'filtros' é um dicionário com os critérios de busca; 'limite' devolve só
+    os mais baratos.
     """
-    app = create_app()
-    with app.app_context():
+    with _contexto():
         query = Imovel.query.filter(
             Imovel.PRECO < 100000,
             Imovel.Status.in_(['Novo', 'Existente', 'Atualizado'])
@@ -268,17 +677,19 @@ def get_imoveis_abaixo_de_100k(filtros=None):
                 elif status == 'Expirado':
                     query = query.filter(Imovel.Status == 'Expirado')
 
-        imoveis = query.order_by(Imovel.PRECO.asc()).all()
-        return [imovel.to_dict() for imovel in imoveis]
+        query = query.order_by(Imovel.PRECO.asc())
+        if limite:
+            query = query.limit(limite)
+        return [imovel.to_dict() for imovel in query]
 
 def get_distinct_ufs_from_db():
-    app = create_app()
-    with app.app_context():
-        return [uf[0] for uf in db.session.query(Imovel.UF).distinct().order_by(Imovel.UF).all() if uf[0]]
+    with _contexto():
+        return _distintos(Imovel.UF)
 
 def get_imoveis_for_export(estados=[]):
-    app = create_app()
-    with app.app_context():
+    import pandas as pd
+
+    with _contexto():
         try:
             query = Imovel.query
 
@@ -327,14 +738,77 @@ def get_imoveis_for_export(estados=[]):
             colunas = [c.name for c in Imovel.__table__.columns if c.name != 'updated_at']
             return pd.DataFrame(columns=colunas)
 
+# Abas de resumo da exportação: nome da aba -> colunas de agrupamento.
+RESUMOS_EXPORTACAO = {
+    'Resumo por UF': ('UF',),
+    'Resumo por cidade': ('UF', 'CIDADE'),
+    'Resumo por tipo': ('TIPO',),
+}
+
+def _mediana(valor, posicao, quantidade):
+    """Agregado da mediana a partir de row_number()/count() sobre a mesma partição (SQLite não tem MEDIAN)."""
+    meio = db.or_(posicao == (quantidade + 1) // 2, posicao == (quantidade + 2) // 2)
+    return func.avg(db.case((meio, valor)))
+
+def _resumo_exportacao(chaves, estados):
+    texto_desconto = func.replace(func.replace(func.trim(Imovel.DESCONTO), '%', ''), ',', '.')
+    preco = db.case((Imovel.PRECO > 0, Imovel.PRECO))
+    desconto = db.case((texto_desconto.op('GLOB')('[0-9]*'), db.cast(texto_desconto, db.Float)))
+    # Cidade normalizada como nos filtros do dashboard ('Sao Paulo ' == 'SAO PAULO').
+    particao = [func.upper(func.trim(Imovel.CIDADE)) if chave == 'CIDADE' else func.trim(getattr(Imovel, chave)) for chave in chaves]
+    grupos = [expressao.label(chave) for expressao, chave in zip(particao, chaves)]
+
+    filtros = [Imovel.Status.in_(analise.STATUS_ATIVOS)]
+    if estados:
+        filtros.append(Imovel.UF.in_(estados))
+    # Nulos por último na ordenação, para que as posições de 1 a count() sejam os valores válidos.
+    base = select(
+        *grupos, preco.label('preco'), desconto.label('desconto'),
+        func.row_number().over(partition_by=particao, order_by=(preco.is_(None), preco)).label('pos_preco'),
+        func.count(preco).over(partition_by=particao).label('n_preco'),
+        func.row_number().over(partition_by=particao, order_by=(desconto.is_(None), desconto)).label('pos_desconto'),
+        func.count(desconto).over(partition_by=particao).label('n_desconto'),
+    ).where(*filtros).subquery()
+
+    colunas_grupo = [base.c[chave] for chave in chaves]
+    consulta = select(
+        *colunas_grupo,
+        func.count().label('Imóveis'),
+        func.min(base.c.preco).label('Preço mínimo'),
+        _mediana(base.c.preco, base.c.pos_preco, base.c.n_preco).label('Preço mediano'),
+        func.avg(base.c.preco).label('Preço médio'),
+        _mediana(base.c.desconto, base.c.pos_desconto, base.c.n_desconto).label('Desconto mediano (%)'),
+        func.avg(base.c.desconto).label('Desconto médio (%)'),
+    ).group_by(*colunas_grupo)
+    if chaves == ('TIPO',):
+        consulta = consulta.order_by(db.desc('Imóveis'))
+    else:
+        consulta = consulta.order_by(*colunas_grupo)
+    return consulta
+
+def get_resumos_exportacao(estados=[]):
+    """
+    Abas de resumo da exportação (quantidade, preço e desconto por UF, cidade e
+    tipo dos imóveis ativos), agregadas no banco. Devolve {nome da aba: DataFrame}.
+    """
+    import pandas as pd
+
+    estados = [uf.strip().upper() for uf in estados if uf.strip()]
+    with _contexto():
+        resumos = {}
+        for aba, chaves in RESUMOS_EXPORTACAO.items():
+            resultado = db.session.execute(_resumo_exportacao(chaves, estados))
+            df = pd.DataFrame(resultado.all(), columns=list(resultado.keys()))
+            resumos[aba] = df.round(2)
+        return resumos
+
 # --- NOVAS FUNÇÕES ADICIONADAS ---
 def get_comparable_locations():
     """
     Retorna um dicionário estruturado de UFs, cidades e bairros que possuem
     mais de um imóvel, ideal para os filtros da página de comparação.
     """
-    app = create_app()
-    with app.app_context():
+    with _contexto():
         subquery = db.session.query(
             Imovel.UF,
             Imovel.CIDADE,
@@ -372,8 +846,7 @@ def get_baratos_locations():
     Retorna um dicionário estruturado de UFs, cidades e bairros
     para imóveis com preço abaixo de 100k.
     """
-    app = create_app()
-    with app.app_context():
+    with _contexto():
         query = db.session.query(
             Imovel.UF,
             Imovel.CIDADE,
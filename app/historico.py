@@ -0,0 +1,175 @@
+from app import db
+from app.models import Execucao, HistoricoAlteracao, Imovel
+from flask import current_app
+from sqlalchemy import Float, cast, func, insert, text
+from datetime import datetime, timedelta
+import json
+import logging
+
+# Campos cuja evolução interessa para análise de tendência. O restante do
+# cadastro (endereço, links, etc.) continua só no diff da última execução.
+CAMPOS_HISTORICO = ['PRECO', 'AVALIACAO', 'DESCONTO', 'DATA_DISPUTA', 'MODALIDADE', 'Status']
+
+RETENCAO_PADRAO_DIAS = 365
+# valor_novo de Status quando o imóvel é apagado (mescla de duplicados): é o
+# registro que /api/changes emite como remoção.
+STATUS_REMOVIDO = 'Removido'
+
+def _valor_texto(valor):
+    if valor is None:
+        return None
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return str(valor)
+
+def iniciar_execucao(origem, ufs):
+    """Cria o registro da execução e devolve seu id (precisa de app context)."""
+    execucao = Execucao(origem=origem, UFs=",".join(sorted(ufs)))
+    db.session.add(execucao)
+    db.session.flush()
+    return execucao.id
+
+def finalizar_execucao(execucao_id, resumo=None):
+    execucao = db.session.get(Execucao, execucao_id)
+    if execucao:
+        execucao.finalizado_em = datetime.utcnow()
+        if resumo:
+            salvar_resumo(execucao_id, resumo)
+
+def salvar_resumo(execucao_id, resumo):
+    """Mescla 'resumo' às métricas já gravadas da execução (não faz commit)."""
+    execucao = db.session.get(Execucao, execucao_id)
+    if execucao is None:
+        return
+    atual = json.loads(execucao.resumo) if execucao.resumo else {}
+    atual.update(resumo)
+    execucao.resumo = json.dumps(atual)
+
+def registrar(alteracoes, uf, matricula, campo, valor_antigo, valor_novo):
+    """Acumula uma mudança em 'alteracoes' se o campo for rastreado e o valor mudou."""
+    if campo not in CAMPOS_HISTORICO:
+        return
+    antigo, novo = _valor_texto(valor_antigo), _valor_texto(valor_novo)
+    if antigo == novo:
+        return
+    if campo == 'Status' and 'Expirado' not in (antigo, novo) and novo != STATUS_REMOVIDO and antigo is not None:
+        # Novo -> Existente -> Atualizado é ruído de execução, não mudança do imóvel.
+        return
+    alteracoes.append({
+        'UF': uf, 'MATRICULA': matricula, 'campo': campo,
+        'valor_antigo': antigo, 'valor_novo': novo
+    })
+
+def gravar(execucao_id, alteracoes):
+    """Insere em lote as mudanças acumuladas de uma execução."""
+    if not alteracoes:
+        return
+    for alteracao in alteracoes:
+        alteracao['execucao_id'] = execucao_id
+    db.session.execute(insert(HistoricoAlteracao), alteracoes)
+    logging.info(f"{len(alteracoes)} alterações registradas no histórico (execução {execucao_id}).")
+
+def compactar(dias=None):
+    """
+    Política de retenção: mudanças de execuções mais antigas que 'dias' são
+    descartadas, mantendo apenas a última de cada (imóvel, campo) como base
+    para a linha do tempo. Retorna o número de linhas removidas.
+    """
+    if dias is None:
+        dias = current_app.config.get('HISTORICO_RETENCAO_DIAS', RETENCAO_PADRAO_DIAS)
+    corte = datetime.utcnow() - timedelta(days=dias)
+    resultado = db.session.execute(text("""
+        DELETE FROM historico_alteracoes
+        WHERE execucao_id IN (SELECT id FROM execucoes WHERE iniciado_em < :corte)
+          AND id NOT IN (
+              SELECT MAX(h.id) FROM historico_alteracoes h
+              JOIN execucoes e ON e.id = h.execucao_id
+              WHERE e.iniciado_em < :corte
+              GROUP BY h.UF, h.MATRICULA, h.campo
+          )
+    """), {'corte': corte})
+    if resultado.rowcount:
+        logging.info(f"Histórico compactado: {resultado.rowcount} registros antigos removidos.")
+    return resultado.rowcount
+
+def get_linha_do_tempo(uf, matricula):
+    """Todas as mudanças registradas de um imóvel, da mais antiga para a mais recente."""
+    query = db.session.query(HistoricoAlteracao, Execucao.iniciado_em).join(
+        Execucao, Execucao.id == HistoricoAlteracao.execucao_id
+    ).filter(
+        HistoricoAlteracao.UF == uf,
+        HistoricoAlteracao.MATRICULA == matricula
+    ).order_by(HistoricoAlteracao.id)
+
+    resultado = []
+    for alteracao, data in query.all():
+        item = alteracao.to_dict()
+        item['data'] = data.isoformat() if data else None
+        resultado.append(item)
+    return resultado
+
+def remocoes_desde(desde, uf=None):
+    """
+    Imóveis apagados por execuções finalizadas a partir de 'desde', como
+    tuplas (UF, MATRICULA, finalizado_em), das mais antigas para as mais recentes.
+    """
+    # Pelas execuções do período (poucas) e o índice (campo, execucao_id), sem
+    # percorrer todo o histórico de Status.
+    execucoes = db.session.query(Execucao.id).filter(Execucao.finalizado_em >= desde)
+    query = db.session.query(HistoricoAlteracao.UF, HistoricoAlteracao.MATRICULA, Execucao.finalizado_em).join(
+        Execucao, Execucao.id == HistoricoAlteracao.execucao_id
+    ).filter(
+        HistoricoAlteracao.campo == 'Status',
+        HistoricoAlteracao.execucao_id.in_(execucoes.scalar_subquery()),
+        HistoricoAlteracao.valor_novo == STATUS_REMOVIDO,
+    )
+    if uf:
+        query = query.filter(HistoricoAlteracao.UF == uf.upper())
+    return query.order_by(Execucao.finalizado_em, HistoricoAlteracao.id).all()
+
+def get_quedas_preco(uf=None, dias=30, limite=200):
+    """Reduções de preço das execuções dos últimos 'dias', maiores quedas primeiro."""
+    corte = datetime.utcnow() - timedelta(days=dias)
+    preco_antigo = cast(HistoricoAlteracao.valor_antigo, Float)
+    preco_novo = cast(HistoricoAlteracao.valor_novo, Float)
+    queda = (preco_antigo - preco_novo) / preco_antigo
+
+    query = db.session.query(
+        HistoricoAlteracao.UF,
+        HistoricoAlteracao.MATRICULA,
+        Execucao.iniciado_em,
+        preco_antigo.label('preco_antigo'),
+        preco_novo.label('preco_novo'),
+        queda.label('queda'),
+        Imovel.CIDADE,
+        Imovel.BAIRRO,
+        Imovel.TIPO,
+        Imovel.LINK,
+        Imovel.Status
+    ).join(
+        Execucao, Execucao.id == HistoricoAlteracao.execucao_id
+    ).join(
+        Imovel, db.and_(Imovel.UF == HistoricoAlteracao.UF, Imovel.MATRICULA == HistoricoAlteracao.MATRICULA)
+    ).filter(
+        HistoricoAlteracao.campo == 'PRECO',
+        HistoricoAlteracao.valor_antigo.isnot(None),
+        Execucao.iniciado_em >= corte,
+        preco_antigo > 0,
+        preco_novo < preco_antigo
+    )
+    if uf:
+        query = query.filter(HistoricoAlteracao.UF == uf.upper())
+
+    return [{
+        'UF': row.UF,
+        'MATRICULA': row.MATRICULA,
+        'data': row.iniciado_em.isoformat() if row.iniciado_em else None,
+        'preco_antigo': row.preco_antigo,
+        'preco_novo': row.preco_novo,
+        'queda_percentual': round((row.queda or 0) * 100, 2),
+        'CIDADE': row.CIDADE or '',
+        'BAIRRO': row.BAIRRO or '',
+        'TIPO': row.TIPO or '',
+        'LINK': row.LINK or '',
+        'Status': row.Status or ''
+    } for row in query.order_by(func.coalesce(queda, 0).desc()).limit(limite).all()]
@@ -0,0 +1,196 @@
+from functools import lru_cache
+import logging
+import re
+import unidecode
+
+# Identidade dos imóveis, compartilhada pela raspagem (scraper) e pela
+# importação de planilhas (converter).
+#
+# MATRICULA (chave) = UF + matrícula + 3 iniciais do endereço. Ela muda quando
+# a página de detalhe não é lida (fica o número do imóvel no lugar da
+# matrícula) ou quando a planilha já traz a chave composta, então duas outras
+# chaves ajudam a reconhecer o mesmo imóvel:
+#   NUMERO_CAIXA    número do imóvel na Caixa (hdnimovel do link), estável;
+#   CHAVE_ENDERECO  endereço normalizado (sem acento, pontuação, tipo de
+#                   logradouro e preposições), para planilhas sem link.
+TAMANHO_CACHE = 65536
+COLUNAS = ('NUMERO_CAIXA', 'CHAVE_ENDERECO')
+
+TIPOS_LOGRADOURO = {
+    'R', 'RUA', 'AV', 'AVENIDA', 'AL', 'ALAMEDA', 'TV', 'TRAV', 'TRAVESSA', 'EST', 'ESTR', 'ESTRADA',
+    'ROD', 'RODOVIA', 'PC', 'PCA', 'PRACA', 'LG', 'LARGO', 'VL', 'VIELA', 'BC', 'BECO', 'Q', 'QD', 'QUADRA',
+    'LT', 'LOTE', 'N', 'NO', 'NUM', 'NUMERO', 'SN', 'APTO', 'APT', 'AP', 'APARTAMENTO', 'BL', 'BLOCO',
+    'CS', 'CASA', 'LJ', 'LOJA', 'SL', 'SALA', 'UNID', 'UNIDADE', 'CONJ', 'CONJUNTO', 'COND', 'CONDOMINIO',
+}
+PALAVRAS_VAZIAS = {'DE', 'DA', 'DO', 'DAS', 'DOS', 'E'}
+
+_RE_NUMERO_LINK = re.compile(r'hdnimovel=(\d+)', re.IGNORECASE)
+
+@lru_cache(maxsize=TAMANHO_CACHE)
+def _palavras(endereco):
+    return re.sub(r'[^A-Z0-9\s]', ' ', unidecode.unidecode(endereco).upper()).split()
+
+def iniciais_endereco(endereco):
+    """As 3 primeiras iniciais do endereço em maiúsculas, ignorando acentos, números e símbolos."""
+    if not isinstance(endereco, str) or not endereco.strip():
+        return ''
+    return _iniciais(endereco)
+
+@lru_cache(maxsize=TAMANHO_CACHE)
+def _iniciais(endereco):
+    # Mesma regra da versão original: dígitos somem antes de separar as palavras.
+    letras = re.sub(r'[^A-Z\s]', '', unidecode.unidecode(endereco).upper())
+    return ''.join(palavra[0] for palavra in letras.split()[:3])
+
+def chave_endereco(endereco):
+    """Endereço normalizado para comparar variações de escrita ('R. São João, 10' == 'RUA SAO JOAO N 10')."""
+    if not isinstance(endereco, str) or not endereco.strip():
+        return None
+    palavras = [p for p in _palavras(endereco) if p not in TIPOS_LOGRADOURO and p not in PALAVRAS_VAZIAS]
+    # Zeros à esquerda e o "0" de "N. 0" não distinguem imóveis.
+    palavras = [p.lstrip('0') if p.isdigit() else p for p in palavras]
+    return ' '.join(p for p in palavras if p) or None
+
+def numero_caixa(link, numero=None):
+    """Número do imóvel na Caixa, tirado do link da página de detalhe ou, sem ele, de 'numero'."""
+    if isinstance(link, str):
+        encontrado = _RE_NUMERO_LINK.search(link)
+        if encontrado:
+            return encontrado.group(1)
+    if numero is not None:
+        digitos = re.sub(r'\D', '', str(numero))
+        return digitos or None
+    return None
+
+def gerar_id(uf, matricula, endereco):
+    """Chave composta UF + matrícula + iniciais do endereço."""
+    matricula = str(matricula).strip() if matricula is not None else ''
+    return f"{str(uf).strip().upper()}{matricula}{iniciais_endereco(endereco)}"
+
+def gerar_ids(ufs, matriculas, enderecos):
+    """
+    gerar_id vetorizado sobre Series do pandas. As iniciais são calculadas uma
+    vez por endereço distinto (e memorizadas entre chamadas).
+    """
+    ufs = ufs.astype('string').str.strip().str.upper().fillna('')
+    matriculas = matriculas.astype('string').str.strip().fillna('')
+    distintos = enderecos.dropna().unique()
+    iniciais = enderecos.map({e: iniciais_endereco(e) for e in distintos}).fillna('')
+    return (ufs + matriculas + iniciais.astype('string')).astype(object)
+
+def chaves_endereco(enderecos):
+    """chave_endereco vetorizado: uma chamada por endereço distinto."""
+    distintos = enderecos.dropna().unique()
+    return enderecos.map({e: chave_endereco(e) for e in distintos})
+
+def numeros_caixa(links):
+    """numero_caixa vetorizado sobre a coluna LINK."""
+    return links.astype('string').str.extract(_RE_NUMERO_LINK, expand=False).astype(object)
+
+class IndiceEquivalencia:
+    """
+    Localiza, entre imóveis já conhecidos, o equivalente a uma linha nova cuja
+    chave não foi encontrada: primeiro pelo número da Caixa; sem ele, pelo
+    endereço normalizado na mesma cidade, desde que só um imóvel corresponda
+    e os números da Caixa (quando os dois têm) não sejam diferentes.
+    """
+
+    def __init__(self, imoveis=()):
+        self.por_numero = {}
+        self.por_endereco = {}
+        for imovel in imoveis:
+            self.adicionar(imovel)
+
+    @staticmethod
+    def _chave_local(uf, cidade, chave):
+        return (uf, str(cidade or '').strip().upper(), chave)
+
+    def adicionar(self, imovel):
+        if imovel.NUMERO_CAIXA:
+            self.por_numero.setdefault((imovel.UF, imovel.NUMERO_CAIXA), imovel)
+        if imovel.CHAVE_ENDERECO:
+            self.por_endereco.setdefault(self._chave_local(imovel.UF, imovel.CIDADE, imovel.CHAVE_ENDERECO), []).append(imovel)
+
+    def buscar(self, uf, numero=None, cidade=None, chave=None):
+        if numero:
+            encontrado = self.por_numero.get((uf, numero))
+            if encontrado is not None:
+                return encontrado
+        if chave:
+            candidatos = self.por_endereco.get(self._chave_local(uf, cidade, chave), [])
+            if len(candidatos) == 1 and not (numero and candidatos[0].NUMERO_CAIXA and candidatos[0].NUMERO_CAIXA != numero):
+                return candidatos[0]
+        return None
+
+def preencher_colunas(conn):
+    """Calcula NUMERO_CAIXA e CHAVE_ENDERECO dos imóveis gravados antes dessas colunas existirem."""
+    from sqlalchemy import text
+
+    linhas = conn.execute(text(
+        'SELECT rowid, LINK, ENDERECO FROM imoveis WHERE NUMERO_CAIXA IS NULL AND CHAVE_ENDERECO IS NULL'
+    )).all()
+    valores = [
+        {'id': rowid, 'numero': numero_caixa(link), 'chave': chave_endereco(endereco)}
+        for rowid, link, endereco in linhas
+    ]
+    if valores:
+        conn.execute(text('UPDATE imoveis SET NUMERO_CAIXA = :numero, CHAVE_ENDERECO = :chave WHERE rowid = :id'), valores)
+        logging.info(f"Identidade preenchida para {len(valores)} imóveis existentes.")
+
+def _grupos_duplicados():
+    """Listas de imóveis que são o mesmo: mesmo (UF, NUMERO_CAIXA), ou o endereço quando um deles não tem número."""
+    from app.models import Imovel
+
+    grupos = {}
+    for imovel in Imovel.query.filter(Imovel.NUMERO_CAIXA.isnot(None)):
+        grupos.setdefault((imovel.UF, imovel.NUMERO_CAIXA), []).append(imovel)
+    sem_numero = Imovel.query.filter(Imovel.NUMERO_CAIXA.is_(None), Imovel.CHAVE_ENDERECO.isnot(None)).all()
+    if sem_numero:
+        indice = IndiceEquivalencia(imovel for grupo in grupos.values() for imovel in grupo)
+        for imovel in sem_numero:
+            equivalente = indice.buscar(imovel.UF, cidade=imovel.CIDADE, chave=imovel.CHAVE_ENDERECO)
+            if equivalente is not None:
+                grupos[(equivalente.UF, equivalente.NUMERO_CAIXA)].append(imovel)
+    return [grupo for grupo in grupos.values() if len(grupo) > 1]
+
+def contar_duplicatas():
+    """Quantos imóveis mesclar_duplicatas removeria, sem alterar nada. Precisa de app context."""
+    return sum(len(grupo) - 1 for grupo in _grupos_duplicados())
+
+def mesclar_duplicatas():
+    """
+    Une imóveis gravados em duplicidade (ver _grupos_duplicados). Mantém o
+    registro ativo atualizado mais recentemente, leva o histórico dos demais
+    para ele e os remove, junto com os resultados de buscas salvas deles (o
+    principal já é avaliado pelos próprios dados). Cada remoção fica no
+    histórico (Status -> Removido, execução 'deduplicacao') para /api/changes
+    avisar os clientes. Precisa de app context; não faz commit. Só roda por
+    `python -m app.cli deduplicar`: a equivalência por endereço é heurística.
+    """
+    from app import db, historico
+    from app.models import Atualizacao, HistoricoAlteracao, PaginaPendente, ResultadoBusca
+
+    ativos = {'Novo', 'Existente', 'Atualizado'}
+    grupos = _grupos_duplicados()
+    if not grupos:
+        return 0
+    execucao_id = historico.iniciar_execucao('deduplicacao', {grupo[0].UF for grupo in grupos})
+    alteracoes = []
+    removidos = 0
+    for grupo in grupos:
+        grupo.sort(key=lambda i: (i.Status in ativos, i.updated_at is not None, i.updated_at or 0), reverse=True)
+        principal, duplicatas = grupo[0], grupo[1:]
+        for duplicata in duplicatas:
+            chave = {'UF': duplicata.UF, 'MATRICULA': duplicata.MATRICULA}
+            HistoricoAlteracao.query.filter_by(**chave).update({'MATRICULA': principal.MATRICULA}, synchronize_session=False)
+            Atualizacao.query.filter_by(**chave).delete(synchronize_session=False)
+            PaginaPendente.query.filter_by(**chave).delete(synchronize_session=False)
+            ResultadoBusca.query.filter_by(**chave).delete(synchronize_session=False)
+            historico.registrar(alteracoes, duplicata.UF, duplicata.MATRICULA, 'Status', duplicata.Status, historico.STATUS_REMOVIDO)
+            logging.info(f"Imóvel {duplicata.UF}-{duplicata.MATRICULA} mesclado em {principal.MATRICULA}.")
+            db.session.delete(duplicata)
+            removidos += 1
+    # Depois de levar o histórico das duplicatas: a remoção fica na chave apagada.
+    historico.gravar(execucao_id, alteracoes)
+    historico.finalizar_execucao(execucao_id, {'removidos': removidos})
+    return removidos
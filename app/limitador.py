@@ -0,0 +1,130 @@
+import threading
+import time
+from app import metricas
+
+# Controle de ritmo das requisições ao site da Caixa, no lugar dos sleeps fixos.
+# O limitador ajusta a taxa por AIMD: sobe aos poucos enquanto as respostas vêm
+# rápidas e corta pela metade em 429/503/timeout ou latência alta. O disjuntor
+# suspende as requisições quando o site está fora do ar, em vez de acumular falhas.
+
+class LimitadorAdaptativo:
+    """Taxa compartilhada entre threads (requisições/s), ajustada por AIMD."""
+
+    def __init__(self, taxa_inicial=5.0, taxa_minima=0.5, taxa_maxima=50.0, incremento=0.5,
+                 fator_reducao=0.5, latencia_alvo=3.0, nome='caixa'):
+        self.taxa = taxa_inicial
+        self.taxa_minima = taxa_minima
+        self.taxa_maxima = taxa_maxima
+        self.incremento = incremento
+        self.fator_reducao = fator_reducao
+        self.latencia_alvo = latencia_alvo
+        self.nome = nome
+        self._proximo_horario = 0.0
+        self._pausado_ate = 0.0
+        self._ultima_reducao = 0.0
+        self._lock = threading.Lock()
+        metricas.LIMITADOR_TAXA.definir(self.taxa, limitador=nome)
+
+    def aguardar_vez(self):
+        """Bloqueia até o horário reservado para a próxima requisição desta thread."""
+        with self._lock:
+            agora = time.monotonic()
+            horario = max(agora, self._proximo_horario, self._pausado_ate)
+            self._proximo_horario = horario + 1.0 / self.taxa
+        if horario > agora:
+            time.sleep(horario - agora)
+
+    def registrar_sucesso(self, latencia):
+        if latencia > self.latencia_alvo:
+            self.reduzir()
+            return
+        with self._lock:
+            self.taxa = min(self.taxa_maxima, self.taxa + self.incremento)
+            metricas.LIMITADOR_TAXA.definir(self.taxa, limitador=self.nome)
+
+    def reduzir(self, pausa=None):
+        """
+        Corte multiplicativo da taxa. Falhas simultâneas de várias threads contam
+        como um único sinal: só há um corte por intervalo entre requisições.
+        'pausa' (ex.: Retry-After) suspende novas requisições por esse tempo.
+        """
+        with self._lock:
+            agora = time.monotonic()
+            if pausa:
+                self._pausado_ate = max(self._pausado_ate, agora + pausa)
+            if agora - self._ultima_reducao < 1.0 / self.taxa:
+                return
+            self._ultima_reducao = agora
+            self.taxa = max(self.taxa_minima, self.taxa * self.fator_reducao)
+            metricas.LIMITADOR_TAXA.definir(self.taxa, limitador=self.nome)
+        metricas.LIMITADOR_REDUCOES.inc(limitador=self.nome)
+
+class CircuitoAberto(Exception):
+    """O disjuntor continua aberto após a espera máxima."""
+
+class Disjuntor:
+    """
+    Abre após 'limiar_falhas' falhas seguidas e suspende as requisições por
+    'pausa' segundos; depois deixa passar uma requisição de teste. Se ela
+    falhar, reabre com a pausa dobrada (até 'pausa_maxima').
+    """
+
+    def __init__(self, limiar_falhas=8, pausa=30.0, pausa_maxima=300.0, nome='caixa'):
+        self.limiar_falhas = limiar_falhas
+        self.pausa_base = pausa
+        self.pausa_maxima = pausa_maxima
+        self.nome = nome
+        self.estado = 'fechado'
+        self._pausa = pausa
+        self._falhas_seguidas = 0
+        self._reabre_em = 0.0
+        self._teste_em_andamento = False
+        self._cond = threading.Condition()
+
+    def aguardar(self, espera_maxima=None):
+        """
+        Bloqueia enquanto o circuito estiver aberto. Lança CircuitoAberto se
+        'espera_maxima' segundos se passarem sem liberação.
+        """
+        limite = time.monotonic() + espera_maxima if espera_maxima is not None else None
+        with self._cond:
+            while True:
+                agora = time.monotonic()
+                if self.estado == 'fechado':
+                    return
+                if self.estado == 'aberto' and agora >= self._reabre_em:
+                    self.estado = 'meio_aberto'
+                if self.estado == 'meio_aberto' and not self._teste_em_andamento:
+                    self._teste_em_andamento = True
+                    return
+                if limite is not None and agora >= limite:
+                    raise CircuitoAberto(f"Site indisponível: circuito '{self.nome}' aberto.")
+                espera = max(0.05, self._reabre_em - agora) if self.estado == 'aberto' else 1.0
+                if limite is not None:
+                    espera = min(espera, max(0.05, limite - agora))
+                self._cond.wait(espera)
+
+    def registrar_sucesso(self):
+        with self._cond:
+            self._falhas_seguidas = 0
+            if self.estado != 'fechado':
+                self.estado = 'fechado'
+                self._pausa = self.pausa_base
+                self._teste_em_andamento = False
+                self._cond.notify_all()
+
+    def registrar_falha(self):
+        with self._cond:
+            self._falhas_seguidas += 1
+            if self.estado == 'meio_aberto':
+                self._pausa = min(self.pausa_maxima, self._pausa * 2)
+                self._abrir()
+            elif self.estado == 'fechado' and self._falhas_seguidas >= self.limiar_falhas:
+                self._abrir()
+
+    def _abrir(self):
+        self.estado = 'aberto'
+        self._teste_em_andamento = False
+        self._reabre_em = time.monotonic() + self._pausa
+        metricas.DISJUNTOR_ABERTURAS.inc(disjuntor=self.nome)
+        self._cond.notify_all()
@@ -0,0 +1,225 @@
+from collections import deque
+from contextlib import contextmanager
+import bisect
+import threading
+import time
+
+# Registro de métricas em memória (por processo), exportado em /metrics no
+# formato texto do Prometheus. As métricas do pipeline levam o rótulo 'uf', o
+# que permite montar o resumo de uma execução pela diferença entre dois retratos.
+
+AMOSTRAS_POR_SERIE = 5000
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+_lock = threading.Lock()
+_registro = {}
+
+def _chave_rotulos(rotulos):
+    return tuple(sorted((k, str(v)) for k, v in rotulos.items()))
+
+def _formatar_rotulos(chave, extra=None):
+    pares = list(chave) + (extra or [])
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in pares) + '}'
+
+class Contador:
+    tipo = 'counter'
+
+    def __init__(self, nome, ajuda):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.valores = {}
+
+    def inc(self, valor=1, **rotulos):
+        chave = _chave_rotulos(rotulos)
+        with _lock:
+            self.valores[chave] = self.valores.get(chave, 0) + valor
+
+    def valor(self, **rotulos):
+        with _lock:
+            return self.valores.get(_chave_rotulos(rotulos), 0)
+
+    def exportar(self):
+        linhas = []
+        for chave, valor in sorted(self.valores.items()):
+            linhas.append(f'{self.nome}{_formatar_rotulos(chave)} {valor}')
+        return linhas
+
+class Medidor(Contador):
+    tipo = 'gauge'
+
+    def definir(self, valor, **rotulos):
+        chave = _chave_rotulos(rotulos)
+        with _lock:
+            self.valores[chave] = valor
+
+class _SerieHistograma:
+    def __init__(self, n_buckets):
+        self.buckets = [0] * n_buckets
+        self.contagem = 0
+        self.soma = 0.0
+        self.amostras = deque(maxlen=AMOSTRAS_POR_SERIE)
+
+class Histograma:
+    tipo = 'histogram'
+
+    def __init__(self, nome, ajuda, buckets):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.limites = list(buckets)
+        self.series = {}
+
+    def observar(self, valor, **rotulos):
+        chave = _chave_rotulos(rotulos)
+        with _lock:
+            serie = self.series.get(chave)
+            if serie is None:
+                serie = self.series[chave] = _SerieHistograma(len(self.limites))
+            indice = bisect.bisect_left(self.limites, valor)
+            if indice < len(self.limites):
+                serie.buckets[indice] += 1
+            serie.contagem += 1
+            serie.soma += valor
+            serie.amostras.append(valor)
+
+    @contextmanager
+    def cronometrar(self, fator=1.0, **rotulos):
+        """Observa a duração do bloco (em segundos * fator)."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar((time.perf_counter() - inicio) * fator, **rotulos)
+
+    def estado(self, **rotulos):
+        """(contagem, soma) atuais da série."""
+        with _lock:
+            serie = self.series.get(_chave_rotulos(rotulos))
+            return (serie.contagem, serie.soma) if serie else (0, 0.0)
+
+    def amostras_desde(self, contagem_anterior, **rotulos):
+        """Amostras observadas depois de 'contagem_anterior' (limitadas à janela guardada)."""
+        with _lock:
+            serie = self.series.get(_chave_rotulos(rotulos))
+            if serie is None:
+                return []
+            novas = min(serie.contagem - contagem_anterior, len(serie.amostras))
+            return list(serie.amostras)[-novas:] if novas > 0 else []
+
+    def exportar(self):
+        linhas = []
+        for chave, serie in sorted(self.series.items()):
+            acumulado = 0
+            for limite, quantidade in zip(self.limites, serie.buckets):
+                acumulado += quantidade
+                linhas.append(f'{self.nome}_bucket{_formatar_rotulos(chave, [("le", limite)])} {acumulado}')
+            linhas.append(f'{self.nome}_bucket{_formatar_rotulos(chave, [("le", "+Inf")])} {serie.contagem}')
+            linhas.append(f'{self.nome}_sum{_formatar_rotulos(chave)} {serie.soma}')
+            linhas.append(f'{self.nome}_count{_formatar_rotulos(chave)} {serie.contagem}')
+        return linhas
+
+def contador(nome, ajuda):
+    with _lock:
+        return _registro.setdefault(nome, Contador(nome, ajuda))
+
+def medidor(nome, ajuda):
+    with _lock:
+        return _registro.setdefault(nome, Medidor(nome, ajuda))
+
+def histograma(nome, ajuda, buckets=BUCKETS_SEGUNDOS):
+    with _lock:
+        return _registro.setdefault(nome, Histograma(nome, ajuda, buckets))
+
+def percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, max(0, int(round(p / 100 * (len(ordenados) - 1)))))
+    return ordenados[indice]
+
+def exportar_prometheus():
+    with _lock:
+        metricas = list(_registro.values())
+        blocos = []
+        for metrica in sorted(metricas, key=lambda m: m.nome):
+            blocos.append(f'# HELP {metrica.nome} {metrica.ajuda}')
+            blocos.append(f'# TYPE {metrica.nome} {metrica.tipo}')
+            blocos.extend(metrica.exportar())
+    return '\n'.join(blocos) + '\n'
+
+# --- Métricas do pipeline ---
+
+DOWNLOAD_BYTES = contador('caixa_download_bytes_total', 'Bytes baixados das listas CSV da Caixa.')
+DOWNLOAD_SEGUNDOS = histograma('caixa_download_seconds', 'Duração do download da lista CSV de um estado.')
+PAGINAS = contador('caixa_paginas_total', 'Páginas de detalhe buscadas, por resultado.')
+PAGINA_BYTES = contador('caixa_pagina_bytes_total', 'Bytes recebidos das páginas de detalhe.')
+PAGINA_SEGUNDOS = histograma('caixa_pagina_fetch_seconds', 'Tempo de resposta das páginas de detalhe.')
+HTTP_PRIMEIRO_BYTE = histograma('caixa_http_primeiro_byte_seconds', 'Tempo até os cabeçalhos da resposta da Caixa (inclui conexão/TLS quando ela é nova).')
+HTTP_CONEXOES = contador('caixa_http_conexoes_total', 'Conexões abertas com a Caixa; as demais requisições reaproveitam o pool.')
+PARSE_MS = histograma('caixa_pagina_parse_ms', 'Tempo de parsing HTML de uma página de detalhe (ms).', BUCKETS_MS)
+ETAPA_SEGUNDOS = histograma('pipeline_etapa_seconds', 'Duração de cada etapa do pipeline por estado.')
+LINHAS_SINCRONIZADAS = contador('sync_linhas_total', 'Linhas gravadas no banco, por origem e resultado.')
+SYNC_SEGUNDOS = histograma('sync_seconds', 'Duração de uma sincronização com o banco.')
+TENTATIVAS_REPETIDAS = contador('caixa_tentativas_repetidas_total', 'Requisições repetidas após 429/5xx/timeout.')
+LIMITADOR_TAXA = medidor('caixa_limitador_taxa', 'Taxa atual (requisições/s) do limitador adaptativo.')
+LIMITADOR_REDUCOES = contador('caixa_limitador_reducoes_total', 'Cortes multiplicativos da taxa do limitador.')
+DISJUNTOR_ABERTURAS = contador('caixa_disjuntor_aberturas_total', 'Vezes em que o disjuntor abriu.')
+CACHE_RESPOSTAS = contador('cache_respostas_total', 'Consultas ao cache de respostas, por resultado.')
+
+def retrato(uf):
+    """Estado atual das métricas de uma UF, para calcular o resumo de uma execução."""
+    return {
+        'download_bytes': DOWNLOAD_BYTES.valor(uf=uf),
+        'paginas_ok': PAGINAS.valor(uf=uf, resultado='ok'),
+        'paginas_erro': PAGINAS.valor(uf=uf, resultado='erro'),
+        'pagina_bytes': PAGINA_BYTES.valor(uf=uf),
+        'parse_contagem': PARSE_MS.estado(uf=uf)[0],
+        'fetch_contagem': PAGINA_SEGUNDOS.estado(uf=uf)[0],
+        'primeiro_byte_contagem': HTTP_PRIMEIRO_BYTE.estado(uf=uf)[0],
+        'conexoes': HTTP_CONEXOES.valor(uf=uf),
+        'linhas': sum(LINHAS_SINCRONIZADAS.valor(origem='raspagem', uf=uf, resultado=r)
+                      for r in ('nova', 'atualizada', 'inalterada')),
+    }
+
+def resumo_execucao(uf, inicial, etapas):
+    """
+    Resumo de uma execução a partir do retrato inicial e das durações das
+    etapas (em segundos). É o que fica gravado em Execucao.resumo.
+    """
+    final = retrato(uf)
+    delta = {k: final[k] - inicial.get(k, 0) for k in final}
+    parse_ms = PARSE_MS.amostras_desde(inicial.get('parse_contagem', 0), uf=uf)
+    fetch_s = PAGINA_SEGUNDOS.amostras_desde(inicial.get('fetch_contagem', 0), uf=uf)
+    primeiro_byte_s = HTTP_PRIMEIRO_BYTE.amostras_desde(inicial.get('primeiro_byte_contagem', 0), uf=uf)
+    paginas = delta['paginas_ok'] + delta['paginas_erro']
+    raspagem_s = etapas.get('raspagem', 0)
+    sincronizacao_s = etapas.get('sincronizacao', 0)
+
+    def arredondar(valor, casas=2):
+        return round(valor, casas) if valor is not None else None
+
+    return {
+        'uf': uf,
+        'etapas_segundos': {k: arredondar(v, 3) for k, v in etapas.items()},
+        'download_bytes': delta['download_bytes'],
+        'paginas': paginas,
+        'paginas_erro': delta['paginas_erro'],
+        'paginas_por_segundo': arredondar(paginas / raspagem_s) if raspagem_s else None,
+        'pagina_bytes': delta['pagina_bytes'],
+        'fetch_ms_p50': arredondar(percentil(fetch_s, 50) * 1000) if fetch_s else None,
+        'fetch_ms_p95': arredondar(percentil(fetch_s, 95) * 1000) if fetch_s else None,
+        'primeiro_byte_ms_p50': arredondar(percentil(primeiro_byte_s, 50) * 1000) if primeiro_byte_s else None,
+        'conexoes_abertas': delta['conexoes'],
+        'parse_ms_p50': arredondar(percentil(parse_ms, 50)),
+        'parse_ms_p95': arredondar(percentil(parse_ms, 95)),
+        'linhas_sincronizadas': delta['linhas'],
+        'linhas_por_segundo': arredondar(delta['linhas'] / sincronizacao_s) if sincronizacao_s else None,
+        'cache_hit_rate': taxa_acerto_cache(),
+    }
+
+def taxa_acerto_cache():
+    acertos = CACHE_RESPOSTAS.valor(resultado='hit') + CACHE_RESPOSTAS.valor(resultado='not_modified')
+    total = acertos + CACHE_RESPOSTAS.valor(resultado='miss')
+    return round(acertos / total, 4) if total else None
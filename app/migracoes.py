@@ -0,0 +1,178 @@
+from sqlalchemy import inspect, text
+import logging
+
+# Índice textual (FTS5) sobre os campos de endereço e a descrição do CSV.
+# É uma tabela de "conteúdo externo": os textos ficam só em `imoveis` e os
+# gatilhos abaixo mantêm o índice sincronizado com qualquer INSERT/UPDATE/DELETE.
+# O índice aponta para o rowid de `imoveis`, que não é estável: a chave é
+# composta (UF, MATRICULA) e o VACUUM pode renumerar o rowid. Por isso o VACUUM
+# só deve ser feito por compactar(), que reconstrói o índice em seguida.
+FTS_TABELA = 'imoveis_fts'
+FTS_COLUNAS = ['ENDERECO', 'BAIRRO', 'CIDADE', 'DESCRICAO']
+
+# Versão do esquema gravada em PRAGMA user_version. Incrementar sempre que um
+# modelo ganhar tabela, coluna ou índice: só então a migração roda de novo.
+ESQUEMA_VERSAO = 9
+# Índices de versões anteriores que hoje são prefixo de outro e só custariam escrita.
+INDICES_SUBSTITUIDOS = ['ix_imoveis_Status']
+
+def _adicionar_colunas_faltantes(conn, metadata):
+    """Adiciona colunas novas dos modelos em tabelas que já existiam no banco."""
+    inspetor = inspect(conn)
+    tabelas_existentes = set(inspetor.get_table_names())
+    for tabela in metadata.sorted_tables:
+        if tabela.name not in tabelas_existentes:
+            continue
+        colunas_existentes = {c['name'] for c in inspetor.get_columns(tabela.name)}
+        for coluna in tabela.columns:
+            if coluna.name in colunas_existentes:
+                continue
+            tipo = coluna.type.compile(dialect=conn.dialect)
+            conn.execute(text(f'ALTER TABLE "{tabela.name}" ADD COLUMN "{coluna.name}" {tipo}'))
+            logging.info(f"Coluna {tabela.name}.{coluna.name} adicionada ao banco.")
+
+def _criar_indices_faltantes(conn, metadata):
+    """Cria índices declarados nos modelos que o create_all ignora em tabelas existentes."""
+    # Pelo nome em sqlite_master: a reflexão do SQLAlchemy (checkfirst) não
+    # enxerga índices de expressão e tentaria criá-los de novo.
+    existentes = set(conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'")).scalars())
+    for tabela in metadata.sorted_tables:
+        for indice in tabela.indexes:
+            if indice.name not in existentes:
+                indice.create(bind=conn)
+
+def _remover_indices_substituidos(conn):
+    """Índices que um composto passou a cobrir (ex.: Status -> Status, PRECO)."""
+    for nome in INDICES_SUBSTITUIDOS:
+        conn.execute(text(f'DROP INDEX IF EXISTS "{nome}"'))
+
+def _encerrar_tarefas_duplicadas(conn):
+    """Antes do índice único ix_tarefas_ativa: só a tarefa mais nova de cada (tipo, UF) continua ativa."""
+    resultado = conn.execute(text(
+        "UPDATE tarefas SET status = 'interrompida', finalizado_em = CURRENT_TIMESTAMP, "
+        "mensagem = 'Substituída por uma tarefa mais nova do mesmo estado.' "
+        "WHERE status IN ('pendente', 'executando') AND id NOT IN ("
+        "SELECT max(id) FROM tarefas WHERE status IN ('pendente', 'executando') GROUP BY tipo, UF)"
+    ))
+    if resultado.rowcount:
+        logging.info(f"{resultado.rowcount} tarefas duplicadas marcadas como interrompidas.")
+
+def _preencher_data_disputa(conn):
+    """Converte a DATA_DISPUTA ('dd/mm/aaaa') dos imóveis existentes para DATA_DISPUTA_DT."""
+    resultado = conn.execute(text(
+        "UPDATE imoveis SET DATA_DISPUTA_DT = "
+        "substr(trim(DATA_DISPUTA), 7, 4) || '-' || substr(trim(DATA_DISPUTA), 4, 2) || '-' || substr(trim(DATA_DISPUTA), 1, 2) "
+        "WHERE DATA_DISPUTA_DT IS NULL AND trim(DATA_DISPUTA) GLOB '[0-3][0-9]/[01][0-9]/[12][0-9][0-9][0-9]'"
+    ))
+    if resultado.rowcount:
+        logging.info(f"Data de disputa convertida para {resultado.rowcount} imóveis existentes.")
+
+def _calcular_analise_de_valor():
+    """
+    PRECO_M2, SCORE_VALOR e estatisticas_regiao de bancos que ganharam essas
+    colunas e ainda não passaram por uma sincronização. Usa a sessão do app.
+    """
+    from app import analise, cache, db
+
+    if analise.recalcular():
+        cache.incrementar_versao()
+    db.session.commit()
+
+def _criar_indice_textual(conn):
+    existe = conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :nome"),
+        {'nome': FTS_TABELA}
+    ).first()
+    if existe:
+        return
+
+    colunas = ', '.join(FTS_COLUNAS)
+    novos = ', '.join(f'new.{c}' for c in FTS_COLUNAS)
+    antigos = ', '.join(f'old.{c}' for c in FTS_COLUNAS)
+
+    conn.execute(text(
+        f"CREATE VIRTUAL TABLE {FTS_TABELA} USING fts5("
+        f"{colunas}, content='imoveis', content_rowid='rowid', "
+        f"tokenize='unicode61 remove_diacritics 2')"
+    ))
+    conn.execute(text(
+        f"CREATE TRIGGER {FTS_TABELA}_ai AFTER INSERT ON imoveis BEGIN "
+        f"INSERT INTO {FTS_TABELA}(rowid, {colunas}) VALUES (new.rowid, {novos}); END"
+    ))
+    conn.execute(text(
+        f"CREATE TRIGGER {FTS_TABELA}_ad AFTER DELETE ON imoveis BEGIN "
+        f"INSERT INTO {FTS_TABELA}({FTS_TABELA}, rowid, {colunas}) VALUES ('delete', old.rowid, {antigos}); END"
+    ))
+    conn.execute(text(
+        f"CREATE TRIGGER {FTS_TABELA}_au AFTER UPDATE OF {colunas} ON imoveis BEGIN "
+        f"INSERT INTO {FTS_TABELA}({FTS_TABELA}, rowid, {colunas}) VALUES ('delete', old.rowid, {antigos}); "
+        f"INSERT INTO {FTS_TABELA}(rowid, {colunas}) VALUES (new.rowid, {novos}); END"
+    ))
+    conn.execute(text(f"INSERT INTO {FTS_TABELA}({FTS_TABELA}) VALUES ('rebuild')"))
+    logging.info("Índice de busca textual criado e populado.")
+
+def reconstruir_indice_textual(conn):
+    """Repopula o índice textual a partir de `imoveis`, com os rowids atuais."""
+    conn.execute(text(f"INSERT INTO {FTS_TABELA}({FTS_TABELA}) VALUES ('rebuild')"))
+
+def compactar(engine):
+    """
+    VACUUM do banco seguido da reconstrução do índice textual, que ficaria
+    apontando para rowids antigos (python -m app.cli compactar).
+    """
+    with engine.connect() as conn:
+        # Fora de transação: o VACUUM não roda dentro de uma.
+        conn.exec_driver_sql('VACUUM')
+    with engine.begin() as conn:
+        existe = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :nome"),
+            {'nome': FTS_TABELA}
+        ).first()
+        if existe:
+            reconstruir_indice_textual(conn)
+    logging.info("Banco compactado e índice de busca textual reconstruído.")
+
+def versao_do_banco(engine):
+    with engine.connect() as conn:
+        return conn.exec_driver_sql('PRAGMA user_version').scalar() or 0
+
+def aplicar(engine, metadata):
+    """
+    Leva o banco ao esquema atual dos modelos (criação de tabelas incluída).
+    Quando o banco já está na ESQUEMA_VERSAO, custa uma única consulta.
+    Precisa de app context (alguns passos usam a sessão do Flask-SQLAlchemy).
+    Devolve a versão em que o banco estava.
+    """
+    versao_anterior = versao_do_banco(engine)
+    if versao_anterior == ESQUEMA_VERSAO:
+        return versao_anterior
+    with engine.connect() as conn:
+        # WAL deixa o dashboard ler enquanto um job de raspagem grava.
+        conn.exec_driver_sql('PRAGMA journal_mode=WAL')
+    metadata.create_all(engine)
+    with engine.begin() as conn:
+        _adicionar_colunas_faltantes(conn, metadata)
+        if versao_anterior < 8:
+            _encerrar_tarefas_duplicadas(conn)
+        _criar_indices_faltantes(conn, metadata)
+    if versao_anterior < 2:
+        from app import identidade
+        with engine.begin() as conn:
+            identidade.preencher_colunas(conn)
+    if versao_anterior < 4:
+        with engine.begin() as conn:
+            _preencher_data_disputa(conn)
+    if versao_anterior < 6:
+        with engine.begin() as conn:
+            _remover_indices_substituidos(conn)
+    if versao_anterior < 9:
+        _calcular_analise_de_valor()
+    try:
+        with engine.begin() as conn:
+            _criar_indice_textual(conn)
+    except Exception as e:
+        logging.warning(f"Busca textual (FTS5) indisponível neste SQLite, usando LIKE: {e}")
+    with engine.begin() as conn:
+        conn.exec_driver_sql(f'PRAGMA user_version = {ESQUEMA_VERSAO}')
+    logging.info(f"Esquema do banco atualizado para a versão {ESQUEMA_VERSAO}.")
+    return versao_anterior
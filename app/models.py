@@ -1,5 +1,34 @@
 from app import db
+from sqlalchemy.orm import validates
 from sqlalchemy.sql import func
+from datetime import date, datetime
+import json
+
+def converter_data(valor):
+    """Data de 'dd/mm/aaaa' (página da Caixa), 'aaaa-mm-dd' ou datetime (planilhas); None se inválida."""
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    if not isinstance(valor, str):
+        return None
+    texto = valor.strip()[:10]
+    for formato in ('%d/%m/%Y', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(texto, formato).date()
+        except ValueError:
+            continue
+    return None
+
+class ColunasEmDicionario:
+    """to_dict com todas as colunas do modelo, datas e horas em ISO 8601."""
+
+    def to_dict(self):
+        result = {}
+        for column in self.__table__.columns:
+            value = getattr(self, column.name)
+            result[column.name] = value.isoformat() if hasattr(value, 'isoformat') else value
+        return result
 
 class Imovel(db.Model):
     __tablename__ = 'imoveis'
@@ -11,6 +40,7 @@ class Imovel(db.Model):
     CIDADE = db.Column(db.String)
     BAIRRO = db.Column(db.String)
     ENDERECO = db.Column(db.String)
+    DESCRICAO = db.Column(db.String)
     AREA_PRIVATIVA = db.Column(db.String)
     AREA_DO_TERRENO = db.Column(db.String)
     DATA_DISPUTA = db.Column(db.String)
@@ -22,14 +52,52 @@ class Imovel(db.Model):
     CONDOMINIO = db.Column(db.String)
     FGTS = db.Column(db.String)
     FINANCIAMENTO = db.Column(db.String)
-    Status = db.Column(db.String, index=True)
+    Status = db.Column(db.String)
+    # Calculados por analise.recalcular após cada sincronização.
+    PRECO_M2 = db.Column(db.Float)
+    SCORE_VALOR = db.Column(db.Float, index=True)
+    # Chaves secundárias de identidade (ver app/identidade.py).
+    NUMERO_CAIXA = db.Column(db.String(20))
+    CHAVE_ENDERECO = db.Column(db.String)
+    # DATA_DISPUTA como data (preenchida junto com ela), para filtros e agenda
+    # por índice; e as duas rodadas de leilão lidas da página de detalhe.
+    DATA_DISPUTA_DT = db.Column(db.Date)
+    DATA_LEILAO_1 = db.Column(db.Date)
+    PRECO_LEILAO_1 = db.Column(db.Float)
+    DATA_LEILAO_2 = db.Column(db.Date)
+    PRECO_LEILAO_2 = db.Column(db.Float)
     updated_at = db.Column(db.DateTime, server_default=func.now(), onupdate=func.now())
 
+    __table_args__ = (
+        db.Index('ix_imoveis_updated_at_status', 'updated_at', 'Status'),
+        db.Index('ix_imoveis_uf_numero_caixa', 'UF', 'NUMERO_CAIXA'),
+        db.Index('ix_imoveis_uf_chave_endereco', 'UF', 'CHAVE_ENDERECO'),
+        # Cobre a agenda (intervalo de datas agrupado por dia e UF) sem ler a tabela.
+        db.Index('ix_imoveis_data_disputa', 'DATA_DISPUTA_DT', 'UF', 'Status'),
+        # Ordem padrão do dashboard (preço; o rowid, fim implícito de todo
+        # índice, desempata as páginas) com e sem filtro de UF, e a faixa de preço.
+        db.Index('ix_imoveis_preco', 'PRECO'),
+        db.Index('ix_imoveis_uf_preco', 'UF', 'PRECO'),
+        # Contagens por Status, preço médio dos ativos, resumo por UF e listas
+        # de tipos e modalidades lidos só do índice, sem ir à tabela.
+        db.Index('ix_imoveis_status_preco', 'Status', 'PRECO'),
+        db.Index('ix_imoveis_uf_status', 'UF', 'Status'),
+        db.Index('ix_imoveis_tipo', 'TIPO'),
+        db.Index('ix_imoveis_modalidade', 'MODALIDADE'),
+    )
+    # Colunas de uso interno, fora de to_dict e da API.
+    COLUNAS_INTERNAS = ('updated_at', 'CHAVE_ENDERECO', 'DATA_DISPUTA_DT')
+
+    @validates('DATA_DISPUTA')
+    def _validar_data_disputa(self, chave, valor):
+        self.DATA_DISPUTA_DT = converter_data(valor)
+        return valor
+
     def to_dict(self):
         """Converte o objeto para dicionário, excluindo campos internos."""
         result = {}
         for column in self.__table__.columns:
-            if column.name != 'updated_at': 
+            if column.name not in self.COLUNAS_INTERNAS:
                 value = getattr(self, column.name)
                 
                 if value is None:
@@ -42,6 +110,49 @@ class Imovel(db.Model):
                     
         return result
 
+    @classmethod
+    def colunas_publicas(cls):
+        """Colunas expostas pela API, na mesma ordem de to_dict."""
+        return [c.name for c in cls.__table__.columns if c.name not in cls.COLUNAS_INTERNAS]
+
+    @staticmethod
+    def valor_padrao(coluna):
+        """Valor usado no lugar de None, como em to_dict."""
+        return 0.0 if coluna in ['PRECO', 'AVALIACAO'] else ''
+
+# Cidade e bairro como o dashboard filtra e lista (upper/trim). O SQLite só usa
+# um índice de expressão quando a consulta repete a mesma expressão, por isso
+# as consultas usam estas, e não uma montada na hora.
+CIDADE_NORMALIZADA = func.upper(func.trim(Imovel.CIDADE))
+BAIRRO_NORMALIZADO = func.upper(func.trim(Imovel.BAIRRO))
+
+db.Index('ix_imoveis_cidade', CIDADE_NORMALIZADA)
+db.Index('ix_imoveis_uf_cidade_preco', Imovel.UF, CIDADE_NORMALIZADA, Imovel.PRECO)
+db.Index('ix_imoveis_uf_cidade_bairro', Imovel.UF, CIDADE_NORMALIZADA, BAIRRO_NORMALIZADO)
+
+class EstatisticaRegiao(db.Model):
+    """Distribuição do preço/m² dos imóveis ativos por cidade ou bairro."""
+    __tablename__ = 'estatisticas_regiao'
+
+    id = db.Column(db.Integer, primary_key=True)
+    nivel = db.Column(db.String(10), nullable=False)
+    UF = db.Column(db.String(2), nullable=False)
+    CIDADE = db.Column(db.String, nullable=False)
+    BAIRRO = db.Column(db.String, nullable=False, default='')
+    quantidade = db.Column(db.Integer, nullable=False)
+    mediana = db.Column(db.Float)
+    q1 = db.Column(db.Float)
+    q3 = db.Column(db.Float)
+    iqr = db.Column(db.Float)
+    atualizado_em = db.Column(db.DateTime, server_default=func.now())
+
+    __table_args__ = (
+        db.Index('ix_estatisticas_regiao_local', 'nivel', 'UF', 'CIDADE', 'BAIRRO', unique=True),
+    )
+
+    def to_dict(self):
+        return {c.name: getattr(self, c.name) for c in self.__table__.columns if c.name != 'id'}
+
 class Atualizacao(db.Model):
     __tablename__ = 'atualizacoes'
     
@@ -56,4 +167,153 @@ class Atualizacao(db.Model):
     ChangedFields = db.Column(db.String)
 
     def to_dict(self):
-        return {c.name: getattr(self, c.name) for c in self.__table__.columns}
\ No newline at end of file
+        return {c.name: getattr(self, c.name) for c in self.__table__.columns}
+
+class Execucao(db.Model):
+    """Uma rodada de sincronização (raspagem ou importação de Excel)."""
+    __tablename__ = 'execucoes'
+
+    id = db.Column(db.Integer, primary_key=True)
+    origem = db.Column(db.String(20))
+    UFs = db.Column(db.String)
+    iniciado_em = db.Column(db.DateTime, server_default=func.now(), index=True)
+    finalizado_em = db.Column(db.DateTime)
+    # Resumo em JSON das métricas da rodada (tempos por etapa, vazão, percentis).
+    resumo = db.Column(db.Text)
+
+    def to_dict(self):
+        dados = {c.name: getattr(self, c.name) for c in self.__table__.columns}
+        dados['resumo'] = json.loads(self.resumo) if self.resumo else None
+        return dados
+
+class HistoricoAlteracao(db.Model):
+    """Registro append-only de mudanças de preço/status de um imóvel por execução."""
+    __tablename__ = 'historico_alteracoes'
+
+    id = db.Column(db.Integer, primary_key=True)
+    UF = db.Column(db.String(2), nullable=False)
+    MATRICULA = db.Column(db.String(50), nullable=False)
+    execucao_id = db.Column(db.Integer, db.ForeignKey('execucoes.id'), nullable=False, index=True)
+    campo = db.Column(db.String(20), nullable=False)
+    valor_antigo = db.Column(db.String)
+    valor_novo = db.Column(db.String)
+
+    __table_args__ = (
+        db.Index('ix_historico_imovel', 'UF', 'MATRICULA', 'id'),
+        db.Index('ix_historico_campo_execucao', 'campo', 'execucao_id'),
+    )
+
+    def to_dict(self):
+        return {c.name: getattr(self, c.name) for c in self.__table__.columns}
+
+class VersaoDados(db.Model):
+    """Contador global incrementado a cada sincronização que altera `imoveis`."""
+    __tablename__ = 'versao_dados'
+
+    id = db.Column(db.Integer, primary_key=True)
+    versao = db.Column(db.Integer, nullable=False, default=0)
+    atualizado_em = db.Column(db.DateTime, server_default=func.now(), onupdate=func.now())
+
+class Tarefa(ColunasEmDicionario, db.Model):
+    """Job em segundo plano (raspagem ou enriquecimento de um estado), persistido para deduplicação e consulta."""
+    __tablename__ = 'tarefas'
+
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(20), nullable=False, default='raspagem')
+    UF = db.Column(db.String(2), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pendente')
+    mensagem = db.Column(db.String)
+    progresso_atual = db.Column(db.Integer, default=0)
+    progresso_total = db.Column(db.Integer, default=0)
+    resultado = db.Column(db.Text)
+    criado_em = db.Column(db.DateTime, server_default=func.now())
+    iniciado_em = db.Column(db.DateTime)
+    finalizado_em = db.Column(db.DateTime)
+    atualizado_em = db.Column(db.DateTime, server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        db.Index('ix_tarefas_tipo_uf_status', 'tipo', 'UF', 'status'),
+        # No máximo um job ativo por (tipo, UF), entre todos os processos.
+        db.Index('ix_tarefas_ativa', 'tipo', 'UF', unique=True,
+                 sqlite_where=db.text("status IN ('pendente', 'executando')")),
+    )
+
+class PaginaPendente(ColunasEmDicionario, db.Model):
+    """Imóvel cuja página de detalhe falhou na raspagem e aguarda nova tentativa."""
+    __tablename__ = 'paginas_pendentes'
+
+    UF = db.Column(db.String(2), primary_key=True)
+    MATRICULA = db.Column(db.String(50), primary_key=True)
+    LINK = db.Column(db.String, nullable=False)
+    MODALIDADE = db.Column(db.String)
+    tentativas = db.Column(db.Integer, nullable=False, default=0)
+    ultimo_erro = db.Column(db.String)
+    criado_em = db.Column(db.DateTime, server_default=func.now())
+    atualizado_em = db.Column(db.DateTime, server_default=func.now(), onupdate=func.now(), index=True)
+
+class ChaveExecucao(db.Model):
+    """
+    Chaves (UF, MATRICULA) vistas por uma sincronização em andamento. Permite
+    expirar os imóveis ausentes com um único UPDATE ... WHERE NOT EXISTS, sem
+    carregar as chaves da tabela inteira. As linhas são apagadas ao final da
+    execução.
+    """
+    __tablename__ = 'chaves_execucao'
+
+    execucao_id = db.Column(db.Integer, primary_key=True)
+    UF = db.Column(db.String(2), primary_key=True)
+    MATRICULA = db.Column(db.String(50), primary_key=True)
+
+    __table_args__ = {'sqlite_with_rowid': False}
+
+class RetratoCsv(db.Model):
+    """
+    Último retrato da lista CSV de cada UF: hash de cada linha, pelo número do
+    imóvel na Caixa. A raspagem compara o CSV do dia com ele e só busca as
+    páginas de detalhe das linhas novas, alteradas ou revalidadas há tempo
+    demais (ver app/retrato.py).
+    """
+    __tablename__ = 'retrato_csv'
+
+    UF = db.Column(db.String(2), primary_key=True)
+    NUMERO_CAIXA = db.Column(db.String(20), primary_key=True)
+    HASH = db.Column(db.BigInteger, nullable=False)
+    verificado_em = db.Column(db.DateTime, nullable=False, server_default=func.now())
+
+    __table_args__ = {'sqlite_with_rowid': False}
+
+class BuscaSalva(ColunasEmDicionario, db.Model):
+    """
+    Combinação de filtros de /api/data guardada para reuso. Os imóveis que a
+    atendem ficam em resultados_busca, mantidos a cada sincronização (ver
+    app/buscas_salvas.py).
+    """
+    __tablename__ = 'buscas_salvas'
+
+    id = db.Column(db.Integer, primary_key=True)
+    nome = db.Column(db.String, nullable=False)
+    # JSON {parâmetro de /api/data: valor}.
+    filtros = db.Column(db.Text, nullable=False)
+    criada_em = db.Column(db.DateTime, server_default=func.now())
+    avaliada_em = db.Column(db.DateTime)
+    # Imóveis encontrados depois disso são os "novos" da busca.
+    visualizada_em = db.Column(db.DateTime)
+
+    def to_dict(self):
+        result = super().to_dict()
+        result['filtros'] = json.loads(self.filtros)
+        return result
+
+class ResultadoBusca(db.Model):
+    """Imóvel que atende uma busca salva, desde quando (encontrado_em)."""
+    __tablename__ = 'resultados_busca'
+
+    busca_id = db.Column(db.Integer, db.ForeignKey('buscas_salvas.id'), primary_key=True)
+    UF = db.Column(db.String(2), primary_key=True)
+    MATRICULA = db.Column(db.String(50), primary_key=True)
+    encontrado_em = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_resultados_busca_encontrado_em', 'busca_id', 'encontrado_em'),
+        {'sqlite_with_rowid': False},
+    )
@@ -0,0 +1,109 @@
+from app import datalogic, db, historico, metricas, retrato
+from app.models import Imovel
+import os
+import time
+
+UFS_VALIDAS = [
+    'AC', 'AL', 'AP', 'AM', 'BA', 'CE', 'DF', 'ES', 'GO', 'MA', 'MT', 'MS', 'MG', 'PA',
+    'PB', 'PR', 'PE', 'PI', 'RJ', 'RN', 'RS', 'RO', 'RR', 'SC', 'SP', 'SE', 'TO'
+]
+
+def contar_imoveis():
+    return db.session.query(Imovel).count()
+
+def processar_estado(estado, indice=1, total_estados=1, workers=1, completo=False):
+    """
+    Executa download, raspagem e sincronização de um estado, gerando os mesmos
+    eventos enviados por SSE em /processar. Só são raspadas as linhas do CSV
+    que mudaram desde a última execução (ver app/retrato.py); 'completo' raspa
+    todas. Precisa de app context ativo. Erros são propagados para quem chamou
+    decidir como reportá-los.
+    """
+    from app import scraper
+
+    inicio = time.monotonic()
+    retrato_inicial = metricas.retrato(estado)
+    etapas = {}
+
+    inicio_etapa = time.perf_counter()
+    for event in scraper.baixar_listas_por_estados([estado]):
+        yield event
+    etapas['download'] = time.perf_counter() - inicio_etapa
+    caminho_arquivo = os.path.join(scraper.PASTA_TEMPORARIOS, f'{estado}.csv')
+    if not os.path.exists(caminho_arquivo):
+        raise FileNotFoundError(f"Arquivo CSV para {estado} não foi encontrado.")
+
+    df = scraper.ler_csv(caminho_arquivo)
+    total_itens = len(df)
+    yield {'type': 'csv_processed', 'state': estado, 'items_count': total_itens,
+           'message': f'{estado}: {total_itens} itens encontrados no CSV'}
+
+    delta = None
+    if total_itens:
+        inicio_etapa = time.perf_counter()
+        delta = retrato.calcular_delta(estado, df, completo=completo)
+        etapas['diff'] = time.perf_counter() - inicio_etapa
+        contagens = delta['contagens']
+        df = delta['delta']
+        total_itens = len(df)
+        yield {'type': 'csv_diff', 'state': estado, 'items_count': total_itens, **contagens,
+               'message': f"{estado}: {total_itens} itens para raspar ({contagens['novas']} novos, "
+                          f"{contagens['alteradas']} alterados, {contagens['revalidadas']} revalidados), "
+                          f"{contagens['inalteradas']} inalterados"}
+
+    # Cada lote raspado é gravado assim que chega; só as contagens seguem para o cliente.
+    sincronizacao = None
+    total_linhas = inalterados = 0
+    execucao_id = None
+    inicio_etapa = time.perf_counter()
+    segundos_sincronizacao = 0.0
+    for event in scraper.processar_linhas(df, max_workers=workers):
+        if event.get('type') == 'batch':
+            lote = event['data']
+            if sincronizacao is None:
+                yield {'type': 'db_start', 'state': estado, 'message': f'Iniciando salvamento de {estado} no banco...'}
+            inicio_lote = time.perf_counter()
+            if sincronizacao is None:
+                sincronizacao = datalogic.Sincronizacao([estado])
+            sincronizacao.processar_lote(lote)
+            segundos_sincronizacao += time.perf_counter() - inicio_lote
+            total_linhas += len(lote)
+            yield {'type': 'db_progress', 'state': estado, 'current': total_linhas, 'total': total_itens,
+                   'message': f'{estado}: {total_linhas} itens salvos'}
+            continue
+        yield event
+
+    if delta is not None:
+        inicio_lote = time.perf_counter()
+        if sincronizacao is None:
+            # CSV sem nenhuma mudança: ainda é preciso confirmar os inalterados e expirar os ausentes.
+            yield {'type': 'db_start', 'state': estado, 'message': f'Iniciando salvamento de {estado} no banco...'}
+            sincronizacao = datalogic.Sincronizacao([estado])
+        inalterados = sincronizacao.marcar_inalterados(estado, delta['inalterados'])
+        execucao_id = sincronizacao.finalizar()
+        retrato.atualizar(estado, delta)
+        segundos_sincronizacao += time.perf_counter() - inicio_lote
+        yield {'type': 'db_progress', 'state': estado, 'current': total_linhas, 'total': total_linhas, 'message': f'Salvamento de {estado} concluído'}
+    etapas['raspagem'] = time.perf_counter() - inicio_etapa - segundos_sincronizacao
+    if sincronizacao is not None:
+        etapas['sincronizacao'] = segundos_sincronizacao
+
+    for etapa, segundos in etapas.items():
+        metricas.ETAPA_SEGUNDOS.observar(segundos, uf=estado, etapa=etapa)
+    resumo = metricas.resumo_execucao(estado, retrato_inicial, etapas)
+    if execucao_id:
+        historico.salvar_resumo(execucao_id, resumo)
+        db.session.commit()
+
+    novos_estado = db.session.query(Imovel).filter(Imovel.UF == estado, Imovel.Status == 'Novo').count()
+    atualizados_estado = db.session.query(Imovel).filter(Imovel.UF == estado, Imovel.Status == 'Atualizado').count()
+    yield {
+        'type': 'state_completed',
+        'state': estado,
+        'current_state': indice,
+        'total_states': total_estados,
+        'total_properties': contar_imoveis(),
+        'elapsed': round(time.monotonic() - inicio, 2),
+        'result': {'new': novos_estado, 'updated': atualizados_estado, 'total_processed': total_linhas, 'unchanged': inalterados},
+        'metrics': resumo
+    }
@@ -1,77 +1,91 @@
 import pandas as pd
 import io
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, PatternFill, Alignment
 from openpyxl.utils import get_column_letter
 from openpyxl.workbook import Workbook
 import logging
 
-def formatar_planilha_excel(df: pd.DataFrame, buffer: io.BytesIO):
-    """Formata e escreve DataFrame para buffer Excel com formatação."""
+# As abas são gravadas em modo write-only: as linhas vão direto para o arquivo,
+# sem montar a planilha inteira em memória. A largura de cada coluna é estimada
+# pelas primeiras AMOSTRA_LARGURA linhas, e não por uma varredura de todas as células.
+AMOSTRA_LARGURA = 1000
+COLUNAS_MOEDA = {'PRECO', 'AVALIACAO', 'Preço mínimo', 'Preço mediano', 'Preço médio'}
+FORMATO_MOEDA = 'R$ #,##0.00'
+
+def _larguras(df):
+    amostra = df.head(AMOSTRA_LARGURA)
+    larguras = []
+    for coluna in df.columns:
+        maior = amostra[coluna].dropna().astype(str).str.len().max() if not amostra.empty else 0
+        maior = max(len(str(coluna)), 0 if pd.isna(maior) else int(maior))
+        larguras.append(min(max(maior + 4, 10), 50))
+    return larguras
+
+def _escrever_aba(wb, titulo, df):
+    ws = wb.create_sheet(titulo)
+    for i, largura in enumerate(_larguras(df), 1):
+        ws.column_dimensions[get_column_letter(i)].width = largura
+    ws.freeze_panes = 'A2'
+    if len(df.columns):
+        ws.auto_filter.ref = f"A1:{get_column_letter(len(df.columns))}{len(df) + 1}"
+
+    header_font = Font(bold=True, color="FFFFFF", name="Calibri", size=12)
+    header_fill = PatternFill(start_color="4F81BD", end_color="4F81BD", fill_type="solid")
+    header_alignment = Alignment(horizontal="center", vertical="center")
+    cabecalho = []
+    for coluna in df.columns:
+        cell = WriteOnlyCell(ws, value=str(coluna))
+        cell.font = header_font
+        cell.fill = header_fill
+        cell.alignment = header_alignment
+        cabecalho.append(cell)
+    ws.append(cabecalho)
+
+    moeda = [i for i, coluna in enumerate(df.columns) if coluna in COLUNAS_MOEDA]
+    valores = df.astype(object).where(df.notna(), None)
+    for linha in valores.itertuples(index=False, name=None):
+        if moeda:
+            linha = list(linha)
+            for i in moeda:
+                if isinstance(linha[i], (int, float)) and linha[i] > 0:
+                    cell = WriteOnlyCell(ws, value=linha[i])
+                    cell.number_format = FORMATO_MOEDA
+                    linha[i] = cell
+        ws.append(linha)
+
+def formatar_planilha_excel(df: pd.DataFrame, buffer: io.BytesIO, resumos=None):
+    """
+    Formata e escreve DataFrame para buffer Excel com formatação. 'resumos'
+    ({nome da aba: DataFrame}, ver datalogic.get_resumos_exportacao) vira uma
+    aba para cada tabela, depois da aba "Imóveis".
+    """
     try:
         if df.empty:
             wb = Workbook()
             ws = wb.active
             ws.title = "Imóveis"
-            ws.append(["MATRICULA", "UF", "CIDADE", "BAIRRO", "ENDERECO", "STATUS", 
-                      "PRECO", "AVALIACAO", "DESCONTO", "AREA_PRIVATIVA", "AREA_DO_TERRENO", 
+            ws.append(["MATRICULA", "UF", "CIDADE", "BAIRRO", "ENDERECO", "STATUS",
+                      "PRECO", "AVALIACAO", "DESCONTO", "AREA_PRIVATIVA", "AREA_DO_TERRENO",
                       "TIPO", "MODALIDADE", "DATA_DISPUTA", "FGTS", "FINANCIAMENTO"])
             ws.append(["Nenhum dado encontrado"])
             wb.save(buffer)
             return
 
-        if len(df) == 0:
-            logging.warning("DataFrame está vazio para exportação")
-            return
-
-        with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='Imóveis')
-            
-            worksheet = writer.sheets['Imóveis']
-
-            header_font = Font(bold=True, color="FFFFFF", name="Calibri", size=12)
-            header_fill = PatternFill(start_color="4F81BD", end_color="4F81BD", fill_type="solid")
-            header_alignment = Alignment(horizontal="center", vertical="center")
-            
-            currency_format = 'R$ #,##0.00'
-            cell_alignment = Alignment(vertical="center", horizontal="left", wrap_text=True)
-
-            for cell in worksheet[1]:
-                cell.font = header_font
-                cell.fill = header_fill
-                cell.alignment = header_alignment
-            
-            if worksheet.max_row > 1:
-                worksheet.auto_filter.ref = worksheet.dimensions
+        wb = Workbook(write_only=True)
+        _escrever_aba(wb, 'Imóveis', df)
+        for titulo, resumo in (resumos or {}).items():
+            _escrever_aba(wb, titulo, resumo)
+        wb.save(buffer)
 
-            for i, col_name in enumerate(df.columns, 1):
-                max_length = 0
-                column_letter = get_column_letter(i)
-                
-                for j, cell in enumerate(worksheet[column_letter], 1):
-                    if j > 1: 
-                        cell.alignment = cell_alignment
-                        
-                        if col_name in ['PRECO', 'AVALIACAO'] and cell.value is not None:
-                            try:
-                                if isinstance(cell.value, (int, float)) and cell.value > 0:
-                                    cell.number_format = currency_format
-                            except (ValueError, TypeError):
-                                pass
-                    
-                    if cell.value is not None:
-                        cell_length = len(str(cell.value))
-                        if cell_length > max_length:
-                            max_length = cell_length
-                
-                adjusted_width = min(max(max_length + 4, 10), 50)
-                worksheet.column_dimensions[column_letter].width = adjusted_width
+        logging.info(f"Planilha Excel formatada com sucesso. Linhas: {len(df)}, abas de resumo: {len(resumos or {})}")
 
-        logging.info(f"Planilha Excel formatada com sucesso. Linhas: {len(df)}")
-        
     except Exception as e:
         logging.error(f"Erro ao formatar planilha Excel: {e}", exc_info=True)
         try:
+            buffer.seek(0)
+            buffer.truncate()
             df.to_excel(buffer, index=False, sheet_name='Imóveis', engine='openpyxl')
         except Exception as e2:
             logging.error(f"Erro ao criar planilha simples: {e2}")
-            raise
\ No newline at end of file
+            raise
@@ -0,0 +1,160 @@
+from app import analise, buscas_salvas, cache, db, historico, scraper
+from app.models import Imovel, PaginaPendente
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import time
+
+# Nova tentativa das páginas de detalhe que falharam na raspagem e
+# enriquecimento dos imóveis importados por planilha, que nunca passaram pela
+# página de detalhe. Só os campos vindos da página são aplicados; a chave e os
+# dados do CSV/planilha não mudam.
+MAX_TENTATIVAS = 5
+TAMANHO_LOTE_ENRIQUECIMENTO = 100
+WORKERS_ENRIQUECIMENTO = 4
+
+def _aplicar_extras(imovel, extras, alteracoes):
+    campos = scraper.campos_da_pagina(imovel.MODALIDADE)
+    alterados = []
+    for campo, valor in extras.items():
+        if campo not in campos or not valor:
+            continue
+        if str(getattr(imovel, campo)) != str(valor):
+            historico.registrar(alteracoes, imovel.UF, imovel.MATRICULA, campo, getattr(imovel, campo), valor)
+            setattr(imovel, campo, valor)
+            alterados.append(campo)
+    if 'PRECO' in alterados:
+        desconto = scraper.calcular_desconto(imovel.PRECO, imovel.AVALIACAO)
+        historico.registrar(alteracoes, imovel.UF, imovel.MATRICULA, 'DESCONTO', imovel.DESCONTO, desconto)
+        imovel.DESCONTO = desconto
+    return alterados
+
+def reprocessar_pendentes(ufs=None, limite=500, workers=1, max_tentativas=MAX_TENTATIVAS):
+    """
+    Busca de novo as páginas pendentes (as mais antigas primeiro) e grava os
+    campos obtidos. Precisa de app context. Devolve as contagens da rodada.
+    """
+    query = PaginaPendente.query.filter(PaginaPendente.tentativas < max_tentativas)
+    if ufs:
+        query = query.filter(PaginaPendente.UF.in_(ufs))
+    pendentes = query.order_by(PaginaPendente.atualizado_em).limit(limite).all()
+    if not pendentes:
+        return {'pendentes': 0, 'recuperadas': 0, 'falhas': 0, 'atualizadas': 0}
+
+    alvos = [(p.LINK, p.MODALIDADE, p.UF) for p in pendentes]
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        resultados = list(executor.map(lambda alvo: scraper.extrair_dados_pagina_imovel(*alvo), alvos))
+
+    execucao_id = historico.iniciar_execucao('reprocessamento', {p.UF for p in pendentes})
+    alteracoes = []
+    recuperadas = falhas = atualizadas = 0
+    for pendente, extras in zip(pendentes, resultados):
+        if isinstance(extras, scraper.FalhaPagina):
+            pendente.tentativas += 1
+            pendente.ultimo_erro = extras.motivo[:500]
+            falhas += 1
+            continue
+        imovel = db.session.get(Imovel, (pendente.UF, pendente.MATRICULA))
+        if imovel is not None and _aplicar_extras(imovel, extras, alteracoes):
+            atualizadas += 1
+        db.session.delete(pendente)
+        recuperadas += 1
+
+    historico.gravar(execucao_id, alteracoes)
+    historico.finalizar_execucao(execucao_id, {'paginas': len(pendentes), 'recuperadas': recuperadas, 'falhas': falhas})
+    if atualizadas:
+        analise.recalcular({p.UF for p in pendentes})
+        buscas_salvas.atualizar(execucao_id)
+        cache.incrementar_versao()
+    db.session.commit()
+    logging.info(f"Reprocessamento: {recuperadas} páginas recuperadas, {falhas} ainda com falha, {atualizadas} imóveis atualizados.")
+    return {'pendentes': len(pendentes), 'recuperadas': recuperadas, 'falhas': falhas, 'atualizadas': atualizadas}
+
+def ufs_pendentes(max_tentativas=MAX_TENTATIVAS):
+    """UFs com páginas pendentes que ainda cabem em uma nova tentativa."""
+    query = db.session.query(PaginaPendente.UF).filter(PaginaPendente.tentativas < max_tentativas).distinct().order_by(PaginaPendente.UF)
+    return [uf for (uf,) in query]
+
+def reprocessar_estado(uf, limite=500, workers=1, max_tentativas=MAX_TENTATIVAS):
+    """
+    reprocessar_pendentes de uma UF como job da tabela de tarefas: gera o
+    evento final no formato de pipeline.processar_estado. Precisa de app context.
+    """
+    inicio = time.monotonic()
+    resultado = reprocessar_pendentes([uf], limite=limite, workers=workers, max_tentativas=max_tentativas)
+    yield {
+        'type': 'state_completed', 'state': uf,
+        'elapsed': round(time.monotonic() - inicio, 2),
+        'result': {
+            'new': 0, 'updated': resultado['atualizadas'], 'failed': resultado['falhas'],
+            'total_processed': resultado['pendentes'], 'recovered': resultado['recuperadas'],
+        },
+    }
+
+def _filtro_incompletos():
+    """Imóveis ativos com link e algum campo da página de detalhe nunca preenchido (NULL)."""
+    return db.and_(
+        Imovel.LINK.isnot(None), Imovel.LINK != '', Imovel.Status != 'Expirado',
+        db.or_(*[getattr(Imovel, campo).is_(None) for campo in scraper.CAMPOS_PAGINA_DETALHE])
+    )
+
+def ufs_incompletas():
+    """UFs com imóveis a enriquecer (tipicamente os vindos de planilhas)."""
+    query = db.session.query(Imovel.UF).filter(_filtro_incompletos()).distinct().order_by(Imovel.UF)
+    return [uf for (uf,) in query]
+
+def enriquecer_estado(uf, workers=WORKERS_ENRIQUECIMENTO, tamanho_lote=TAMANHO_LOTE_ENRIQUECIMENTO):
+    """
+    Busca as páginas de detalhe dos imóveis de 'uf' sem FGTS, FINANCIAMENTO,
+    CONDOMINIO ou DATA_DISPUTA, 'workers' por vez, gravando a cada
+    'tamanho_lote' imóveis. Gera os mesmos tipos de evento de
+    pipeline.processar_estado. Precisa de app context.
+    """
+    inicio = time.monotonic()
+    alvos = db.session.query(Imovel.MATRICULA, Imovel.LINK, Imovel.MODALIDADE).filter(
+        Imovel.UF == uf, _filtro_incompletos()
+    ).order_by(Imovel.MATRICULA).all()
+    total = len(alvos)
+    yield {'type': 'csv_processed', 'state': uf, 'items_count': total,
+           'message': f'{uf}: {total} imóveis importados sem os dados da página de detalhe'}
+
+    execucao_id = historico.iniciar_execucao('enriquecimento', [uf])
+    db.session.commit()
+    processados = atualizados = falhas = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for inicio_lote in range(0, total, tamanho_lote):
+            lote = alvos[inicio_lote:inicio_lote + tamanho_lote]
+            resultados = executor.map(lambda alvo: scraper.extrair_dados_pagina_imovel(alvo.LINK, alvo.MODALIDADE, uf), lote)
+            imoveis = {i.MATRICULA: i for i in Imovel.query.filter(Imovel.UF == uf, Imovel.MATRICULA.in_([a.MATRICULA for a in lote]))}
+            alteracoes = []
+            for alvo, extras in zip(lote, resultados):
+                processados += 1
+                imovel = imoveis.get(alvo.MATRICULA)
+                if isinstance(extras, scraper.FalhaPagina):
+                    falhas += 1
+                elif imovel is not None:
+                    if _aplicar_extras(imovel, extras, alteracoes):
+                        atualizados += 1
+                    # A página foi lida: o que ela não trouxe fica com o padrão do CSV,
+                    # para o imóvel não voltar à lista de incompletos.
+                    for campo in scraper.CAMPOS_PAGINA_DETALHE:
+                        if getattr(imovel, campo) is None:
+                            setattr(imovel, campo, '')
+                if processados % 10 == 0 or processados == total:
+                    yield {'type': 'state_progress', 'state': uf, 'current': processados, 'total': total,
+                           'message': f'Enriquecendo {uf}: {processados}/{total}'}
+            historico.gravar(execucao_id, alteracoes)
+            db.session.commit()
+
+    resumo = {'imoveis': total, 'atualizados': atualizados, 'falhas': falhas}
+    historico.finalizar_execucao(execucao_id, resumo)
+    if atualizados:
+        analise.recalcular([uf])
+        buscas_salvas.atualizar(execucao_id)
+        cache.incrementar_versao()
+    db.session.commit()
+    logging.info(f"Enriquecimento de {uf}: {atualizados} de {total} imóveis atualizados, {falhas} páginas com falha.")
+    yield {
+        'type': 'state_completed', 'state': uf,
+        'elapsed': round(time.monotonic() - inicio, 2),
+        'result': {'new': 0, 'updated': atualizados, 'failed': falhas, 'total_processed': total},
+    }
@@ -0,0 +1,120 @@
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+from collections import OrderedDict
+import gzip
+import threading
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+TAMANHO_MINIMO_COMPRESSAO = 1024
+MIMETYPES_COMPRIMIVEIS = {'application/json', 'text/html', 'text/css', 'application/javascript', 'text/javascript'}
+
+# Corpos já comprimidos de respostas com ETag: a mesma versão dos dados não é
+# recomprimida a cada carregamento do dashboard.
+_comprimidos = OrderedDict()
+_comprimidos_max = 64
+_lock = threading.Lock()
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Provider de JSON do Flask que usa orjson (quando instalado) no jsonify."""
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+
+    def response(self, *args, **kwargs):
+        if orjson is None:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        corpo = orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS)
+        return self._app.response_class(corpo, mimetype=self.mimetype)
+
+def formato_colunar():
+    """Cliente pediu ?formato=colunar (nomes das colunas uma vez, valores em arrays)."""
+    return request.args.get('formato', '').strip().lower() == 'colunar'
+
+def montar_registros(linhas, colunas, padroes=None):
+    """
+    Converte tuplas (na ordem de 'colunas') no formato pedido pelo cliente:
+    lista de dicts (padrão) ou {'columns': [...], 'rows': [[...], ...]}.
+    'padroes' substitui valores None por coluna, como Imovel.to_dict faz.
+    """
+    padroes = padroes or {}
+    indices_padrao = [(i, padroes[c]) for i, c in enumerate(colunas) if c in padroes]
+
+    def normalizar(linha):
+        valores = list(linha)
+        for i, padrao in indices_padrao:
+            if valores[i] is None:
+                valores[i] = padrao
+        return valores
+
+    if formato_colunar():
+        return {'columns': list(colunas), 'rows': [normalizar(linha) for linha in linhas]}
+    return [dict(zip(colunas, normalizar(linha))) for linha in linhas]
+
+def registros_de_dicts(dicts, colunas=None):
+    """Mesma saída de montar_registros para dados que já chegam como lista de dicts."""
+    if not formato_colunar():
+        return dicts
+    if colunas is None:
+        colunas = list(dicts[0].keys()) if dicts else []
+    return {'columns': colunas, 'rows': [[d.get(c) for c in colunas] for d in dicts]}
+
+def _escolher_codificacao():
+    aceitas = request.accept_encodings
+    if brotli is not None and aceitas['br']:
+        return 'br'
+    if aceitas['gzip']:
+        return 'gzip'
+    return None
+
+def _comprimir_corpo(corpo, codificacao):
+    if codificacao == 'br':
+        return brotli.compress(corpo, quality=5)
+    return gzip.compress(corpo, compresslevel=6)
+
+def comprimir(response):
+    """after_request: aplica gzip/brotli conforme o Accept-Encoding do cliente."""
+    if (response.status_code != 200
+            or response.direct_passthrough
+            or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in MIMETYPES_COMPRIMIVEIS):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    codificacao = _escolher_codificacao()
+    if codificacao is None:
+        return response
+
+    corpo = response.get_data()
+    if len(corpo) < TAMANHO_MINIMO_COMPRESSAO:
+        return response
+
+    etag = response.headers.get('ETag')
+    chave = (etag, codificacao) if etag else None
+    comprimido = None
+    if chave:
+        with _lock:
+            comprimido = _comprimidos.get(chave)
+    if comprimido is None:
+        comprimido = _comprimir_corpo(corpo, codificacao)
+        if chave:
+            with _lock:
+                _comprimidos[chave] = comprimido
+                while len(_comprimidos) > _comprimidos_max:
+                    _comprimidos.popitem(last=False)
+
+    response.set_data(comprimido)
+    response.headers['Content-Encoding'] = codificacao
+    return response
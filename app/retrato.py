@@ -0,0 +1,123 @@
+from app import db, identidade
+from app.models import Imovel, PaginaPendente, RetratoCsv
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import and_, delete, exists, insert, select
+import logging
+
+# Raspagem incremental: a lista CSV de uma UF muda pouco de um dia para o
+# outro, mas cada linha custa uma página de detalhe. Guardamos o hash de cada
+# linha (tabela retrato_csv, chave UF + número do imóvel na Caixa) e, na
+# execução seguinte, só vão para a raspagem as linhas:
+#   - novas ou com hash diferente;
+#   - verificadas há mais de RETRATO_VALIDADE_DIAS (a página de detalhe pode
+#     mudar sem o CSV mudar, ex.: data do leilão);
+#   - sem imóvel ativo no banco, com página de detalhe pendente ou sem número.
+# As demais são dadas como vistas direto no banco (Sincronizacao.marcar_inalterados).
+VALIDADE_DIAS = 7
+TAMANHO_LOTE = 500
+
+def numeros(df):
+    """Número do imóvel na Caixa de cada linha do CSV: o do link ou, sem ele, os dígitos do 'N° do imóvel'."""
+    import pandas as pd
+
+    por_link = identidade.numeros_caixa(df['LINK']) if 'LINK' in df else pd.Series(None, index=df.index, dtype=object)
+    if 'MATRICULA' in df:
+        digitos = df['MATRICULA'].astype('string').str.replace(r'\D', '', regex=True)
+        por_link = por_link.fillna(digitos.where(digitos != '').astype(object))
+    return por_link.where(por_link.notna(), None)
+
+def hashes(df):
+    """Hash de 64 bits de cada linha, sobre o texto de todas as colunas (tipos inferidos pelo pandas não interferem)."""
+    import pandas as pd
+
+    texto = df[sorted(df.columns)].astype('string').fillna('')
+    return pd.util.hash_pandas_object(texto, index=False).to_numpy().view('int64')
+
+def _anterior(uf):
+    import pandas as pd
+
+    ativo = exists().where(
+        Imovel.UF == RetratoCsv.UF, Imovel.NUMERO_CAIXA == RetratoCsv.NUMERO_CAIXA, Imovel.Status != 'Expirado'
+    )
+    linhas = db.session.execute(
+        select(RetratoCsv.NUMERO_CAIXA, RetratoCsv.HASH.label('HASH_ANTERIOR'), RetratoCsv.verificado_em, ativo.label('ativo'))
+        .where(RetratoCsv.UF == uf)
+    ).all()
+    return pd.DataFrame(linhas, columns=['NUMERO_CAIXA', 'HASH_ANTERIOR', 'verificado_em', 'ativo'])
+
+def _pendentes(uf):
+    consulta = select(Imovel.NUMERO_CAIXA).join(
+        PaginaPendente, and_(PaginaPendente.UF == Imovel.UF, PaginaPendente.MATRICULA == Imovel.MATRICULA)
+    ).where(PaginaPendente.UF == uf, Imovel.NUMERO_CAIXA.isnot(None))
+    return set(db.session.scalars(consulta))
+
+def calcular_delta(uf, df, completo=False):
+    """
+    Compara o CSV do dia ('df', no formato de scraper.ler_csv) com o retrato
+    anterior da UF; com 'completo', todas as linhas vão para o delta e o
+    retrato é refeito. Devolve um dicionário com:
+      delta        linhas de 'df' que precisam ser raspadas;
+      inalterados  números da Caixa das linhas que não precisam;
+      removidos    números que estavam no retrato e sumiram do CSV;
+      gravar       registros do retrato a gravar depois de sincronizar o delta;
+      contagens    quantidades por motivo, para log e eventos.
+    """
+    import pandas as pd
+
+    atual = pd.DataFrame({'NUMERO_CAIXA': numeros(df), 'HASH': hashes(df)}, index=df.index)
+    anterior = _anterior(uf)
+    por_numero = anterior.set_index('NUMERO_CAIXA')
+    comparado = atual.join(por_numero, on='NUMERO_CAIXA')
+
+    dias = current_app.config.get('RETRATO_VALIDADE_DIAS', VALIDADE_DIAS)
+    corte = datetime.utcnow() - timedelta(days=dias)
+    conhecido = comparado['HASH_ANTERIOR'].notna()
+    igual = conhecido & (comparado['HASH'] == comparado['HASH_ANTERIOR'])
+    recente = pd.to_datetime(comparado['verificado_em']) >= corte
+    confiavel = (
+        comparado['NUMERO_CAIXA'].notna()
+        & ~comparado['NUMERO_CAIXA'].duplicated(keep=False)
+        & comparado['ativo'].fillna(False).astype(bool)
+        & ~comparado['NUMERO_CAIXA'].isin(_pendentes(uf))
+    )
+    inalterado = igual & recente & confiavel & (not completo)
+
+    delta = df[~inalterado]
+    gravar = atual[~inalterado & atual['NUMERO_CAIXA'].notna()].drop_duplicates('NUMERO_CAIXA', keep='last')
+    removidos = sorted(set(anterior['NUMERO_CAIXA']) - set(atual['NUMERO_CAIXA'].dropna()))
+    contagens = {
+        'novas': int((~conhecido).sum()),
+        'alteradas': int((conhecido & ~igual).sum()),
+        'revalidadas': int((igual & ~inalterado).sum()),
+        'inalteradas': int(inalterado.sum()),
+        'removidas': len(removidos),
+    }
+    return {
+        'delta': delta,
+        'inalterados': comparado.loc[inalterado, 'NUMERO_CAIXA'].tolist(),
+        'removidos': removidos,
+        'gravar': [
+            {'UF': uf, 'NUMERO_CAIXA': numero, 'HASH': int(valor)}
+            for numero, valor in gravar[['NUMERO_CAIXA', 'HASH']].itertuples(index=False)
+        ],
+        'contagens': contagens,
+    }
+
+def atualizar(uf, resultado):
+    """
+    Grava o retrato depois que o delta foi sincronizado: hashes das linhas
+    raspadas (verificadas agora) e remoção das que saíram do CSV. As
+    inalteradas mantêm a data da última verificação. Faz commit.
+    """
+    agora = datetime.utcnow()
+    registros = [{**registro, 'verificado_em': agora} for registro in resultado['gravar']]
+    for inicio in range(0, len(registros), TAMANHO_LOTE):
+        db.session.execute(insert(RetratoCsv).prefix_with('OR REPLACE'), registros[inicio:inicio + TAMANHO_LOTE])
+    removidos = resultado['removidos']
+    for inicio in range(0, len(removidos), TAMANHO_LOTE):
+        db.session.execute(delete(RetratoCsv).where(
+            RetratoCsv.UF == uf, RetratoCsv.NUMERO_CAIXA.in_(removidos[inicio:inicio + TAMANHO_LOTE])
+        ))
+    db.session.commit()
+    logging.info(f"Retrato do CSV de {uf}: {len(registros)} linhas gravadas, {len(removidos)} removidas.")
@@ -1,15 +1,13 @@
-from flask import Blueprint, render_template, request, Response, jsonify, send_file
+from flask import Blueprint, current_app, render_template, request, Response, jsonify, send_file, stream_with_context
 import json
 import io
 import logging
 import os
-import pandas as pd
-from app import datalogic, scraper, db, create_app
-from app.planilha import formatar_planilha_excel
-from app.models import Imovel, Atualizacao
-from sqlalchemy import func
+from datetime import date, datetime, timedelta, timezone
+from app import analise, busca, buscas_salvas, cache, datalogic, historico, metricas, pipeline, respostas, tarefas, db
+from app.models import Imovel, Atualizacao, BuscaSalva, Execucao, Tarefa, converter_data
+from sqlalchemy import func, literal, literal_column
 from werkzeug.utils import secure_filename
-from converter import convert_excel_to_db
 
 bp = Blueprint('main', __name__)
 
@@ -19,75 +17,79 @@ def dashboard():
 
 # --- ROTAS DE API PARA DADOS ---
 
+LIMITE_PAGINA_MAXIMO = 1000
+# Colunas ordenadas por outra: a data em texto 'dd/mm/aaaa' pela coluna de data.
+ORDENAR_POR = {'DATA_DISPUTA': 'DATA_DISPUTA_DT'}
+
+def _ordenacao(coluna, direcao):
+    """ORDER BY de ?ordenar=<coluna pública>&direcao=asc|desc, ou None."""
+    coluna = ORDENAR_POR.get(coluna, coluna)
+    if coluna not in Imovel.colunas_publicas() and coluna not in ORDENAR_POR.values():
+        return None
+    atributo = getattr(Imovel, coluna)
+    return atributo.desc() if direcao.lower() == 'desc' else atributo.asc()
+
 @bp.route('/api/data')
+@cache.resposta_versionada
 def api_data():
     try:
         query = db.session.query(Imovel, Atualizacao.ChangedFields).outerjoin(
             Atualizacao,
             db.and_(Imovel.UF == Atualizacao.UF, Imovel.MATRICULA == Atualizacao.MATRICULA)
         )
-        status_filter = request.args.get('status', '').strip()
-        if status_filter == 'Ativos':
-            query = query.filter(Imovel.Status.in_(['Novo', 'Existente', 'Atualizado']))
-        elif status_filter == 'Apenas Novos':
-            query = query.filter(Imovel.Status == 'Novo')
-        elif status_filter == 'Apenas Atualizados':
-            query = query.filter(Imovel.Status == 'Atualizado')
-        elif status_filter == 'Expirado':
-            query = query.filter(Imovel.Status == 'Expirado')
+        limite = request.args.get('limit', type=int)
+        query = query.filter(*datalogic.filtros_imoveis(request.args, paginando=limite is not None))
 
-        filtros = {
-            'uf': 'UF',
-            'cidade': 'CIDADE',
-            'bairro': 'BAIRRO',
-            'tipo': 'TIPO',
-            'modalidade': 'MODALIDADE',
-            'fgts': 'FGTS',
-            'financiamento': 'FINANCIAMENTO'
-        }
+        relevancia = None
+        termo_busca = request.args.get('q', '').strip()
+        if termo_busca:
+            query, relevancia = busca.filtrar_por_texto(query, termo_busca)
 
-        for param, column_name in filtros.items():
-            valor = request.args.get(param, '').strip()
-            if valor:
-                coluna = getattr(Imovel, column_name)
-                query = query.filter(func.upper(func.trim(coluna)) == valor.upper())
+        # Paginação opcional (?limit=&offset=, usada pela tabela virtual do
+        # dashboard): a primeira página traz o total no formato colunar.
+        deslocamento = max(request.args.get('offset', 0, type=int), 0)
+        total = None
+        if limite is not None:
+            limite = max(1, min(limite, LIMITE_PAGINA_MAXIMO))
+            if deslocamento == 0:
+                contagem = db.session.query(func.count()).select_from(Imovel).filter(*datalogic.filtros_imoveis(request.args))
+                if termo_busca:
+                    contagem, _ = busca.filtrar_por_texto(contagem, termo_busca)
+                total = contagem.scalar()
 
-        try:
-            preco_min_str = request.args.get('preco_min', '').strip()
-            if preco_min_str:
-                preco_min = float(preco_min_str)
-                query = query.filter(Imovel.PRECO >= preco_min)
-        except (ValueError, TypeError):
-            pass
+        direcao = request.args.get('direcao', '').strip()
+        ordem = _ordenacao(request.args.get('ordenar', '').strip(), direcao)
+        if relevancia is not None and ordem is None:
+            query = query.order_by(relevancia.asc(), Imovel.PRECO.asc())
+        else:
+            query = query.order_by(ordem if ordem is not None else Imovel.PRECO.asc())
+        if limite is not None:
+            # Desempate pelo rowid, para as páginas não repetirem nem pularem
+            # linhas: ele é a última coluna de todo índice, então a ordem
+            # (preço, rowid) sai pronta dos índices de preço.
+            rowid = literal_column('imoveis.rowid')
+            query = query.order_by(rowid.desc() if ordem is not None and direcao.lower() == 'desc' else rowid.asc())
+            query = query.limit(limite).offset(deslocamento)
 
-        try:
-            preco_max_str = request.args.get('preco_max', '').strip()
-            if preco_max_str:
-                preco_max = float(preco_max_str)
-                query = query.filter(Imovel.PRECO <= preco_max)
-        except (ValueError, TypeError):
-            pass
-
-        data_inicio = request.args.get('data_inicio', '').strip()
-        data_fim = request.args.get('data_fim', '').strip()
-        if data_inicio:
-            query = query.filter(Imovel.DATA_DISPUTA >= data_inicio)
-        if data_fim:
-            query = query.filter(Imovel.DATA_DISPUTA <= data_fim)
-
-        results = query.order_by(Imovel.PRECO.asc()).all()
-        imoveis_list = []
-        for imovel, changed_fields in results:
-            imovel_dict = imovel.to_dict()
-            imovel_dict['ChangedFields'] = changed_fields or ""
-            imoveis_list.append(imovel_dict)
-
-        return jsonify(imoveis_list)
+        # Seleciona só as colunas (sem instanciar objetos ORM) e serializa direto
+        # no formato pedido: lista de dicts ou colunar (?formato=colunar).
+        colunas = Imovel.colunas_publicas()
+        linhas = query.with_entities(
+            *[getattr(Imovel, coluna) for coluna in colunas], Atualizacao.ChangedFields
+        ).all()
+        colunas.append('ChangedFields')
+        padroes = {coluna: Imovel.valor_padrao(coluna) for coluna in colunas}
+        registros = respostas.montar_registros(linhas, colunas, padroes)
+        if total is not None and isinstance(registros, dict):
+            registros['total'] = total
+        return jsonify(registros)
     except Exception as e:
         logging.error(f"Erro na API de dados: {e}", exc_info=True)
+        cache.nao_armazenar()
         return jsonify([])
 
 @bp.route('/api/summary')
+@cache.resposta_versionada
 def api_summary():
     try:
         return jsonify({
@@ -96,70 +98,65 @@ def api_summary():
         })
     except Exception as e:
         logging.error(f"Erro ao obter resumo: {e}", exc_info=True)
+        cache.nao_armazenar()
         return jsonify({
             'stats': {'total_imoveis': 0, 'novos_imoveis': 0, 'atualizados': 0, 'expirados': 0, 'ativos': 0, 'media_preco': 0},
             'uf_summary': []
         })
 
 @bp.route('/api/filters')
+@cache.resposta_versionada
 def api_filters():
     try:
         filters_data = datalogic.get_filter_options()
-        preco_stats = db.session.query(
-            func.min(Imovel.PRECO),
-            func.max(Imovel.PRECO)
-        ).filter(Imovel.PRECO > 0).first()
+        preco_min, preco_max = datalogic.get_faixa_preco()
         filters_data['preco_range'] = {
-            'min': float(preco_stats[0] or 0),
-            'max': float(preco_stats[1] or 1000000)
+            'min': float(preco_min or 0),
+            'max': float(preco_max or 1000000)
         }
         return jsonify(filters_data)
     except Exception as e:
         logging.error(f"Erro ao obter filtros: {e}", exc_info=True)
+        cache.nao_armazenar()
         return jsonify({'ufs': [], 'cidades': [], 'tipos': [], 'modalidades': [], 'preco_range': {'min': 0, 'max': 1000000}})
 
 @bp.route('/api/distinct_ufs')
+@cache.resposta_versionada
 def api_distinct_ufs():
     try:
         return jsonify(datalogic.get_distinct_ufs_from_db())
     except Exception as e:
         logging.error(f"Erro ao obter UFs: {e}", exc_info=True)
+        cache.nao_armazenar()
         return jsonify([])
 
 @bp.route('/api/cidades_por_uf')
+@cache.resposta_versionada
 def api_cidades_por_uf():
     try:
         uf = request.args.get('uf', '').strip()
         if not uf:
             return jsonify([])
-        normalized_city = func.upper(func.trim(Imovel.CIDADE))
-        query = db.session.query(normalized_city).distinct().filter(Imovel.UF.ilike(uf))
-        query = query.filter(Imovel.CIDADE.isnot(None) & (func.trim(Imovel.CIDADE) != ''))
-        cidades = [r[0] for r in query.order_by(normalized_city).all()]
-        return jsonify(cidades)
+        return jsonify(datalogic.get_cidades_por_uf(uf))
     except Exception as e:
         logging.error(f"Erro ao obter cidades: {e}", exc_info=True)
+        cache.nao_armazenar()
         return jsonify([])
 
 @bp.route('/api/bairros_por_cidade')
+@cache.resposta_versionada
 def api_bairros_por_cidade():
     try:
-        normalized_bairro = func.upper(func.trim(Imovel.BAIRRO))
-        query = db.session.query(normalized_bairro).distinct()
-        cidade = request.args.get('cidade', '').strip()
-        if cidade:
-            query = query.filter(func.upper(func.trim(Imovel.CIDADE)).ilike(cidade))
-        uf = request.args.get('uf', '').strip()
-        if uf:
-            query = query.filter(Imovel.UF.ilike(uf))
-        query = query.filter(Imovel.BAIRRO.isnot(None) & (func.trim(Imovel.BAIRRO) != ''))
-        bairros = [r[0] for r in query.order_by(normalized_bairro).all()]
-        return jsonify(bairros)
+        return jsonify(datalogic.get_bairros_por_cidade(
+            request.args.get('cidade', '').strip(), request.args.get('uf', '').strip()
+        ))
     except Exception as e:
         logging.error(f"Erro ao obter bairros: {e}", exc_info=True)
+        cache.nao_armazenar()
         return jsonify([])
 
 @bp.route('/api/imoveis_baratos')
+@cache.resposta_versionada
 def api_imoveis_baratos():
     try:
         filtros = {
@@ -175,24 +172,237 @@ def api_imoveis_baratos():
             'status': request.args.get('status', 'Ativos').strip()
         }
         filtros_ativos = {k: v for k, v in filtros.items() if v}
-        imoveis = datalogic.get_imoveis_abaixo_de_100k(filtros=filtros_ativos)
-        return jsonify(imoveis)
+        imoveis = datalogic.get_imoveis_abaixo_de_100k(filtros=filtros_ativos, limite=request.args.get('limite', type=int))
+        return jsonify(respostas.registros_de_dicts(imoveis, Imovel.colunas_publicas()))
     except Exception as e:
         logging.error(f"Erro ao obter imóveis baratos: {e}", exc_info=True)
+        cache.nao_armazenar()
+        return jsonify([])
+
+@bp.route('/api/melhores_ofertas')
+@cache.resposta_versionada
+def api_melhores_ofertas():
+    """Imóveis mais baratos que a mediana de preço/m² do bairro (ou cidade), maior score primeiro."""
+    try:
+        imoveis = analise.get_melhores_ofertas(
+            uf=request.args.get('uf', '').strip() or None,
+            cidade=request.args.get('cidade', '').strip() or None,
+            tipo=request.args.get('tipo', '').strip() or None,
+            score_minimo=request.args.get('score_min', type=float),
+            limite=min(request.args.get('limite', 100, type=int), 1000)
+        )
+        colunas = Imovel.colunas_publicas()
+        linhas = [[getattr(imovel, coluna) for coluna in colunas] for imovel in imoveis]
+        padroes = {coluna: Imovel.valor_padrao(coluna) for coluna in colunas}
+        return jsonify(respostas.montar_registros(linhas, colunas, padroes))
+    except Exception as e:
+        logging.error(f"Erro ao obter melhores ofertas: {e}", exc_info=True)
+        cache.nao_armazenar()
+        return jsonify([])
+
+@bp.route('/api/estatisticas_regiao')
+@cache.resposta_versionada
+def api_estatisticas_regiao():
+    """Mediana e IQR do preço/m² por cidade e bairro."""
+    try:
+        return jsonify(analise.get_estatisticas_regiao(
+            uf=request.args.get('uf', '').strip() or None,
+            cidade=request.args.get('cidade', '').strip() or None,
+            nivel=request.args.get('nivel', '').strip() or None
+        ))
+    except Exception as e:
+        logging.error(f"Erro ao obter estatísticas por região: {e}", exc_info=True)
+        cache.nao_armazenar()
+        return jsonify([])
+
+@bp.route('/api/agenda')
+def api_agenda():
+    """
+    Próximas disputas agrupadas por dia e UF: ?inicio=aaaa-mm-dd (padrão: hoje),
+    ?dias=7 (até 90), ?uf=SP e ?detalhes=1 para listar os imóveis. Sem cache de
+    resposta, porque o padrão de 'inicio' muda a cada dia.
+    """
+    try:
+        texto_inicio = request.args.get('inicio', '').strip()
+        inicio = converter_data(texto_inicio) if texto_inicio else date.today()
+        if inicio is None:
+            return jsonify({'error': f"Data inválida: '{texto_inicio}'. Use aaaa-mm-dd ou dd/mm/aaaa."}), 400
+        dias = max(1, min(request.args.get('dias', 7, type=int), 90))
+        return jsonify(datalogic.get_agenda(
+            inicio, inicio + timedelta(days=dias - 1),
+            uf=request.args.get('uf', '').strip() or None,
+            detalhes=request.args.get('detalhes') in ('1', 'true'),
+            limite=min(request.args.get('limite', 500, type=int), 5000)
+        ))
+    except Exception as e:
+        logging.error(f"Erro ao obter agenda de disputas: {e}", exc_info=True)
+        return jsonify({'inicio': None, 'fim': None, 'total': 0, 'dias': []})
+
+# --- ROTA DE API INCREMENTAL (DELTA) ---
+
+def _parse_since(valor):
+    """Aceita um id de execução ou um timestamp ISO 8601; devolve datetime UTC sem fuso."""
+    if valor.isdigit():
+        execucao = db.session.get(Execucao, int(valor))
+        if not execucao:
+            raise ValueError(f"Execução {valor} não encontrada.")
+        return execucao.iniciado_em
+    momento = datetime.fromisoformat(valor.replace('Z', '+00:00'))
+    if momento.tzinfo is not None:
+        momento = momento.astimezone(timezone.utc).replace(tzinfo=None)
+    return momento
+
+@bp.route('/api/changes')
+def api_changes():
+    """
+    Stream NDJSON dos imóveis inseridos, atualizados ou expirados desde
+    'since' (timestamp ou id de execução), seguidos dos apagados pela mescla
+    de duplicados (op 'deleted', só UF, MATRICULA e updated_at). A última
+    linha é um checkpoint com o 'since' a usar na próxima consulta.
+    """
+    since_param = request.args.get('since', '').strip()
+    if not since_param:
+        return jsonify({'success': False, 'message': "Parâmetro 'since' é obrigatório."}), 400
+    try:
+        desde = _parse_since(since_param)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': f"Parâmetro 'since' inválido: {e}"}), 400
+
+    # updated_at é gravado pelo SQLite (CURRENT_TIMESTAMP, precisão de segundos);
+    # comparar com o mesmo formato de texto mantém o uso do índice e inclui o segundo inicial.
+    query = Imovel.query.filter(Imovel.updated_at >= literal(desde.strftime('%Y-%m-%d %H:%M:%S'), db.String))
+    uf = request.args.get('uf', '').strip()
+    if uf:
+        query = query.filter(Imovel.UF == uf.upper())
+    query = query.order_by(Imovel.updated_at.asc())
+
+    operacoes = {'Novo': 'inserted', 'Expirado': 'expired'}
+
+    def generate():
+        ultimo = desde
+        total = 0
+        for imovel in query.yield_per(1000):
+            registro = imovel.to_dict()
+            registro['op'] = operacoes.get(imovel.Status, 'updated')
+            registro['updated_at'] = imovel.updated_at.isoformat() if imovel.updated_at else None
+            if imovel.updated_at and imovel.updated_at > ultimo:
+                ultimo = imovel.updated_at
+            total += 1
+            yield json.dumps(registro, ensure_ascii=False) + '\n'
+        for uf_removido, matricula, removido_em in historico.remocoes_desde(desde, uf or None):
+            if removido_em > ultimo:
+                ultimo = removido_em
+            total += 1
+            yield json.dumps({
+                'op': 'deleted', 'UF': uf_removido, 'MATRICULA': matricula, 'updated_at': removido_em.isoformat()
+            }, ensure_ascii=False) + '\n'
+        yield json.dumps({'op': 'checkpoint', 'since': ultimo.isoformat(), 'count': total}) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+# --- ROTAS DE API PARA HISTÓRICO ---
+
+@bp.route('/api/historico/<uf>/<matricula>')
+def api_historico_imovel(uf, matricula):
+    """Linha do tempo de preço/status de um imóvel."""
+    try:
+        return jsonify(historico.get_linha_do_tempo(uf.strip().upper(), matricula.strip()))
+    except Exception as e:
+        logging.error(f"Erro ao obter histórico de {uf}-{matricula}: {e}", exc_info=True)
+        return jsonify([])
+
+@bp.route('/api/historico/quedas_preco')
+def api_quedas_preco():
+    """Reduções de preço recentes, maiores quedas primeiro."""
+    try:
+        uf = request.args.get('uf', '').strip()
+        dias = request.args.get('dias', 30, type=int)
+        limite = request.args.get('limite', 200, type=int)
+        return jsonify(historico.get_quedas_preco(uf=uf or None, dias=dias, limite=limite))
+    except Exception as e:
+        logging.error(f"Erro ao obter quedas de preço: {e}", exc_info=True)
         return jsonify([])
 
+# --- ROTAS DE API PARA BUSCAS SALVAS ---
+
+@bp.route('/api/saved', methods=['GET', 'POST'])
+def api_saved():
+    """
+    GET: buscas salvas, com total de imóveis e novos desde a última consulta.
+    POST {"nome": ..., "filtros": {parâmetro de /api/data: valor}}: salva uma busca.
+    """
+    if request.method == 'GET':
+        try:
+            return jsonify(buscas_salvas.listar())
+        except Exception as e:
+            logging.error(f"Erro ao listar buscas salvas: {e}", exc_info=True)
+            return jsonify([])
+
+    dados = request.get_json(silent=True) or {}
+    nome = str(dados.get('nome') or '').strip()
+    if not nome:
+        return jsonify({'success': False, 'message': "Campo 'nome' é obrigatório."}), 400
+    try:
+        busca_salva = buscas_salvas.criar(nome, dados.get('filtros') or {})
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Erro ao salvar busca: {e}", exc_info=True)
+        return jsonify({'success': False, 'message': f'Erro ao salvar busca: {str(e)}'}), 500
+    return jsonify({'success': True, 'busca': busca_salva.to_dict()}), 201
+
+@bp.route('/api/saved/<int:busca_id>', methods=['GET', 'DELETE'])
+def api_saved_busca(busca_id):
+    """
+    GET: imóveis que atendem a busca (mais recentes primeiro; ?limit=&offset=
+    opcionais) e, em 'novos', os encontrados desde a consulta anterior. A
+    consulta marca a busca como vista, a menos que venha ?marcar=0.
+    DELETE: apaga a busca.
+    """
+    if request.method == 'DELETE':
+        if not buscas_salvas.remover(busca_id):
+            return jsonify({'success': False, 'message': 'Busca não encontrada.'}), 404
+        return jsonify({'success': True})
+
+    busca_salva = db.session.get(BuscaSalva, busca_id)
+    if busca_salva is None:
+        return jsonify({'success': False, 'message': 'Busca não encontrada.'}), 404
+    try:
+        limite = request.args.get('limit', type=int)
+        if limite is not None:
+            limite = max(1, min(limite, LIMITE_PAGINA_MAXIMO))
+        deslocamento = max(request.args.get('offset', 0, type=int), 0)
+        colunas = Imovel.colunas_publicas() + ['encontrado_em']
+        padroes = {coluna: Imovel.valor_padrao(coluna) for coluna in colunas}
+        resposta = {
+            'busca': busca_salva.to_dict(),
+            'total': buscas_salvas.contar(busca_salva),
+            'imoveis': respostas.montar_registros(buscas_salvas.resultados(busca_salva, limite, deslocamento), colunas, padroes),
+            'novos': respostas.montar_registros(buscas_salvas.resultados(busca_salva, novos=True), colunas, padroes),
+        }
+        if request.args.get('marcar') not in ('0', 'false'):
+            buscas_salvas.marcar_visualizada(busca_salva)
+        return jsonify(resposta)
+    except Exception as e:
+        logging.error(f"Erro ao obter busca salva {busca_id}: {e}", exc_info=True)
+        return jsonify({'success': False, 'message': f'Erro ao obter busca: {str(e)}'}), 500
+
 # --- NOVAS ROTAS DE API PARA FILTROS ESPECÍFICOS ---
 
 @bp.route('/api/comparacao/ufs')
+@cache.resposta_versionada
 def api_comparacao_ufs():
     """Retorna apenas UFs que têm imóveis para comparação."""
     try:
         return jsonify(datalogic.get_comparable_ufs())
     except Exception as e:
         logging.error(f"Erro ao obter UFs de comparação: {e}", exc_info=True)
+        cache.nao_armazenar()
         return jsonify([])
 
 @bp.route('/api/comparacao/cidades')
+@cache.resposta_versionada
 def api_comparacao_cidades():
     """Retorna cidades de uma UF que têm imóveis para comparação."""
     try:
@@ -200,9 +410,11 @@ def api_comparacao_cidades():
         return jsonify(datalogic.get_comparable_cidades(uf))
     except Exception as e:
         logging.error(f"Erro ao obter Cidades de comparação: {e}", exc_info=True)
+        cache.nao_armazenar()
         return jsonify([])
 
 @bp.route('/api/comparacao/bairros')
+@cache.resposta_versionada
 def api_comparacao_bairros():
     """Retorna bairros de uma Cidade/UF que têm imóveis para comparação."""
     try:
@@ -211,9 +423,11 @@ def api_comparacao_bairros():
         return jsonify(datalogic.get_comparable_bairros(uf, cidade))
     except Exception as e:
         logging.error(f"Erro ao obter Bairros de comparação: {e}", exc_info=True)
+        cache.nao_armazenar()
         return jsonify([])
 
 @bp.route('/api/baratos/filters')
+@cache.resposta_versionada
 def api_baratos_filters():
     """Retorna UFs, Cidades e Bairros que possuem imóveis abaixo de 100k."""
     try:
@@ -221,6 +435,7 @@ def api_baratos_filters():
         return jsonify(locations)
     except Exception as e:
         logging.error(f"Erro ao obter filtros de imóveis baratos: {e}", exc_info=True)
+        cache.nao_armazenar()
         return jsonify({})
 
 # --- ROTAS DAS PÁGINAS ---
@@ -245,50 +460,113 @@ def processar():
     estados = [uf.strip() for uf in request.args.get('estados', '').split(',') if uf.strip()]
     if not estados:
         return Response(f"data: {json.dumps({'type': 'error', 'message': 'Nenhum estado selecionado.'})}\n\n", mimetype='text/event-stream')
-    app = create_app()
+    workers = current_app.config.get('RASPAGEM_WORKERS', 1)
+    tarefas_ids = [tarefas.submeter(estado, workers=workers) for estado in estados]
+    app = current_app._get_current_object()
     def generate_events():
         total_estados = len(estados)
         with app.app_context():
-            total_imoveis_geral = db.session.query(Imovel).count()
-        yield f"data: {json.dumps({'type': 'start', 'total_states': total_estados, 'total_properties': total_imoveis_geral})}\n\n"
-        for i, estado in enumerate(estados):
-            try:
-                yield f"data: {json.dumps({'type': 'state_start', 'state': estado, 'current_state': i + 1, 'total_states': total_estados})}\n\n"
-                for event in scraper.baixar_listas_por_estados([estado]):
-                    yield f"data: {json.dumps(event)}\n\n"
-                caminho_arquivo = os.path.join('temporarios', f'{estado}.csv')
-                if not os.path.exists(caminho_arquivo):
-                    raise FileNotFoundError(f"Arquivo CSV para {estado} não foi encontrado.")
-                scraped_data = []
-                for event in scraper.processar_arquivos_csv([caminho_arquivo]):
+            yield f"data: {json.dumps({'type': 'start', 'total_states': total_estados, 'total_properties': pipeline.contar_imoveis(), 'jobs': tarefas_ids})}\n\n"
+            for i, (estado, tarefa_id) in enumerate(zip(estados, tarefas_ids)):
+                yield f"data: {json.dumps({'type': 'state_start', 'state': estado, 'current_state': i + 1, 'total_states': total_estados, 'job': tarefa_id})}\n\n"
+                for event in tarefas.acompanhar(tarefa_id):
+                    if event is None:
+                        yield ": keep-alive\n\n"
+                        continue
+                    if event.get('type') == 'state_completed':
+                        event = dict(event, current_state=i + 1, total_states=total_estados)
                     yield f"data: {json.dumps(event)}\n\n"
-                    if event.get('type') == 'scraping_done':
-                        scraped_data = event.get('data', [])
-                yield f"data: {json.dumps({'type': 'db_start', 'state': estado, 'message': f'Iniciando salvamento de {len(scraped_data)} itens de {estado} no banco...'})}\n\n"
-                if scraped_data:
-                    total_items = len(scraped_data)
-                    yield f"data: {json.dumps({'type': 'db_progress', 'state': estado, 'current': 0, 'total': total_items, 'message': f'Processando dados de {estado}...'})}\n\n"
-                    datalogic.process_scraped_data(scraped_data)
-                    yield f"data: {json.dumps({'type': 'db_progress', 'state': estado, 'current': total_items, 'total': total_items, 'message': f'Salvamento de {estado} concluído'})}\n\n"
-                with app.app_context():
-                    total_imoveis_geral = db.session.query(Imovel).count()
-                    novos_estado = db.session.query(Imovel).filter(Imovel.UF == estado, Imovel.Status == 'Novo').count()
-                    atualizados_estado = db.session.query(Imovel).filter(Imovel.UF == estado, Imovel.Status == 'Atualizado').count()
-                yield f"data: {json.dumps({'type': 'state_completed', 'state': estado, 'current_state': i + 1, 'total_states': total_estados, 'total_properties': total_imoveis_geral, 'result': {'new': novos_estado, 'updated': atualizados_estado, 'total_processed': len(scraped_data)}})}\n\n"
-            except Exception as e:
-                logging.error(f"Erro no processamento do estado {estado}: {e}", exc_info=True)
-                yield f"data: {json.dumps({'type': 'error', 'message': f'Erro ao processar {estado}: {str(e)}'})}\n\n"
-                continue
+            yield f"data: {json.dumps({'type': 'done', 'message': 'Processo finalizado com sucesso!', 'total_properties': pipeline.contar_imoveis()})}\n\n"
+    response = Response(generate_events(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@bp.route('/api/tarefas')
+def api_tarefas():
+    """Jobs de raspagem mais recentes, do mais novo para o mais antigo."""
+    try:
+        return jsonify(tarefas.listar(limite=request.args.get('limite', 50, type=int)))
+    except Exception as e:
+        logging.error(f"Erro ao listar tarefas: {e}", exc_info=True)
+        return jsonify([])
+
+@bp.route('/api/tarefas/<int:tarefa_id>')
+def api_tarefa(tarefa_id):
+    tarefa = db.session.get(Tarefa, tarefa_id)
+    if tarefa is None:
+        return jsonify({'success': False, 'message': 'Tarefa não encontrada.'}), 404
+    return jsonify(tarefa.to_dict())
+
+@bp.route('/api/tarefas/<int:tarefa_id>/eventos')
+def api_tarefa_eventos(tarefa_id):
+    """SSE com o progresso de um job; vários clientes podem assinar o mesmo job."""
+    if db.session.get(Tarefa, tarefa_id) is None:
+        return jsonify({'success': False, 'message': 'Tarefa não encontrada.'}), 404
+    app = current_app._get_current_object()
+    def generate_events():
         with app.app_context():
-            total_imoveis_geral = db.session.query(Imovel).count()
-        yield f"data: {json.dumps({'type': 'done', 'message': 'Processo finalizado com sucesso!', 'total_properties': total_imoveis_geral})}\n\n"
+            for event in tarefas.acompanhar(tarefa_id):
+                if event is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"data: {json.dumps(event)}\n\n"
     response = Response(generate_events(), mimetype='text/event-stream')
     response.headers['Cache-Control'] = 'no-cache'
-    response.headers['Connection'] = 'keep-alive'
+    response.headers['X-Accel-Buffering'] = 'no'
     return response
 
+@bp.route('/api/execucoes')
+def api_execucoes():
+    """Execuções mais recentes com o resumo de métricas de cada uma."""
+    try:
+        limite = request.args.get('limite', 50, type=int)
+        execucoes = Execucao.query.order_by(Execucao.id.desc()).limit(limite).all()
+        return jsonify([execucao.to_dict() for execucao in execucoes])
+    except Exception as e:
+        logging.error(f"Erro ao listar execuções: {e}", exc_info=True)
+        return jsonify([])
+
+@bp.route('/metrics')
+def metrics():
+    """Métricas do processo no formato texto do Prometheus."""
+    return Response(metricas.exportar_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@bp.route('/health')
+def health():
+    """Verificação de saúde para monitoramento e balanceadores: 200 se o banco responde, 503 se não."""
+    try:
+        db.session.execute(db.text('SELECT 1'))
+        return jsonify({'status': 'ok', 'banco': 'ok', 'versao_dados': cache.versao_atual()})
+    except Exception as e:
+        logging.error(f"Falha na verificação de saúde: {e}", exc_info=True)
+        return jsonify({'status': 'erro', 'banco': 'indisponível'}), 503
+
+def _agendar_enriquecimento(estados=None):
+    """Agenda um job de enriquecimento por UF com imóveis sem os dados da página de detalhe."""
+    from app import reprocessamento
+
+    ufs = reprocessamento.ufs_incompletas()
+    if estados:
+        ufs = [uf for uf in ufs if uf in estados]
+    workers = current_app.config.get('ENRIQUECIMENTO_WORKERS', reprocessamento.WORKERS_ENRIQUECIMENTO)
+    return [{'state': uf, 'job': tarefas.submeter(uf, workers=workers, tipo='enriquecimento')} for uf in ufs]
+
+@bp.route('/api/enriquecer', methods=['POST'])
+def api_enriquecer():
+    """Busca as páginas de detalhe dos imóveis importados por planilha (opcional: ?estados=SP,RJ)."""
+    try:
+        estados = [uf.strip().upper() for uf in request.args.get('estados', '').split(',') if uf.strip()]
+        jobs = _agendar_enriquecimento(estados or None)
+        return jsonify({'success': True, 'message': f'{len(jobs)} estados agendados para enriquecimento.', 'jobs': jobs})
+    except Exception as e:
+        logging.error(f"Erro ao agendar enriquecimento: {e}", exc_info=True)
+        return jsonify({'success': False, 'message': f'Erro ao agendar enriquecimento: {str(e)}'}), 500
+
 @bp.route('/upload_excel', methods=['POST'])
 def upload_excel():
+    from converter import convert_excel_to_db
+
     try:
         files = request.files.getlist('files')
         if not files or all(f.filename == '' for f in files):
@@ -314,13 +592,18 @@ def upload_excel():
                             pass
         success_count = sum(1 for r in results if r['success'])
         total_count = len(results)
-        return jsonify({'success': success_count == total_count, 'message': f'Processados {success_count}/{total_count} arquivos com sucesso.', 'results': results})
+        resposta = {'success': success_count == total_count, 'message': f'Processados {success_count}/{total_count} arquivos com sucesso.', 'results': results}
+        if success_count and request.form.get('enriquecer') in ('1', 'true', 'on'):
+            resposta['jobs'] = _agendar_enriquecimento()
+        return jsonify(resposta)
     except Exception as e:
         logging.error(f"Erro no upload de Excel: {e}", exc_info=True)
         return jsonify({'success': False, 'message': f'Erro no upload: {str(e)}'}), 500
 
 @bp.route('/export/xlsx-hyperlink')
 def export_xlsx_hyperlink():
+    from app.planilha import formatar_planilha_excel
+
     try:
         estados_param = request.args.get('estados', '').strip()
         estados = [uf.strip().upper() for uf in estados_param.split(',') if uf.strip()] if estados_param else []
@@ -328,8 +611,9 @@ def export_xlsx_hyperlink():
         df = datalogic.get_imoveis_for_export(estados)
         if df.empty:
             logging.warning("Nenhum dado encontrado para exportação")
+        resumos = datalogic.get_resumos_exportacao(estados) if not df.empty else None
         buffer = io.BytesIO()
-        formatar_planilha_excel(df, buffer)
+        formatar_planilha_excel(df, buffer, resumos)
         buffer.seek(0)
         if estados:
             download_name = f'imoveis_{"_".join(estados[:3])}.xlsx'
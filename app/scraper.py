@@ -2,27 +2,110 @@ import pandas as pd
 import requests
 from bs4 import BeautifulSoup
 import time, os, glob, logging, re
-import unidecode
 import hashlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from app import cliente_http, identidade, limitador, metricas
+from app.models import converter_data
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 PASTA_TEMPORARIOS = 'temporarios'
-HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
+# CAIXA_BASE_URL aponta o download das listas para outro servidor (ex.: benchmarks/simulador.py).
+URL_BASE = os.environ.get('CAIXA_BASE_URL', 'https://venda-imoveis.caixa.gov.br').rstrip('/')
+STATUS_REPETIVEIS = {429, 500, 502, 503, 504}
+TENTATIVAS_DETALHE = 3
+TENTATIVAS_DOWNLOAD = 3
+ESPERA_MAXIMA_DISJUNTOR = 600
+# Linhas por evento 'batch' de processar_arquivos_csv: limita a memória da raspagem.
+TAMANHO_LOTE = 500
+# Campos que só vêm da página de detalhe: se ela falhar, o valor guardado no banco é mantido.
+CAMPOS_PAGINA_DETALHE = ['FGTS', 'FINANCIAMENTO', 'CONDOMINIO', 'DATA_DISPUTA']
+# Datas e preços das duas rodadas de leilão; PRECO e DATA_DISPUTA ficam com a mais barata.
+CAMPOS_LEILAO = ['DATA_LEILAO_1', 'PRECO_LEILAO_1', 'DATA_LEILAO_2', 'PRECO_LEILAO_2']
+# Tempo máximo de leitura (s); a conexão tem o seu (cliente_http.TIMEOUT_CONEXAO).
+TIMEOUT_DETALHE = 30
+TIMEOUT_DOWNLOAD = 300
 
-def _generate_address_initials(address):
-    if not isinstance(address, str) or not address.strip():
-        return ''
-    normalized_address = unidecode.unidecode(address).upper()
-    cleaned_address = re.sub(r'[^A-Z\s]', '', normalized_address)
-    words = cleaned_address.split()
-    initials = [word[0] for word in words if word]
-    return "".join(initials[:3])
+_limitador = limitador.LimitadorAdaptativo()
+_disjuntor = limitador.Disjuntor()
+
+class FalhaPagina:
+    """Marcador de página de detalhe que não pôde ser lida (avalia como falso)."""
+
+    def __init__(self, motivo):
+        self.motivo = motivo
+
+    def __bool__(self):
+        return False
+
+def campos_da_pagina(modalidade):
+    """Campos da linha que dependem da página de detalhe para esta modalidade."""
+    if modalidade and 'leilão' in str(modalidade).lower():
+        return CAMPOS_PAGINA_DETALHE + CAMPOS_LEILAO + ['PRECO', 'DESCONTO']
+    return CAMPOS_PAGINA_DETALHE
 
 def parse_valor(texto_valor):
     if not isinstance(texto_valor, str): return 0.0
     try: return float(texto_valor.upper().replace('R$', '').replace('.', '').replace(',', '.').strip())
     except (ValueError, TypeError): return 0.0
 
+def calcular_desconto(preco, avaliacao):
+    if pd.notna(preco) and pd.notna(avaliacao) and avaliacao > 0 and preco < avaliacao:
+        return f"{int((1 - preco / avaliacao) * 100)}%"
+    return "0%"
+
+def _retry_after(resposta):
+    try:
+        return float(resposta.headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+def _requisitar(url, timeout, tentativas, uf=None, histograma=None, usar_limitador=True):
+    """
+    GET com ritmo adaptativo, disjuntor e novas tentativas em 429/5xx/timeout.
+    Erros 4xx (exceto 429) não são repetidos. Lança a última falha. Sem
+    'usar_limitador' (download das listas) o limitador não dá o ritmo nem é
+    ajustado pela latência; o disjuntor continua valendo.
+    """
+    ultimo_erro = None
+    for tentativa in range(tentativas):
+        if tentativa:
+            metricas.TENTATIVAS_REPETIDAS.inc(uf=uf)
+        _disjuntor.aguardar(ESPERA_MAXIMA_DISJUNTOR)
+        if usar_limitador:
+            _limitador.aguardar_vez()
+        inicio = time.perf_counter()
+        try:
+            resposta = cliente_http.get(url, timeout, uf)
+        except (requests.Timeout, requests.ConnectionError) as e:
+            ultimo_erro = e
+            _disjuntor.registrar_falha()
+            if usar_limitador:
+                _limitador.reduzir()
+            continue
+        except Exception:
+            # Falha fora das previstas (ex.: ChunkedEncodingError, TooManyRedirects)
+            # também conta: se esta era a requisição de teste do disjuntor meio
+            # aberto, ele reabre em vez de esperar para sempre por um resultado.
+            _disjuntor.registrar_falha()
+            raise
+        latencia = time.perf_counter() - inicio
+        if histograma is not None:
+            histograma.observar(latencia, uf=uf)
+        if resposta.status_code in STATUS_REPETIVEIS:
+            ultimo_erro = requests.HTTPError(f"HTTP {resposta.status_code} em {url}", response=resposta)
+            _disjuntor.registrar_falha()
+            if usar_limitador:
+                _limitador.reduzir(_retry_after(resposta))
+            continue
+        _disjuntor.registrar_sucesso()
+        if usar_limitador:
+            _limitador.registrar_sucesso(latencia)
+        if resposta.status_code >= 400:
+            raise requests.HTTPError(f"HTTP {resposta.status_code} em {url}", response=resposta)
+        return resposta
+    raise ultimo_erro
+
 def limpar_pasta_temporarios():
     for f in glob.glob(os.path.join(PASTA_TEMPORARIOS, '*')):
         try: os.remove(f)
@@ -42,24 +125,25 @@ def baixar_listas_por_estados(estados):
 
     for estado in estados:
         yield {"type": "download_start", "state": estado, "message": f'Baixando lista de {estado}...'}
-        url_download = f"https://venda-imoveis.caixa.gov.br/listaweb/Lista_imoveis_{estado}.csv"
+        url_download = f"{URL_BASE}/listaweb/Lista_imoveis_{estado}.csv"
         try:
-            resposta = requests.get(url_download, headers=HEADERS, timeout=300)
-            resposta.raise_for_status()
+            with metricas.DOWNLOAD_SEGUNDOS.cronometrar(uf=estado):
+                resposta = _requisitar(url_download, TIMEOUT_DOWNLOAD, TENTATIVAS_DOWNLOAD, estado, usar_limitador=False)
+            metricas.DOWNLOAD_BYTES.inc(len(resposta.content), uf=estado)
             caminho_arquivo = os.path.join(PASTA_TEMPORARIOS, f'{estado}.csv')
             with open(caminho_arquivo, 'wb') as f:
                 f.write(resposta.content)
             yield {"type": "download_completed", "state": estado, "message": f"Download de {estado} concluído"}
-            time.sleep(1) 
-        except requests.RequestException as e:
+        except (requests.RequestException, limitador.CircuitoAberto) as e:
             yield {"type": "error", "message": f"Falha ao baixar lista de {estado}: {e}"}
 
-def extrair_dados_pagina_imovel(url_imovel, modalidade):
+def extrair_dados_pagina_imovel(url_imovel, modalidade, uf=None):
+    """Campos extraídos da página de detalhe, ou FalhaPagina se ela não pôde ser lida."""
     dados_extras = {}
     try:
-        time.sleep(0.2)
-        response = requests.get(url_imovel, headers=HEADERS, timeout=30)
-        response.raise_for_status()
+        response = _requisitar(url_imovel, TIMEOUT_DETALHE, TENTATIVAS_DETALHE, uf, metricas.PAGINA_SEGUNDOS)
+        metricas.PAGINA_BYTES.inc(len(response.content), uf=uf)
+        inicio_parse = time.perf_counter()
         soup = BeautifulSoup(response.content, 'html.parser')
         texto_pagina = soup.get_text(separator='\n', strip=True)
         texto_lower = texto_pagina.lower()
@@ -75,6 +159,10 @@ def extrair_dados_pagina_imovel(url_imovel, modalidade):
             price2_match = re.search(r'2º leilão[\s\S]*?R\$\s*([\d.,]+)', texto_pagina, re.IGNORECASE)
             date1_match = re.search(r'data do 1º leilão[\s\S]*?(\d{2}/\d{2}/\d{4})', texto_pagina, re.IGNORECASE)
             date2_match = re.search(r'data do 2º leilão[\s\S]*?(\d{2}/\d{2}/\d{4})', texto_pagina, re.IGNORECASE)
+            for rodada, preco_match, data_match in ((1, price1_match, date1_match), (2, price2_match, date2_match)):
+                if preco_match and data_match:
+                    dados_extras[f'PRECO_LEILAO_{rodada}'] = parse_valor(preco_match.group(1))
+                    dados_extras[f'DATA_LEILAO_{rodada}'] = converter_data(data_match.group(1))
 
             if price1_match and date1_match and price2_match and date2_match:
                 price1 = parse_valor(price1_match.group(1))
@@ -107,23 +195,116 @@ def extrair_dados_pagina_imovel(url_imovel, modalidade):
         dados_extras['FINANCIAMENTO'] = 'SIM' if 'permite financiamento' in texto_lower or 'com financiamento' in texto_lower else 'NÃO'
         dados_extras['FGTS'] = 'SIM' if 'permite utilização de fgts' in texto_lower or 'com utilização de fgts' in texto_lower else 'NÃO'
         
+        metricas.PARSE_MS.observar((time.perf_counter() - inicio_parse) * 1000, uf=uf)
+        metricas.PAGINAS.inc(uf=uf, resultado='ok')
         return dados_extras
         
-    except requests.RequestException as e:
+    except (requests.RequestException, limitador.CircuitoAberto) as e:
         logging.warning(f"Não foi possível acessar a página do imóvel {url_imovel}. Erro: {e}")
+        motivo = str(e)
     except Exception as e:
         logging.error(f"Erro inesperado ao processar a página {url_imovel}: {e}")
-    return dados_extras
+        motivo = f"Erro ao interpretar a página: {e}"
+    metricas.PAGINAS.inc(uf=uf, resultado='erro')
+    return FalhaPagina(motivo)
+
+def _montar_linha(row):
+    """Converte uma linha do CSV da Caixa no dicionário de um imóvel (sem a página de detalhe)."""
+    desc_texto = str(row.get('DESCRICAO', '')).lower()
+
+    descricao = row.get('DESCRICAO')
+    matricula_value = row.get('MATRICULA', '')
+    if isinstance(matricula_value, pd.Series):
+        matricula_value = matricula_value.iloc[0]
+
+    dados_linha = {
+        'UF': row.get('UF'), 'CIDADE': row.get('CIDADE'), 'BAIRRO': row.get('BAIRRO'),
+        'ENDERECO': row.get('ENDERECO'),
+        'DESCRICAO': str(descricao).strip() if pd.notna(descricao) else '',
+        'PRECO': parse_valor(row.get('PRECO')),
+        'AVALIACAO': parse_valor(row.get('AVALIACAO')), 'DESCONTO': row.get('DESCONTO'),
+        'MODALIDADE': row.get('MODALIDADE'), 'LINK': row.get('LINK'), 
+        'MATRICULA': str(matricula_value).strip() if pd.notna(matricula_value) else '',
+        'Status': 'Novo'
+    }
+    # Capturado antes da página de detalhe, que troca MATRICULA pela matrícula do cartório.
+    dados_linha['NUMERO_CAIXA'] = identidade.numero_caixa(dados_linha['LINK'], dados_linha['MATRICULA'] or None)
+    
+    if desc_texto:
+        dados_linha['TIPO'] = desc_texto.split(',')[0].strip().title()
+    else:
+        dados_linha['TIPO'] = next((t for t in ['casa', 'apartamento', 'terreno'] if t in desc_texto), 'Não especificado')
+    
+    if m := re.search(r'(\d+[.,]?\d*)\s*de área privativa', desc_texto):
+        area_priv = float(m.group(1).replace(',', '.'))
+        dados_linha['AREA_PRIVATIVA'] = f"{area_priv:.2f} m²".replace('.', ',')
+    else:
+        dados_linha['AREA_PRIVATIVA'] = ''
+        
+    if m := re.search(r'(\d+[.,]?\d*)\s*de área do terreno', desc_texto):
+        area_terr = float(m.group(1).replace(',', '.'))
+        dados_linha['AREA_DO_TERRENO'] = f"{area_terr:.2f} m²".replace('.', ',')
+    else:
+        dados_linha['AREA_DO_TERRENO'] = ''
+    
+    dados_linha['FGTS'] = 'NÃO'
+    dados_linha['FINANCIAMENTO'] = 'NÃO'
+    dados_linha['CONDOMINIO'] = ''
+    dados_linha['DATA_DISPUTA'] = ''
+    for campo in CAMPOS_LEILAO:
+        dados_linha[campo] = None
+    return dados_linha
+
+def _enriquecer_linha(dados_linha):
+    """Completa a linha com os dados da página de detalhe do imóvel."""
+    if pd.notna(dados_linha['LINK']):
+        extras = extrair_dados_pagina_imovel(dados_linha['LINK'], dados_linha['MODALIDADE'], dados_linha['UF'])
+        if isinstance(extras, FalhaPagina):
+            # Sem a página, os campos dela ficam com os padrões do CSV; a sincronização
+            # não os grava por cima dos valores já conhecidos e agenda nova tentativa.
+            dados_linha['FALHA_DETALHE'] = extras.motivo
+        elif extras:
+            for key, value in extras.items():
+                if value: 
+                    dados_linha[key] = value
+    return dados_linha
+
+def _finalizar_lote(linhas):
+    """Desconto e chaves de identidade de cada linha enriquecida."""
+    for linha in linhas:
+        linha['DESCONTO'] = calcular_desconto(linha.get('PRECO', 0), linha.get('AVALIACAO', 0))
+        linha['MATRICULA'] = identidade.gerar_id(linha['UF'], linha.get('MATRICULA') or '', linha.get('ENDERECO'))
+        linha['CHAVE_ENDERECO'] = identidade.chave_endereco(linha.get('ENDERECO'))
+    return linhas
+
+MAPEAMENTO_COLUNAS_CSV = {
+    'N° do imóvel': 'MATRICULA', 'Matrícula(s)': 'MATRICULA', 'UF': 'UF',
+    'Cidade': 'CIDADE', 'Bairro': 'BAIRRO', 'Endereço': 'ENDERECO',
+    'Preço': 'PRECO', 'Valor de avaliação': 'AVALIACAO', 'Desconto': 'DESCONTO',
+    'Descrição': 'DESCRICAO', 'Modalidade de venda': 'MODALIDADE', 'Link de acesso': 'LINK'
+}
 
-def processar_arquivos_csv(arquivos_csv=None):
+def ler_csv(arquivo):
+    """Lista da Caixa de um estado com as colunas já renomeadas (UF tirada do nome do arquivo)."""
+    df = pd.read_csv(arquivo, sep=';', encoding='latin-1', skiprows=2)
+    df['UF'] = os.path.basename(arquivo).replace('.csv', '')
+    df.columns = [col.strip() for col in df.columns]
+    df = df.rename(columns=MAPEAMENTO_COLUNAS_CSV)
+    colunas = [col for col in dict.fromkeys(MAPEAMENTO_COLUNAS_CSV.values()) if col in df.columns]
+    return df.loc[:, ~df.columns.duplicated()][colunas]
+
+def processar_arquivos_csv(arquivos_csv=None, max_workers=1, tamanho_lote=TAMANHO_LOTE):
+    """
+    Lê os CSVs, busca as páginas de detalhe e gera eventos de progresso e, a cada
+    'tamanho_lote' linhas, um evento 'batch' com as linhas prontas para sincronizar.
+    """
     if arquivos_csv is None:
         arquivos_csv = glob.glob(os.path.join(PASTA_TEMPORARIOS, '*.csv'))
 
     todos_dados = []
     for arquivo in arquivos_csv:
         try:
-            df = pd.read_csv(arquivo, sep=';', encoding='latin-1', skiprows=2)
-            df['UF'] = os.path.basename(arquivo).replace('.csv', '')
+            df = ler_csv(arquivo)
             todos_dados.append(df)
             
             estado = os.path.basename(arquivo).replace('.csv', '')
@@ -133,111 +314,61 @@ def processar_arquivos_csv(arquivos_csv=None):
             logging.error(f"Erro ao processar o arquivo {arquivo}: {e}")
             
     if not todos_dados:
-        yield {"type": "scraping_done", "message": "Nenhum dado para processar.", "data": []}
+        yield {"type": "scraping_done", "message": "Nenhum dado para processar.", "total": 0}
+        return
+
+    df_final = pd.concat(todos_dados, ignore_index=True)
+    del todos_dados
+    yield from processar_linhas(df_final, max_workers, tamanho_lote)
+
+def processar_linhas(df_final, max_workers=1, tamanho_lote=TAMANHO_LOTE):
+    """
+    Raspa as linhas de um DataFrame no formato de ler_csv. Só dois lotes ficam
+    em memória por vez: o que está sendo entregue e o próximo, cujas páginas já
+    são buscadas enquanto quem consome grava o anterior.
+    """
+    if df_final.empty:
+        yield {"type": "scraping_done", "message": "Nenhum dado para processar.", "total": 0}
         return
 
-    df_completo = pd.concat(todos_dados, ignore_index=True)
-    df_completo.columns = [col.strip() for col in df_completo.columns]
-    
-    mapeamento_colunas = {
-        'N° do imóvel': 'MATRICULA', 'Matrícula(s)': 'MATRICULA', 'UF': 'UF', 
-        'Cidade': 'CIDADE', 'Bairro': 'BAIRRO', 'Endereço': 'ENDERECO',
-        'Preço': 'PRECO', 'Valor de avaliação': 'AVALIACAO', 'Desconto': 'DESCONTO',
-        'Descrição': 'DESCRICAO', 'Modalidade de venda': 'MODALIDADE', 'Link de acesso': 'LINK'
-    }
-    
-    df_selecionado = df_completo.rename(columns=mapeamento_colunas)
-    colunas_necessarias = list(mapeamento_colunas.values())
-    df_final = df_selecionado[[col for col in colunas_necessarias if col in df_selecionado.columns]]
-    
-    dados_processados = []
     total_linhas = len(df_final)
-    
-    current_state = None
-    
-    for idx, row in df_final.iterrows():
-        estado_linha = row.get('UF', '')
-        if estado_linha != current_state:
-            current_state = estado_linha
-            state_processed = 0
-            state_total = len(df_final[df_final['UF'] == current_state])
-        
-        state_processed = len([r for r in dados_processados if r.get('UF') == current_state]) + 1
-        
-        yield {
-            "type": "state_progress", 
-            "state": current_state,
-            "current": state_processed,
-            "total": state_total,
-            "overall_current": idx + 1,
-            "overall_total": total_linhas,
-            "message": f"Processando {current_state}: {state_processed}/{state_total}"
-        }
-        
-        desc_texto = str(row.get('DESCRICAO', '')).lower()
-        
-        matricula_value = row.get('MATRICULA', '')
-        if isinstance(matricula_value, pd.Series):
-            matricula_value = matricula_value.iloc[0]
-
-        dados_linha = {
-            'UF': row.get('UF'), 'CIDADE': row.get('CIDADE'), 'BAIRRO': row.get('BAIRRO'),
-            'ENDERECO': row.get('ENDERECO'), 'PRECO': parse_valor(row.get('PRECO')),
-            'AVALIACAO': parse_valor(row.get('AVALIACAO')), 'DESCONTO': row.get('DESCONTO'),
-            'MODALIDADE': row.get('MODALIDADE'), 'LINK': row.get('LINK'), 
-            'MATRICULA': str(matricula_value).strip() if pd.notna(matricula_value) else '',
-            'Status': 'Novo'
-        }
-        
-        if desc_texto:
-            dados_linha['TIPO'] = desc_texto.split(',')[0].strip().title()
-        else:
-            dados_linha['TIPO'] = next((t for t in ['casa', 'apartamento', 'terreno'] if t in desc_texto), 'Não especificado')
-        
-        if m := re.search(r'(\d+[.,]?\d*)\s*de área privativa', desc_texto):
-            area_priv = float(m.group(1).replace(',', '.'))
-            dados_linha['AREA_PRIVATIVA'] = f"{area_priv:.2f} m²".replace('.', ',')
-        else:
-            dados_linha['AREA_PRIVATIVA'] = ''
-            
-        if m := re.search(r'(\d+[.,]?\d*)\s*de área do terreno', desc_texto):
-            area_terr = float(m.group(1).replace(',', '.'))
-            dados_linha['AREA_DO_TERRENO'] = f"{area_terr:.2f} m²".replace('.', ',')
-        else:
-            dados_linha['AREA_DO_TERRENO'] = ''
-        
-        dados_linha['FGTS'] = 'NÃO'
-        dados_linha['FINANCIAMENTO'] = 'NÃO'
-        dados_linha['CONDOMINIO'] = ''
-        dados_linha['DATA_DISPUTA'] = ''
-        
-        if pd.notna(dados_linha['LINK']):
-            if extras := extrair_dados_pagina_imovel(dados_linha['LINK'], dados_linha['MODALIDADE']):
-                for key, value in extras.items():
-                    if value: 
-                        dados_linha[key] = value
-        
-        dados_processados.append(dados_linha)
+    total_por_estado = Counter(df_final['UF'])
+    processados_por_estado = Counter()
+    tamanho_lote = max(1, tamanho_lote)
+    inicios = range(0, total_linhas, tamanho_lote)
 
-    df_final = pd.DataFrame(dados_processados)
-    
-    if not df_final.empty:
-        if 'PRECO' in df_final.columns and 'AVALIACAO' in df_final.columns:
-            def calcular_desconto(row):
-                preco = row.get('PRECO', 0)
-                avaliacao = row.get('AVALIACAO', 0)
-                if pd.notna(preco) and pd.notna(avaliacao) and avaliacao > 0 and preco < avaliacao:
-                    desconto = int((1 - preco / avaliacao) * 100)
-                    return f"{desconto}%"
-                return "0%"
-            
-            df_final['DESCONTO'] = df_final.apply(calcular_desconto, axis=1)
-        
-        def criar_id_unico(row):
-            matricula_original = str(row['MATRICULA']).strip() if pd.notna(row.get('MATRICULA')) and str(row.get('MATRICULA')).strip() else ''
-            uf = str(row['UF']).strip().upper()
-            iniciais_endereco = _generate_address_initials(row.get('ENDERECO', ''))
-            return f"{uf}{matricula_original}{iniciais_endereco}"
-        df_final['MATRICULA'] = df_final.apply(criar_id_unico, axis=1)
-        
-    yield {"type": "scraping_done", "message": "Processamento concluído.", "data": df_final.to_dict('records')}
\ No newline at end of file
+    def linhas_do_trecho(inicio):
+        return [_montar_linha(row) for _, row in df_final.iloc[inicio:inicio + tamanho_lote].iterrows()]
+
+    # As páginas de detalhe são a parte lenta: com max_workers > 1 elas são
+    # buscadas em paralelo, mantendo a ordem original das linhas.
+    idx = 0
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        proximo = executor.map(_enriquecer_linha, linhas_do_trecho(0))
+        for posicao in range(len(inicios)):
+            atual = proximo
+            if posicao + 1 < len(inicios):
+                proximo = executor.map(_enriquecer_linha, linhas_do_trecho(inicios[posicao + 1]))
+            lote = []
+            for dados_linha in atual:
+                idx += 1
+                current_state = dados_linha['UF']
+                processados_por_estado[current_state] += 1
+                state_processed = processados_por_estado[current_state]
+                state_total = total_por_estado[current_state]
+
+                yield {
+                    "type": "state_progress",
+                    "state": current_state,
+                    "current": state_processed,
+                    "total": state_total,
+                    "overall_current": idx,
+                    "overall_total": total_linhas,
+                    "message": f"Processando {current_state}: {state_processed}/{state_total}"
+                }
+
+                lote.append(dados_linha)
+
+            yield {"type": "batch", "data": _finalizar_lote(lote)}
+
+    yield {"type": "scraping_done", "message": "Processamento concluído.", "total": total_linhas}
@@ -187,6 +187,11 @@ class ProgressBar {
                 this.updateStatus(`${data.state}: ${data.items_count} itens encontrados, iniciando processamento...`);
                 break;
 
+            case 'csv_diff':
+                this.updateCurrentProgress(0, data.items_count, data.state);
+                this.updateStatus(data.message);
+                break;
+
             case 'state_progress':
                 this.updateCurrentProgress(data.current || 0, data.total || 0, data.state);
 
@@ -242,7 +247,7 @@ class ProgressBar {
                 setTimeout(() => {
                     this.hide();
                     if (typeof table !== 'undefined' && table) {
-                        table.ajax.reload();
+                        table.recarregar();
                     }
                     if (typeof loadSummaryData === 'function') {
                         loadSummaryData();
@@ -320,150 +325,61 @@ $(document).ready(function() {
         return `<span class="badge status-${statusClass}">${status}</span>`;
     };
 
-    const table = $('#imoveis-table').DataTable({
-        processing: true,
-        serverSide: false,
-        ajax: {
-            url: '/api/data',
-            dataSrc: '',
-            data: function(d) {
-                return currentFilters;
-            }
-        },
-        columns: [{
-            data: 'UF',
-            defaultContent: 'N/A'
-        }, {
-            data: 'CIDADE',
-            defaultContent: 'N/A'
-        }, {
-            data: 'BAIRRO',
-            defaultContent: 'N/A'
-        }, {
-            data: 'ENDERECO',
-            defaultContent: 'N/A'
-        }, {
-            data: 'Status',
-            defaultContent: 'Existente',
-            render: function(data, type, row) {
-                return formatStatus(data);
-            }
-        }, {
-            data: 'PRECO',
-            defaultContent: '0',
-            render: function(data, type, row) {
-                return `<span class="price-column">${formatCurrency(data)}</span>`;
-            }
-        }, {
-            data: 'AVALIACAO',
-            defaultContent: '0',
-            render: function(data, type, row) {
-                return `<span class="price-column">${formatCurrency(data)}</span>`;
-            }
-        }, {
-            data: 'DESCONTO',
-            defaultContent: '0%',
-            render: function(data, type, row) {
-                return `<span class="discount-column">${data || '0%'}</span>`;
-            }
-        }, {
-            data: 'AREA_PRIVATIVA',
-            defaultContent: 'N/A',
-            render: function(data, type, row) {
-                return `<span class="area-column">${formatArea(data)}</span>`;
-            }
-        }, {
-            data: 'AREA_DO_TERRENO',
-            defaultContent: 'N/A',
-            render: function(data, type, row) {
-                return `<span class="area-column">${formatArea(data)}</span>`;
-            }
-        }, {
-            data: null,
-            defaultContent: 'N/A',
-            render: function(data, type, row) {
-                const precoM2 = calculatePricePerM2(row.PRECO, row.AREA_PRIVATIVA, row.AREA_DO_TERRENO);
-                return `<span class="preco-m2-column">${precoM2}</span>`;
-            }
-        }, {
-            data: 'TIPO',
-            defaultContent: 'N/A',
-            render: function(data, type, row) {
-                return `<span class="tipo-column">${data || 'N/A'}</span>`;
-            }
-        }, {
-            data: 'MODALIDADE',
-            defaultContent: 'N/A'
-        }, {
-            data: 'DATA_DISPUTA',
-            defaultContent: 'N/A'
-        }, {
-            data: 'FGTS',
-            defaultContent: 'NÃO',
-            render: function(data, type, row) {
-                const isFgts = data === 'SIM';
-                const badgeClass = isFgts ? 'bg-success' : 'bg-secondary';
-                const text = isFgts ? 'Sim' : 'Não';
-                return `<span class="badge ${badgeClass}">${text}</span>`;
-            }
-        }, {
-            data: 'FINANCIAMENTO',
-            defaultContent: 'NÃO',
-            render: function(data, type, row) {
-                const isFinanciamento = data === 'SIM';
-                const badgeClass = isFinanciamento ? 'bg-success' : 'bg-secondary';
-                const text = isFinanciamento ? 'Sim' : 'Não';
-                return `<span class="badge ${badgeClass}">${text}</span>`;
-            }
-        }],
-        createdRow: function(row, data, dataIndex) {
-            $(row).on('click', function() {
-                if (data.LINK) {
-                    window.open(data.LINK, '_blank');
-                }
-            });
+    const formatSimNao = (data) => {
+        const isSim = data === 'SIM';
+        return `<span class="badge ${isSim ? 'bg-success' : 'bg-secondary'}">${isSim ? 'Sim' : 'Não'}</span>`;
+    };
 
-            if (data.Status === 'Atualizado' && data.ChangedFields) {
-                const changedFields = data.ChangedFields.split(',');
-                const columnsMap = {
-                    'UF': 0,
-                    'CIDADE': 1,
-                    'BAIRRO': 2,
-                    'ENDERECO': 3,
-                    'Status': 4,
-                    'PRECO': 5,
-                    'AVALIACAO': 6,
-                    'DESCONTO': 7,
-                    'AREA_PRIVATIVA': 8,
-                    'AREA_DO_TERRENO': 9,
-                    'TIPO': 11,
-                    'MODALIDADE': 12,
-                    'DATA_DISPUTA': 13,
-                    'FGTS': 14,
-                    'FINANCIAMENTO': 15
-                };
-
-                changedFields.forEach(fieldName => {
-                    const trimmedField = fieldName.trim();
-                    if (columnsMap.hasOwnProperty(trimmedField)) {
-                        const colIndex = columnsMap[trimmedField];
-                        $(row).find('td').eq(colIndex).addClass('cell-updated');
-                    }
-                });
-            }
-        },
-        language: {
-            url: '//cdn.datatables.net/plug-ins/1.13.7/i18n/pt-BR.json'
-        },
-        lengthChange: false,
-        searching: false,
-        pageLength: 25,
-        order: [
-            [5, 'asc']
+    // Só as linhas visíveis são montadas; os dados chegam em páginas de /api/data
+    // conforme a rolagem (ver tabela-virtual.js).
+    const table = new TabelaVirtual(document.getElementById('imoveis-table'), {
+        url: '/api/data',
+        parametros: () => currentFilters,
+        colunas: [
+            { data: 'UF', ordenar: 'UF' },
+            { data: 'CIDADE', ordenar: 'CIDADE' },
+            { data: 'BAIRRO', ordenar: 'BAIRRO' },
+            { data: 'ENDERECO', ordenar: 'ENDERECO' },
+            { data: 'Status', ordenar: 'Status', render: (data) => formatStatus(data) },
+            { data: 'PRECO', ordenar: 'PRECO', render: (data) => `<span class="price-column">${formatCurrency(data)}</span>` },
+            { data: 'AVALIACAO', ordenar: 'AVALIACAO', render: (data) => `<span class="price-column">${formatCurrency(data)}</span>` },
+            { data: 'DESCONTO', ordenar: 'DESCONTO', render: (data) => `<span class="discount-column">${data || '0%'}</span>` },
+            { data: 'AREA_PRIVATIVA', render: (data) => `<span class="area-column">${formatArea(data)}</span>` },
+            { data: 'AREA_DO_TERRENO', render: (data) => `<span class="area-column">${formatArea(data)}</span>` },
+            {
+                data: null,
+                ordenar: 'PRECO_M2',
+                render: (data, row) => `<span class="preco-m2-column">${calculatePricePerM2(row.PRECO, row.AREA_PRIVATIVA, row.AREA_DO_TERRENO)}</span>`
+            },
+            { data: 'TIPO', ordenar: 'TIPO', render: (data) => `<span class="tipo-column">${data || 'N/A'}</span>` },
+            { data: 'MODALIDADE', ordenar: 'MODALIDADE' },
+            { data: 'DATA_DISPUTA', ordenar: 'DATA_DISPUTA' },
+            { data: 'FGTS', render: formatSimNao },
+            { data: 'FINANCIAMENTO', render: formatSimNao }
         ],
-        scrollX: true
+        classeCelula: (row, coluna) => {
+            if (row.Status !== 'Atualizado' || !row.ChangedFields || !coluna.data) return '';
+            const changedFields = row.ChangedFields.split(',').map(campo => campo.trim());
+            return changedFields.includes(coluna.data) ? 'cell-updated' : '';
+        },
+        aoClicar: (row) => {
+            if (row.LINK) {
+                window.open(row.LINK, '_blank');
+            }
+        }
     });
 
+    // Filtros aplicados sozinhos, 300 ms depois da última alteração; a tabela
+    // cancela as páginas ainda em voo da consulta anterior.
+    let filtroTimeout = null;
+    const aplicarFiltros = (espera = 300) => {
+        clearTimeout(filtroTimeout);
+        filtroTimeout = setTimeout(() => {
+            updateFilters();
+            table.recarregar();
+        }, espera);
+    };
+
     // CORREÇÃO: Função de inicialização do slider
     function initializePriceSlider(minPrice, maxPrice) {
         if (priceSlider) {
@@ -497,6 +413,10 @@ $(document).ready(function() {
             $('#preco-min-filter').val(minVal);
             $('#preco-max-filter').val(maxVal);
         });
+
+        priceSlider.on('change', function() {
+            aplicarFiltros();
+        });
     }
 
     // CORREÇÃO: Função de atualização dos filtros
@@ -511,7 +431,8 @@ $(document).ready(function() {
             fgts: $('#fgts-filter').val() || '',
             financiamento: $('#financiamento-filter').val() || '',
             data_inicio: $('#data-inicio-filter').val() || '',
-            data_fim: $('#data-fim-filter').val() || ''
+            data_fim: $('#data-fim-filter').val() || '',
+            q: ($('#busca-filter').val() || '').trim()
         };
 
         const precoMin = $('#preco-min-filter').val();
@@ -526,8 +447,21 @@ $(document).ready(function() {
     }
 
     $('#apply-filters').on('click', function() {
-        updateFilters();
-        table.ajax.reload();
+        aplicarFiltros(0);
+    });
+
+    $('#busca-filter').on('keydown', function(e) {
+        if (e.key === 'Enter') {
+            aplicarFiltros(0);
+        }
+    });
+
+    $('#busca-filter').on('input', function() {
+        aplicarFiltros();
+    });
+
+    $('#status-filter, #uf-filter, #cidade-filter, #bairro-filter, #tipo-filter, #modalidade-filter, #fgts-filter, #financiamento-filter, #data-inicio-filter, #data-fim-filter, #preco-min-filter, #preco-max-filter').on('change', function() {
+        aplicarFiltros();
     });
     
     // CORREÇÃO: Sincroniza os inputs de texto com o slider
@@ -756,7 +690,7 @@ $(document).ready(function() {
     }
 
     function loadCheapProperties() {
-        $.get('/api/imoveis_baratos', function(data) {
+        $.get('/api/imoveis_baratos', { limite: 15 }, function(data) {
             const container = $('#vertical-carousel-inner').empty();
 
             if (data.length === 0) {
@@ -824,6 +758,9 @@ $(document).ready(function() {
         for (let i = 0; i < files.length; i++) {
             formData.append('files', files[i]);
         }
+        if ($('#enriquecer-input').is(':checked')) {
+            formData.append('enriquecer', '1');
+        }
 
         statusDiv.html('<div class="d-flex align-items-center"><strong>Enviando e processando...</strong><div class="spinner-border ms-auto" role="status" aria-hidden="true"></div></div>');
         uploadButton.prop('disabled', true);
@@ -840,11 +777,15 @@ $(document).ready(function() {
                     resultsHtml += `<li class="${res.success ? 'text-success' : 'text-danger'}"><strong>${res.file}:</strong> ${res.message}</li>`;
                 });
                 resultsHtml += '</ul>';
+                if (response.jobs && response.jobs.length) {
+                    const estados = response.jobs.map(j => j.state).join(', ');
+                    resultsHtml += `<div class="alert alert-info">Enriquecimento pelas páginas da Caixa agendado para: ${estados}.</div>`;
+                }
                 statusDiv.html(resultsHtml);
 
                 setTimeout(() => {
                     if (typeof table !== 'undefined' && table) {
-                        table.ajax.reload();
+                        table.recarregar();
                     }
                     if (typeof loadSummaryData === 'function') {
                         loadSummaryData();
@@ -867,7 +808,7 @@ $(document).ready(function() {
     });
 
     $('#clear-filters').on('click', function() {
-        $('select, input[type="date"], input[type="number"]').val('');
+        $('select, input[type="date"], input[type="number"], input[type="search"]').val('');
         $('#status-filter').val('Ativos');
         $('#cidade-filter').html('<option value="">Todas as Cidades</option>');
         $('#bairro-filter').html('<option value="">Todos os Bairros</option>');
@@ -877,8 +818,7 @@ $(document).ready(function() {
             priceSlider.set([range.min, range.max]);
         }
 
-        updateFilters();
-        table.ajax.reload();
+        aplicarFiltros(0);
     });
 
     function checkForOngoingScraping() {
@@ -0,0 +1,218 @@
+// Tabela virtualizada: só as linhas visíveis (mais uma margem) existem no DOM,
+// e os dados chegam do servidor em páginas (?limit=&offset=&formato=colunar)
+// conforme a rolagem. Requisições que deixam de interessar (filtro novo ou
+// rolagem para longe) são canceladas com AbortController.
+class TabelaVirtual {
+    constructor(tabela, opcoes) {
+        this.tabela = tabela;
+        this.opcoes = Object.assign({
+            tamanhoPagina: 200,
+            alturaLinha: 41,
+            margem: 10,
+            parametros: () => ({}),
+            classeLinha: () => '',
+            classeCelula: () => '',
+            aoClicar: null,
+            ordem: { coluna: 'PRECO', direcao: 'asc' }
+        }, opcoes);
+        this.colunas = this.opcoes.colunas;
+        this.ordem = Object.assign({}, this.opcoes.ordem);
+        this.alturaLinha = this.opcoes.alturaLinha;
+
+        this.linhas = [];
+        this.total = null;
+        this.paginas = new Map();
+        this.geracao = 0;
+        this.renderAgendado = false;
+
+        this.rolagem = document.createElement('div');
+        this.rolagem.className = 'tabela-virtual-rolagem';
+        tabela.parentNode.insertBefore(this.rolagem, tabela);
+        this.rolagem.appendChild(tabela);
+        this.info = document.createElement('div');
+        this.info.className = 'tabela-virtual-info';
+        this.rolagem.parentNode.insertBefore(this.info, this.rolagem.nextSibling);
+        this.corpo = tabela.tBodies[0] || tabela.appendChild(document.createElement('tbody'));
+
+        this.rolagem.addEventListener('scroll', () => this.agendarRender(), { passive: true });
+        window.addEventListener('resize', () => this.agendarRender());
+        this.corpo.addEventListener('click', (evento) => {
+            const tr = evento.target.closest('tr[data-indice]');
+            const linha = tr && this.linhas[Number(tr.dataset.indice)];
+            if (linha && this.opcoes.aoClicar) {
+                this.opcoes.aoClicar(linha);
+            }
+        });
+        Array.from(tabela.tHead.rows[0].cells).forEach((th, i) => {
+            const coluna = this.colunas[i];
+            if (!coluna || !coluna.ordenar) return;
+            th.classList.add('ordenavel');
+            th.addEventListener('click', () => this.ordenarPor(coluna.ordenar));
+        });
+        this.marcarOrdem();
+    }
+
+    recarregar() {
+        this.paginas.forEach(estado => {
+            if (estado instanceof AbortController) estado.abort();
+        });
+        this.paginas.clear();
+        this.geracao += 1;
+        this.linhas = [];
+        this.total = null;
+        this.rolagem.scrollTop = 0;
+        this.render();
+    }
+
+    ordenarPor(coluna) {
+        const direcao = this.ordem.coluna === coluna && this.ordem.direcao === 'asc' ? 'desc' : 'asc';
+        this.ordem = { coluna, direcao };
+        this.marcarOrdem();
+        this.recarregar();
+    }
+
+    marcarOrdem() {
+        Array.from(this.tabela.tHead.rows[0].cells).forEach((th, i) => {
+            const coluna = this.colunas[i];
+            const ativa = coluna && coluna.ordenar === this.ordem.coluna;
+            th.classList.toggle('ordem-asc', ativa && this.ordem.direcao === 'asc');
+            th.classList.toggle('ordem-desc', ativa && this.ordem.direcao === 'desc');
+        });
+    }
+
+    agendarRender() {
+        if (this.renderAgendado) return;
+        this.renderAgendado = true;
+        requestAnimationFrame(() => {
+            this.renderAgendado = false;
+            this.render();
+        });
+    }
+
+    intervaloVisivel() {
+        const total = this.total || 0;
+        const topo = this.rolagem.scrollTop;
+        const altura = this.rolagem.clientHeight || 600;
+        const inicio = Math.max(0, Math.floor(topo / this.alturaLinha) - this.opcoes.margem);
+        const fim = Math.min(total, Math.ceil((topo + altura) / this.alturaLinha) + this.opcoes.margem);
+        return [inicio, fim];
+    }
+
+    render() {
+        const [inicio, fim] = this.intervaloVisivel();
+        this.buscarPaginas(inicio, fim);
+
+        const numColunas = this.colunas.length;
+        const partes = [`<tr class="espacador" style="height:${inicio * this.alturaLinha}px"></tr>`];
+        if (inicio % 2 === 1) {
+            // Mantém a paridade do table-striped (nth-of-type) ao rolar.
+            partes.push('<tr class="espacador"></tr>');
+        }
+        for (let i = inicio; i < fim; i++) {
+            const linha = this.linhas[i];
+            if (!linha) {
+                partes.push(`<tr class="linha-carregando"><td colspan="${numColunas}">Carregando...</td></tr>`);
+                continue;
+            }
+            const celulas = this.colunas.map(coluna => {
+                const valor = coluna.data ? linha[coluna.data] : null;
+                const conteudo = coluna.render ? coluna.render(valor, linha) : TabelaVirtual.escapar(valor ?? coluna.padrao ?? 'N/A');
+                const classe = this.opcoes.classeCelula(linha, coluna);
+                return classe ? `<td class="${classe}">${conteudo}</td>` : `<td>${conteudo}</td>`;
+            });
+            partes.push(`<tr data-indice="${i}" class="${this.opcoes.classeLinha(linha)}">${celulas.join('')}</tr>`);
+        }
+        const restantes = Math.max(0, (this.total || 0) - fim);
+        partes.push(`<tr class="espacador" style="height:${restantes * this.alturaLinha}px"></tr>`);
+        this.corpo.innerHTML = partes.join('');
+        this.ajustarAlturaLinha();
+        this.atualizarInfo();
+    }
+
+    // A altura real depende da fonte e do tema; medida uma vez na primeira linha renderizada.
+    ajustarAlturaLinha() {
+        if (this.alturaMedida) return;
+        const tr = this.corpo.querySelector('tr[data-indice]');
+        if (!tr || !tr.offsetHeight) return;
+        this.alturaMedida = true;
+        if (Math.abs(tr.offsetHeight - this.alturaLinha) >= 1) {
+            this.alturaLinha = tr.offsetHeight;
+            this.agendarRender();
+        }
+    }
+
+    atualizarInfo() {
+        if (this.total === null) {
+            this.info.textContent = 'Carregando imóveis...';
+        } else if (this.total === 0) {
+            this.info.textContent = 'Nenhum imóvel encontrado com os filtros atuais.';
+        } else {
+            const topo = this.rolagem.scrollTop;
+            const primeiro = Math.min(this.total, Math.floor(topo / this.alturaLinha) + 1);
+            const ultimo = Math.min(this.total, Math.floor((topo + this.rolagem.clientHeight) / this.alturaLinha));
+            this.info.textContent = `Exibindo ${primeiro.toLocaleString('pt-BR')}-${ultimo.toLocaleString('pt-BR')} de ${this.total.toLocaleString('pt-BR')} imóveis`;
+        }
+    }
+
+    buscarPaginas(inicio, fim) {
+        const tamanho = this.opcoes.tamanhoPagina;
+        if (this.total === null) {
+            this.carregarPagina(0);
+            return;
+        }
+        // Pré-busca a página seguinte; cancela as que ficaram longe da área visível.
+        const primeira = Math.floor(inicio / tamanho);
+        const ultima = Math.floor(Math.max(inicio, fim + tamanho / 2 - 1) / tamanho);
+        this.paginas.forEach((estado, pagina) => {
+            if (estado instanceof AbortController && (pagina < primeira - 1 || pagina > ultima + 1)) {
+                estado.abort();
+                this.paginas.delete(pagina);
+            }
+        });
+        for (let pagina = primeira; pagina <= ultima && pagina * tamanho < this.total; pagina++) {
+            this.carregarPagina(pagina);
+        }
+    }
+
+    carregarPagina(pagina) {
+        if (this.paginas.has(pagina)) return;
+        const controle = new AbortController();
+        const geracao = this.geracao;
+        this.paginas.set(pagina, controle);
+
+        const tamanho = this.opcoes.tamanhoPagina;
+        const parametros = new URLSearchParams(Object.assign({}, this.opcoes.parametros(), {
+            formato: 'colunar',
+            limit: tamanho,
+            offset: pagina * tamanho,
+            ordenar: this.ordem.coluna,
+            direcao: this.ordem.direcao
+        }));
+        fetch(`${this.opcoes.url}?${parametros}`, { signal: controle.signal, headers: { Accept: 'application/json' } })
+            .then(resposta => {
+                if (!resposta.ok) throw new Error(`HTTP ${resposta.status}`);
+                return resposta.json();
+            })
+            .then(json => {
+                if (geracao !== this.geracao) return;
+                if (typeof json.total === 'number') this.total = json.total;
+                const colunas = json.columns || [];
+                (json.rows || []).forEach((valores, i) => {
+                    const linha = {};
+                    colunas.forEach((coluna, j) => { linha[coluna] = valores[j]; });
+                    this.linhas[pagina * tamanho + i] = linha;
+                });
+                this.paginas.set(pagina, 'carregada');
+                this.agendarRender();
+            })
+            .catch(erro => {
+                if (erro.name === 'AbortError' || geracao !== this.geracao) return;
+                this.paginas.delete(pagina);
+                this.info.textContent = `Erro ao carregar imóveis: ${erro.message}`;
+            });
+    }
+
+    static escapar(valor) {
+        return String(valor).replace(/[&<>"']/g, c => ({ '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;' }[c]));
+    }
+}
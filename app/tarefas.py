@@ -0,0 +1,303 @@
+from app import db, pipeline
+from app.models import Tarefa
+from flask import current_app
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import json
+import logging
+import threading
+import time
+
+# Gerenciador de jobs em segundo plano (raspagem de um estado, enriquecimento
+# dos imóveis importados por planilha ou nova tentativa das páginas pendentes):
+# cada (tipo, estado) tem no máximo um job ativo, executado em um pool de
+# threads independente da conexão SSE. Qualquer número de clientes pode
+# acompanhar o mesmo job; a tabela `tarefas` guarda o estado para consulta
+# posterior e para deduplicar entre processos (dashboard e `python -m app.cli`):
+# o índice único ix_tarefas_ativa impede dois jobs ativos do mesmo (tipo,
+# estado), mesmo quando gravados ao mesmo tempo.
+#
+# Um worker por padrão: os jobs gravam no mesmo SQLite, que só aceita uma
+# escrita por vez, e duas sincronizações em paralelo disputariam o banco até
+# estourar o busy timeout ("database is locked"). Estados diferentes esperam
+# na fila.
+
+STATUS_ATIVOS = ('pendente', 'executando')
+TIPOS = ('raspagem', 'enriquecimento', 'reprocessamento')
+NOMES_TIPOS = {'raspagem': 'Processamento', 'enriquecimento': 'Enriquecimento', 'reprocessamento': 'Reprocessamento'}
+EVENTOS_PROGRESSO = ('state_progress', 'db_progress')
+TAREFAS_WORKERS_PADRAO = 1
+INTERVALO_PERSISTENCIA = 2.0
+# Um job em andamento renova atualizado_em a cada INTERVALO_SINAL_DE_VIDA
+# segundos, mesmo sem eventos (download longo, espera do disjuntor); só o de um
+# processo que morreu fica TAREFA_ORFA_APOS sem sinal.
+INTERVALO_SINAL_DE_VIDA = 60.0
+TAREFA_ORFA_APOS = timedelta(minutes=10)
+HISTORICO_ACOMPANHAMENTOS = 50
+
+_executor = None
+_ativas = {}
+_recentes = OrderedDict()
+_lock = threading.Lock()
+
+class Acompanhamento:
+    """Eventos de um job em memória: a lista de marcos e só o último progresso."""
+
+    def __init__(self, tarefa_id, uf):
+        self.tarefa_id = tarefa_id
+        self.uf = uf
+        self.eventos = []
+        self.progresso = None
+        self.finalizada = False
+        self._cond = threading.Condition()
+
+    def publicar(self, evento):
+        with self._cond:
+            if evento.get('type') in EVENTOS_PROGRESSO:
+                self.progresso = evento
+            else:
+                self.eventos.append(evento)
+            self._cond.notify_all()
+
+    def finalizar(self):
+        with self._cond:
+            self.finalizada = True
+            self._cond.notify_all()
+
+    def acompanhar(self, timeout=15):
+        """Gera os eventos desde o início do job; None sinaliza um keep-alive."""
+        enviados = 0
+        progresso_enviado = None
+        while True:
+            with self._cond:
+                if (enviados == len(self.eventos) and self.progresso is progresso_enviado
+                        and not self.finalizada):
+                    self._cond.wait(timeout)
+                novos = self.eventos[enviados:]
+                enviados = len(self.eventos)
+                progresso = self.progresso
+                finalizada = self.finalizada
+
+            for evento in novos:
+                yield evento
+            if progresso is not progresso_enviado:
+                progresso_enviado = progresso
+                yield progresso
+            elif not novos:
+                if finalizada:
+                    return
+                yield None
+
+class TarefaEmAndamento(Exception):
+    """Já existe um job ativo do mesmo tipo para o estado (neste ou em outro processo)."""
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            workers = current_app.config.get('TAREFAS_WORKERS', TAREFAS_WORKERS_PADRAO)
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='tarefa')
+        return _executor
+
+def _tarefa_ativa_no_banco(uf, tipo='raspagem'):
+    """Job ativo de outro processo para a UF; jobs sem sinal de vida são marcados como interrompidos."""
+    tarefa = Tarefa.query.filter(
+        Tarefa.tipo == tipo, Tarefa.UF == uf, Tarefa.status.in_(STATUS_ATIVOS)
+    ).order_by(Tarefa.id.desc()).first()
+    if tarefa is None:
+        return None
+    if tarefa.atualizado_em and datetime.utcnow() - tarefa.atualizado_em > TAREFA_ORFA_APOS:
+        tarefa.status = 'interrompida'
+        tarefa.mensagem = 'Processo encerrado antes da conclusão.'
+        tarefa.finalizado_em = datetime.utcnow()
+        db.session.commit()
+        return None
+    return tarefa
+
+def _registrar(uf, tipo):
+    """
+    Grava uma tarefa pendente para (tipo, uf). Devolve (tarefa, True), ou
+    (tarefa ativa de outro processo, False) se já existe uma.
+    """
+    existente = _tarefa_ativa_no_banco(uf, tipo)
+    if existente is not None:
+        return existente, False
+    tarefa = Tarefa(tipo=tipo, UF=uf, status='pendente', mensagem='Aguardando na fila...')
+    db.session.add(tarefa)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Outro processo gravou a dele entre a consulta e o INSERT.
+        db.session.rollback()
+        return _tarefa_ativa_no_banco(uf, tipo), False
+    return tarefa, True
+
+def submeter(uf, workers=1, tipo='raspagem'):
+    """
+    Agenda um job de 'tipo' (raspagem ou enriquecimento) para 'uf' ou reaproveita
+    o que já está em andamento. Retorna o id da tarefa. Precisa de app context.
+    """
+    if tipo not in TIPOS:
+        raise ValueError(f"Tipo de tarefa desconhecido: {tipo}")
+    uf = uf.strip().upper()
+    chave = (tipo, uf)
+    with _lock:
+        if chave in _ativas:
+            return _ativas[chave].tarefa_id
+
+    executor = _get_executor()
+    app = current_app._get_current_object()
+
+    with _lock:
+        if chave in _ativas:
+            return _ativas[chave].tarefa_id
+        tarefa, criada = _registrar(uf, tipo)
+        if not criada:
+            return tarefa.id
+        acompanhamento = Acompanhamento(tarefa.id, uf)
+        _ativas[chave] = acompanhamento
+        _recentes[tarefa.id] = acompanhamento
+        while len(_recentes) > HISTORICO_ACOMPANHAMENTOS:
+            _recentes.popitem(last=False)
+
+    executor.submit(_executar, app, tarefa.id, uf, workers, acompanhamento, tipo)
+    logging.info(f"Tarefa {tarefa.id} de {tipo} de {uf} agendada.")
+    return tarefa.id
+
+def executar(uf, workers=1, tipo='raspagem', **opcoes):
+    """
+    Roda o job na thread atual (ex.: linha de comando), registrado na tabela
+    `tarefas` como os do dashboard. Devolve o gerador de eventos; levanta
+    TarefaEmAndamento se o estado já tem um job ativo. 'opcoes' vão para
+    pipeline.processar_estado (ex.: completo=True) ou, no reprocessamento,
+    para reprocessamento.reprocessar_estado (ex.: limite=500). Precisa de app context.
+    """
+    if tipo not in TIPOS:
+        raise ValueError(f"Tipo de tarefa desconhecido: {tipo}")
+    uf = uf.strip().upper()
+    with _lock:
+        ativa = _ativas.get((tipo, uf))
+        tarefa, criada = (None, False) if ativa else _registrar(uf, tipo)
+    if not criada:
+        tarefa_id = ativa.tarefa_id if ativa else tarefa.id
+        raise TarefaEmAndamento(f"{uf} já está sendo processado (tarefa {tarefa_id}).")
+    logging.info(f"Tarefa {tarefa.id} de {tipo} de {uf} iniciada neste processo.")
+    return _rodar(tarefa.id, uf, workers, tipo, opcoes)
+
+def _eventos(tipo, uf, workers, opcoes):
+    if tipo in ('enriquecimento', 'reprocessamento'):
+        # Importado aqui: reprocessamento carrega o scraper (requests/BeautifulSoup).
+        from app import reprocessamento
+        if tipo == 'enriquecimento':
+            return reprocessamento.enriquecer_estado(uf, workers=workers)
+        return reprocessamento.reprocessar_estado(uf, workers=workers, **opcoes)
+    return pipeline.processar_estado(uf, workers=workers, **opcoes)
+
+def _sinal_de_vida(engine, tarefa_id, parar):
+    """Renova atualizado_em da tarefa até 'parar' ser sinalizado (thread própria)."""
+    while not parar.wait(INTERVALO_SINAL_DE_VIDA):
+        try:
+            with engine.begin() as conn:
+                conn.execute(update(Tarefa).where(
+                    Tarefa.id == tarefa_id, Tarefa.status.in_(STATUS_ATIVOS)
+                ).values(atualizado_em=func.now()))
+        except Exception as e:
+            logging.warning(f"Não foi possível renovar a tarefa {tarefa_id}: {e}")
+
+def _rodar(tarefa_id, uf, workers, tipo, opcoes):
+    """Executa o job gravando o andamento na tabela `tarefas`; gera os eventos e propaga os erros."""
+    tarefa = db.session.get(Tarefa, tarefa_id)
+    tarefa.status = 'executando'
+    tarefa.iniciado_em = datetime.utcnow()
+    db.session.commit()
+    parar = threading.Event()
+    threading.Thread(
+        target=_sinal_de_vida, args=(db.engine, tarefa_id, parar), name=f'tarefa-{tarefa_id}-sinal', daemon=True
+    ).start()
+    ultimo_registro = 0.0
+    try:
+        for evento in _eventos(tipo, uf, workers, opcoes):
+            yield evento
+            agora = time.monotonic()
+            if evento.get('type') not in EVENTOS_PROGRESSO or agora - ultimo_registro >= INTERVALO_PERSISTENCIA:
+                ultimo_registro = agora
+                tarefa.mensagem = evento.get('message') or tarefa.mensagem
+                if 'current' in evento and 'total' in evento:
+                    tarefa.progresso_atual = evento['current']
+                    tarefa.progresso_total = evento['total']
+                if evento.get('type') == 'state_completed':
+                    tarefa.resultado = json.dumps(evento.get('result', {}))
+                db.session.commit()
+        tarefa.status = 'concluida'
+        tarefa.mensagem = f"{NOMES_TIPOS[tipo]} de {uf} concluído."
+    except Exception as e:
+        logging.error(f"Erro na tarefa {tarefa_id} ({uf}): {e}", exc_info=True)
+        db.session.rollback()
+        tarefa = db.session.get(Tarefa, tarefa_id)
+        tarefa.status = 'erro'
+        tarefa.mensagem = f'Erro ao processar {uf}: {str(e)}'
+        raise
+    finally:
+        parar.set()
+        if tarefa.status in STATUS_ATIVOS:
+            # Interrompido sem erro (Ctrl+C na linha de comando, gerador abandonado).
+            db.session.rollback()
+            tarefa = db.session.get(Tarefa, tarefa_id)
+            tarefa.status = 'interrompida'
+            tarefa.mensagem = 'Execução interrompida antes da conclusão.'
+        tarefa.finalizado_em = datetime.utcnow()
+        db.session.commit()
+
+def _executar(app, tarefa_id, uf, workers, acompanhamento, tipo='raspagem'):
+    with app.app_context():
+        try:
+            for evento in _rodar(tarefa_id, uf, workers, tipo, {}):
+                acompanhamento.publicar(evento)
+        except Exception as e:
+            acompanhamento.publicar({'type': 'error', 'state': uf, 'message': f'Erro ao processar {uf}: {str(e)}'})
+        finally:
+            with _lock:
+                if _ativas.get((tipo, uf)) is acompanhamento:
+                    _ativas.pop((tipo, uf))
+            acompanhamento.finalizar()
+
+def _acompanhar_pelo_banco(tarefa_id, intervalo=2.0):
+    """Acompanha um job de outro processo consultando a tabela `tarefas`."""
+    ultimo = None
+    while True:
+        db.session.expire_all()
+        tarefa = db.session.get(Tarefa, tarefa_id)
+        if tarefa is None:
+            return
+        if tarefa.status in STATUS_ATIVOS:
+            _tarefa_ativa_no_banco(tarefa.UF, tarefa.tipo)
+        if tarefa.status == 'concluida':
+            resultado = json.loads(tarefa.resultado) if tarefa.resultado else {}
+            yield {'type': 'state_completed', 'state': tarefa.UF, 'result': resultado,
+                   'total_properties': pipeline.contar_imoveis()}
+            return
+        if tarefa.status not in STATUS_ATIVOS:
+            yield {'type': 'error', 'state': tarefa.UF, 'message': tarefa.mensagem or f'Tarefa {tarefa.status}.'}
+            return
+        atual = (tarefa.progresso_atual, tarefa.progresso_total, tarefa.mensagem)
+        if atual != ultimo:
+            ultimo = atual
+            yield {'type': 'state_progress', 'state': tarefa.UF, 'current': tarefa.progresso_atual or 0,
+                   'total': tarefa.progresso_total or 0, 'message': tarefa.mensagem}
+        else:
+            yield None
+        time.sleep(intervalo)
+
+def acompanhar(tarefa_id):
+    """Eventos de uma tarefa, esteja ela neste processo ou em outro. None = keep-alive."""
+    with _lock:
+        acompanhamento = _recentes.get(tarefa_id)
+    if acompanhamento is not None:
+        return acompanhamento.acompanhar()
+    return _acompanhar_pelo_banco(tarefa_id)
+
+def listar(limite=50):
+    return [t.to_dict() for t in Tarefa.query.order_by(Tarefa.id.desc()).limit(limite).all()]
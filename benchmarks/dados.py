@@ -0,0 +1,140 @@
+"""
+Geração de dados sintéticos no formato da Caixa: a lista CSV de um estado e
+as páginas de detalhe (uma por modalidade) servidas pelo simulador.
+Tudo é determinístico a partir da semente, para que rodadas sejam comparáveis.
+"""
+import os
+import random
+
+CABECALHO_CSV = (
+    ' N° do imóvel;UF;Cidade;Bairro;Endereço;Preço;Valor de avaliação;Desconto;'
+    'Descrição;Modalidade de venda;Link de acesso'
+)
+MODALIDADES = ['Leilão SFI - Edital Único', 'Licitação Aberta', 'Venda Direta Online']
+TIPOS = ['Casa', 'Apartamento', 'Terreno', 'Sobrado', 'Loja']
+CIDADES = ['CIDADE ALFA', 'CIDADE BETA', 'CIDADE GAMA', 'CIDADE DELTA', 'CIDADE OMEGA']
+LOGRADOUROS = ['RUA DAS FLORES', 'AVENIDA BRASIL', 'RUA SAO JOAO', 'TRAVESSA DO SOL', 'ALAMEDA DOS IPES']
+CAMINHO_DETALHE = '/sistema/detalhe-imovel.asp'
+
+PAGINAS_DETALHE = {
+    'leilao': (
+        '<html><body><h5>Imóvel {numero}</h5>'
+        '<p>Matrícula(s): {matricula}</p>'
+        '<p>Data do 1º Leilão - {data1} - 10h00</p><p>Valor mínimo de venda 1º Leilão: R$ {preco1}</p>'
+        '<p>Data do 2º Leilão - {data2} - 10h00</p><p>Valor mínimo de venda 2º Leilão: R$ {preco2}</p>'
+        '<p>Condomínio: Sob responsabilidade do comprador, até o limite de 10% em relação ao valor de avaliação do imóvel.</p>'
+        '<p>Imóvel permite financiamento.</p>'
+        '</body></html>'
+    ),
+    'licitacao': (
+        '<html><body><h5>Imóvel {numero}</h5>'
+        '<p>Matrícula(s): {matricula}</p>'
+        '<p>Data da Licitação Aberta - {data1} - 10h00</p>'
+        '<p>Permite utilização de FGTS</p>'
+        '<p>Condomínio: Sob responsabilidade do comprador.</p>'
+        '</body></html>'
+    ),
+    'venda_direta': (
+        '<html><body><h5>Imóvel {numero}</h5>'
+        '<p>Matrícula(s): {matricula}</p>'
+        '<p>Venda Direta Online</p>'
+        '<p>Imóvel permite financiamento. Permite utilização de FGTS</p>'
+        '</body></html>'
+    ),
+}
+
+def _moeda(valor):
+    return f'{valor:,.2f}'.replace(',', 'X').replace('.', ',').replace('X', '.')
+
+def tipo_pagina(modalidade):
+    modalidade = modalidade.lower()
+    if 'leilão' in modalidade:
+        return 'leilao'
+    if 'licitação' in modalidade:
+        return 'licitacao'
+    return 'venda_direta'
+
+def numero_imovel(indice):
+    return 1444400000000 + indice
+
+def gerar_linhas(quantidade, uf='ZZ', semente=42):
+    """Linhas (dicionários) equivalentes às da lista da Caixa."""
+    aleatorio = random.Random(semente)
+    for i in range(quantidade):
+        avaliacao = aleatorio.randrange(60_000, 900_000, 500)
+        desconto = aleatorio.randint(0, 60)
+        preco = round(avaliacao * (100 - desconto) / 100, 2)
+        tipo = aleatorio.choice(TIPOS)
+        area_privativa = aleatorio.randint(30, 300)
+        yield {
+            'numero': numero_imovel(i),
+            'UF': uf,
+            'CIDADE': aleatorio.choice(CIDADES),
+            'BAIRRO': f'BAIRRO {aleatorio.randint(1, 200):03d}',
+            'ENDERECO': f'{aleatorio.choice(LOGRADOUROS)} {aleatorio.randint(1, 3000)}, N. {i}',
+            'PRECO': preco,
+            'AVALIACAO': avaliacao,
+            'DESCONTO': desconto,
+            'DESCRICAO': (
+                f'{tipo}, {area_privativa},00 de área privativa, '
+                f'{area_privativa * 2},00 de área do terreno, 2 qto(s), 1 vaga(s).'
+            ),
+            'MODALIDADE': MODALIDADES[i % len(MODALIDADES)],
+        }
+
+def gerar_csv(caminho, quantidade, uf='ZZ', url_base='http://127.0.0.1:8765', semente=42):
+    """Grava a lista no mesmo layout do Lista_imoveis_XX.csv (latin-1, ';', 2 linhas de cabeçalho)."""
+    os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+    with open(caminho, 'w', encoding='latin-1', newline='') as f:
+        f.write('Lista de Imóveis da Caixa;;;\n')
+        f.write(f'Gerado para benchmark ({quantidade} imóveis);;;\n')
+        f.write(CABECALHO_CSV + '\n')
+        for linha in gerar_linhas(quantidade, uf, semente):
+            link = f"{url_base}{CAMINHO_DETALHE}?hdnOrigem=index&hdnimovel={linha['numero']}"
+            f.write(';'.join([
+                str(linha['numero']), linha['UF'], linha['CIDADE'], linha['BAIRRO'], linha['ENDERECO'],
+                _moeda(linha['PRECO']), _moeda(linha['AVALIACAO']), str(linha['DESCONTO']),
+                linha['DESCRICAO'], linha['MODALIDADE'], link
+            ]) + '\n')
+    return caminho
+
+def gerar_registros(quantidade, uf='ZZ', semente=42):
+    """Registros já enriquecidos, no formato que o scraper entrega a process_scraped_data."""
+    registros = []
+    for linha in gerar_linhas(quantidade, uf, semente):
+        pagina = tipo_pagina(linha['MODALIDADE'])
+        registros.append({
+            'UF': uf, 'CIDADE': linha['CIDADE'], 'BAIRRO': linha['BAIRRO'], 'ENDERECO': linha['ENDERECO'],
+            'DESCRICAO': linha['DESCRICAO'], 'PRECO': linha['PRECO'], 'AVALIACAO': float(linha['AVALIACAO']),
+            'DESCONTO': f"{linha['DESCONTO']}%", 'MODALIDADE': linha['MODALIDADE'],
+            'LINK': f"http://127.0.0.1{CAMINHO_DETALHE}?hdnimovel={linha['numero']}",
+            'MATRICULA': f"{uf}{linha['numero']}", 'Status': 'Novo',
+            'TIPO': linha['DESCRICAO'].split(',')[0], 'AREA_PRIVATIVA': '', 'AREA_DO_TERRENO': '',
+            'FGTS': 'SIM' if pagina != 'leilao' else 'NÃO',
+            'FINANCIAMENTO': 'SIM' if pagina != 'licitacao' else 'NÃO',
+            'CONDOMINIO': 'Arrematante' if pagina == 'licitacao' else '',
+            'DATA_DISPUTA': '10/11/2026' if pagina != 'venda_direta' else '',
+        })
+    return registros
+
+def pagina_detalhe(numero, modalidade):
+    """HTML da página de detalhe de um imóvel sintético."""
+    semente = numero % 10_000
+    preco1 = 100_000 + semente * 10
+    return PAGINAS_DETALHE[tipo_pagina(modalidade)].format(
+        numero=numero,
+        matricula=f'{numero % 1_000_000}',
+        data1='10/11/2026', data2='24/11/2026',
+        preco1=_moeda(preco1), preco2=_moeda(preco1 * 0.7),
+    )
+
+def salvar_paginas_exemplo(pasta):
+    """Grava uma página de cada modalidade em disco, como fixture para inspeção/parsing."""
+    os.makedirs(pasta, exist_ok=True)
+    caminhos = []
+    for i, modalidade in enumerate(MODALIDADES):
+        caminho = os.path.join(pasta, f'detalhe_{tipo_pagina(modalidade)}.html')
+        with open(caminho, 'w', encoding='utf-8') as f:
+            f.write(pagina_detalhe(numero_imovel(i), modalidade))
+        caminhos.append(caminho)
+    return caminhos
@@ -0,0 +1,167 @@
+"""
+Benchmarks dos caminhos críticos de ingestão e consulta, sobre dados
+sintéticos e um banco temporário (o instance/imoveis.db não é tocado).
+
+    python -m benchmarks.executar --tamanhos 1000,10000,100000 --saida resultados.json
+    python -m benchmarks.executar --tamanhos 1000 --comparar base.json --tolerancia 0.25
+
+Etapas medidas para cada tamanho:
+  raspagem                  processar_arquivos_csv contra o simulador local
+  sincronizacao_insercao    process_scraped_data com o banco vazio
+  sincronizacao_atualizacao process_scraped_data com todos os imóveis alterados
+  importacao_excel          converter.process_excel_file
+  api_data / api_summary    GET com o cache de respostas vazio (fria) e cheio (quente)
+  exportacao_xlsx           GET /export/xlsx-hyperlink
+
+A raspagem é limitada a --limite-raspagem linhas porque o tempo dela é dominado
+pela espera entre páginas de detalhe, não pelo volume.
+
+Códigos de saída: 0 sucesso, 1 regressão acima da tolerância em --comparar.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+import pandas as pd
+from benchmarks import dados
+from benchmarks.simulador import Simulador
+
+UF_BENCHMARK = 'ZZ'
+REPETICOES_CONSULTA = 5
+
+def _medir(funcao):
+    inicio = time.perf_counter()
+    resultado = funcao()
+    return time.perf_counter() - inicio, resultado
+
+def _resultado(tamanho, etapa, segundos, linhas=None):
+    registro = {'tamanho': tamanho, 'etapa': etapa, 'segundos': round(segundos, 4)}
+    if linhas is not None:
+        registro['linhas'] = linhas
+        registro['linhas_por_segundo'] = round(linhas / segundos, 1) if segundos else None
+    return registro
+
+def _consumir(eventos):
+    """Linhas entregues nos eventos 'batch' (os lotes são descartados após a contagem)."""
+    return sum(len(evento['data']) for evento in eventos if evento.get('type') == 'batch')
+
+def _medir_get(cliente, url, tamanho, etapa, repeticoes=REPETICOES_CONSULTA):
+    from app import cache
+    cache.limpar()
+    fria, resposta = _medir(lambda: cliente.get(url))
+    if resposta.status_code != 200:
+        raise RuntimeError(f'{url} respondeu {resposta.status_code}')
+    quentes = [_medir(lambda: cliente.get(url))[0] for _ in range(repeticoes)]
+    return [
+        _resultado(tamanho, f'{etapa}_fria', fria),
+        _resultado(tamanho, f'{etapa}_quente', statistics.median(quentes)),
+    ]
+
+def executar_tamanho(tamanho, pasta, simulador, workers, limite_raspagem):
+    """Roda todas as etapas para 'tamanho' imóveis em um banco novo dentro de 'pasta'."""
+    os.environ['IMOVEIS_DATABASE_URI'] = f"sqlite:///{os.path.join(pasta, f'benchmark_{tamanho}.db')}"
+    from app import create_app, datalogic, scraper
+    import converter
+
+    app = create_app()
+    resultados = []
+
+    linhas_raspagem = min(tamanho, limite_raspagem)
+    csv = dados.gerar_csv(os.path.join(pasta, f'{UF_BENCHMARK}.csv'), linhas_raspagem, UF_BENCHMARK, simulador.url_base)
+    segundos, raspados = _medir(lambda: _consumir(scraper.processar_arquivos_csv([csv], max_workers=workers)))
+    resultados.append(_resultado(tamanho, 'raspagem', segundos, raspados))
+
+    with app.app_context():
+        registros = dados.gerar_registros(tamanho, UF_BENCHMARK)
+        segundos, _ = _medir(lambda: datalogic.process_scraped_data(registros))
+        resultados.append(_resultado(tamanho, 'sincronizacao_insercao', segundos, tamanho))
+
+        registros = dados.gerar_registros(tamanho, UF_BENCHMARK, semente=43)
+        segundos, _ = _medir(lambda: datalogic.process_scraped_data(registros))
+        resultados.append(_resultado(tamanho, 'sincronizacao_atualizacao', segundos, tamanho))
+
+    planilha = os.path.join(pasta, f'importacao_{tamanho}.xlsx')
+    df_excel = pd.DataFrame(dados.gerar_registros(tamanho, UF_BENCHMARK, semente=44))
+    df_excel['MATRICULA'] = df_excel['MATRICULA'].str[len(UF_BENCHMARK):]
+    df_excel.drop(columns=['Status']).to_excel(planilha, index=False)
+    with app.app_context():
+        segundos, (sucesso, mensagem) = _medir(lambda: converter.process_excel_file(planilha))
+    if not sucesso:
+        raise RuntimeError(mensagem)
+    resultados.append(_resultado(tamanho, 'importacao_excel', segundos, tamanho))
+
+    cliente = app.test_client()
+    resultados += _medir_get(cliente, f'/api/data?uf={UF_BENCHMARK}&status=Ativos', tamanho, 'api_data')
+    resultados += _medir_get(cliente, '/api/summary', tamanho, 'api_summary')
+    segundos, resposta = _medir(lambda: cliente.get('/export/xlsx-hyperlink'))
+    if resposta.status_code != 200:
+        raise RuntimeError(f'/export/xlsx-hyperlink respondeu {resposta.status_code}')
+    resultados.append(_resultado(tamanho, 'exportacao_xlsx', segundos))
+    return resultados
+
+def comparar(resultados, base, tolerancia):
+    """Etapas mais lentas que a base além da tolerância (fração, ex.: 0.25 = 25%)."""
+    referencia = {(r['tamanho'], r['etapa']): r['segundos'] for r in base.get('resultados', [])}
+    regressoes = []
+    for r in resultados:
+        anterior = referencia.get((r['tamanho'], r['etapa']))
+        if anterior and r['segundos'] > anterior * (1 + tolerancia):
+            regressoes.append({**r, 'base_segundos': anterior, 'variacao': round(r['segundos'] / anterior - 1, 3)})
+    return regressoes
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.executar', description='Benchmarks de ingestão e consulta.')
+    parser.add_argument('--tamanhos', default='1000,10000,100000', help='Quantidades de imóveis, separadas por vírgula')
+    parser.add_argument('--workers', type=int, default=8, help='Páginas de detalhe em paralelo na raspagem (padrão: 8)')
+    parser.add_argument('--limite-raspagem', type=int, default=2000, help='Máximo de linhas raspadas por tamanho (padrão: 2000)')
+    parser.add_argument('--saida', default='benchmarks/resultados.json', help='Arquivo JSON com os resultados')
+    parser.add_argument('--comparar', help='JSON de uma rodada anterior para detectar regressões')
+    parser.add_argument('--tolerancia', type=float, default=0.25, help='Piora aceita em --comparar (padrão: 0.25)')
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.WARNING)
+    tamanhos = [int(t) for t in args.tamanhos.split(',') if t.strip()]
+    simulador = Simulador(imoveis_por_uf=max(tamanhos)).iniciar()
+    resultados = []
+    try:
+        with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as pasta:
+            dados.salvar_paginas_exemplo(os.path.join(pasta, 'paginas'))
+            for tamanho in tamanhos:
+                print(f'[{tamanho}] executando...', flush=True)
+                for r in executar_tamanho(tamanho, pasta, simulador, args.workers, args.limite_raspagem):
+                    vazao = f" ({r['linhas_por_segundo']} linhas/s)" if r.get('linhas_por_segundo') else ''
+                    print(f"  {r['etapa']:<28} {r['segundos']:>9.3f}s{vazao}", flush=True)
+                    resultados.append(r)
+    finally:
+        simulador.parar()
+        logging.disable(logging.NOTSET)
+
+    saida = {
+        'gerado_em': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'parametros': {'workers': args.workers, 'limite_raspagem': args.limite_raspagem},
+        'resultados': resultados,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.saida)), exist_ok=True)
+    with open(args.saida, 'w', encoding='utf-8') as f:
+        json.dump(saida, f, indent=2, ensure_ascii=False)
+    print(f'Resultados gravados em {args.saida}')
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            regressoes = comparar(resultados, json.load(f), args.tolerancia)
+        for r in regressoes:
+            print(f"REGRESSÃO [{r['tamanho']}] {r['etapa']}: {r['base_segundos']}s -> {r['segundos']}s (+{r['variacao']:.0%})", file=sys.stderr)
+        if regressoes:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
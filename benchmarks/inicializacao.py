@@ -0,0 +1,86 @@
+"""
+Tempo de inicialização do dashboard: cada rodada é um interpretador novo que
+importa o app, chama create_app e serve a primeira página e /api/summary.
+Também lista quais dependências pesadas foram carregadas no caminho.
+
+    python -m benchmarks.inicializacao --repeticoes 5 --saida inicializacao.json
+
+Usa uma cópia temporária de instance/imoveis.db (ou --banco), para que a
+migração de esquema da primeira rodada não altere o banco real.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+MODULOS_PESADOS = ['pandas', 'numpy', 'openpyxl', 'bs4', 'requests']
+
+SONDA = r'''
+import json, sys, time
+inicio = time.perf_counter()
+from app import create_app
+importado = time.perf_counter()
+app = create_app()
+criado = time.perf_counter()
+cliente = app.test_client()
+assert cliente.get('/').status_code == 200
+pagina = time.perf_counter()
+assert cliente.get('/api/summary').status_code == 200
+resumo = time.perf_counter()
+print(json.dumps({
+    'importacao': importado - inicio,
+    'create_app': criado - importado,
+    'primeira_pagina': pagina - criado,
+    'api_summary': resumo - pagina,
+    'total': resumo - inicio,
+    'modulos_pesados': [m for m in %r if m in sys.modules],
+}))
+''' % (MODULOS_PESADOS,)
+
+def rodar_sonda(raiz, uri):
+    ambiente = dict(os.environ, IMOVEIS_DATABASE_URI=uri, PYTHONPATH=raiz)
+    saida = subprocess.run(
+        [sys.executable, '-c', SONDA], cwd=raiz, env=ambiente, capture_output=True, text=True, check=True
+    )
+    return json.loads(saida.stdout.strip().splitlines()[-1])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.inicializacao', description='Tempo de inicialização do dashboard.')
+    parser.add_argument('--repeticoes', type=int, default=5)
+    parser.add_argument('--banco', help='Banco SQLite a copiar (padrão: instance/imoveis.db)')
+    parser.add_argument('--saida', help='Arquivo JSON com os resultados')
+    args = parser.parse_args(argv)
+
+    raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    origem = args.banco or os.path.join(raiz, 'instance', 'imoveis.db')
+    with tempfile.TemporaryDirectory() as pasta:
+        destino = os.path.join(pasta, 'imoveis.db')
+        if os.path.exists(origem):
+            shutil.copy(origem, destino)
+        uri = f'sqlite:///{destino}'
+        aquecimento = rodar_sonda(raiz, uri)
+        rodadas = [rodar_sonda(raiz, uri) for _ in range(args.repeticoes)]
+
+    etapas = ['importacao', 'create_app', 'primeira_pagina', 'api_summary', 'total']
+    resultado = {
+        'repeticoes': args.repeticoes,
+        'primeira_execucao_total': round(aquecimento['total'], 4),
+        'mediana_segundos': {e: round(statistics.median(r[e] for r in rodadas), 4) for e in etapas},
+        'modulos_pesados_carregados': rodadas[-1]['modulos_pesados'],
+    }
+    for etapa, segundos in resultado['mediana_segundos'].items():
+        print(f'  {etapa:<16} {segundos:>8.3f}s')
+    print(f"  primeira execução (com migração): {resultado['primeira_execucao_total']:.3f}s")
+    print(f"  dependências pesadas carregadas: {', '.join(resultado['modulos_pesados_carregados']) or 'nenhuma'}")
+
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
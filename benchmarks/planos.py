@@ -0,0 +1,202 @@
+"""
+Regressão de planos de consulta dos endpoints quentes do dashboard. Semeia um
+banco temporário com imóveis sintéticos de várias UFs, chama cada endpoint
+com o cache de respostas vazio e passa todo SELECT que ele executou por
+EXPLAIN QUERY PLAN.
+
+    python -m benchmarks.planos --linhas 100000 --saida planos.json
+    python -m benchmarks.planos --mostrar-planos
+
+Um endpoint falha quando algum plano tem:
+  - varredura completa de tabela ("SCAN imoveis" sem índice);
+  - B-tree temporária ("USE TEMP B-TREE" para ORDER BY, DISTINCT ou GROUP BY);
+ou quando a mediana do tempo de resposta (fria, sem cache) passa do
+orçamento de ENDPOINTS, que vale para o tamanho padrão de --linhas.
+
+O banco não tem ANALYZE (nem o de produção), então o SQLite escolhe os planos
+só pelo esquema e pelo formato das consultas: o resultado aqui é o mesmo que
+se teria no instance/imoveis.db, qualquer que seja o volume.
+
+Códigos de saída: 0 sucesso, 1 algum endpoint com plano ou tempo fora do esperado.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from benchmarks import dados
+
+UFS = ['SP', 'RJ', 'MG', 'RS', 'PR', 'BA', 'SC', 'GO', 'PE', 'CE']
+STATUS = ['Existente'] * 6 + ['Novo', 'Atualizado'] + ['Expirado'] * 2
+UF_CONSULTA = 'SP'
+CIDADE_CONSULTA = dados.CIDADES[0]
+BAIRRO_CONSULTA = 'BAIRRO 001'
+REPETICOES = 5
+TAMANHO_LOTE = 5000
+
+# Caminhos consultados pelo dashboard, com o orçamento da mediana em ms
+# (100 mil imóveis). A tabela virtual sempre manda a ordenação e a página; os
+# filtros vão em caixa mista de propósito, a normalização não pode impedir o
+# uso dos índices.
+PAGINA = 'formato=colunar&limit=200&ordenar=PRECO'
+ENDPOINTS = [
+    (f'/api/data?status=Ativos&{PAGINA}&direcao=asc', 50),
+    (f'/api/data?status=Ativos&{PAGINA}&direcao=asc&offset=2000', 50),
+    (f'/api/data?status=Ativos&{PAGINA}&direcao=desc', 50),
+    (f'/api/data?{PAGINA}&direcao=asc', 30),
+    (f'/api/data?status=Ativos&uf={UF_CONSULTA.lower()}&{PAGINA}&direcao=asc', 30),
+    (f'/api/data?status=Ativos&uf={UF_CONSULTA}&cidade={CIDADE_CONSULTA.title()}&{PAGINA}&direcao=asc', 30),
+    (f'/api/data?status=Ativos&uf={UF_CONSULTA}&cidade={CIDADE_CONSULTA}&bairro={BAIRRO_CONSULTA.lower()}&{PAGINA}&direcao=asc', 30),
+    ('/api/summary', 150),
+    ('/api/filters', 25),
+    ('/api/distinct_ufs', 10),
+    (f'/api/cidades_por_uf?uf={UF_CONSULTA.lower()}', 10),
+    (f'/api/bairros_por_cidade?uf={UF_CONSULTA}&cidade={CIDADE_CONSULTA.title()}', 10),
+]
+
+def semear(linhas, semente=42):
+    """Insere 'linhas' imóveis sintéticos, distribuídos entre UFS e STATUS, direto na tabela."""
+    from sqlalchemy import insert
+    from app import db
+    from app.models import Imovel
+
+    aleatorio = random.Random(semente)
+    por_uf = linhas // len(UFS)
+    for i, uf in enumerate(UFS):
+        quantidade = por_uf + (linhas % len(UFS) if i == 0 else 0)
+        registros = dados.gerar_registros(quantidade, uf, semente=semente + i)
+        for registro in registros:
+            registro['Status'] = aleatorio.choice(STATUS)
+            registro['NUMERO_CAIXA'] = registro['LINK'].rsplit('=', 1)[-1]
+        for inicio in range(0, len(registros), TAMANHO_LOTE):
+            db.session.execute(insert(Imovel), registros[inicio:inicio + TAMANHO_LOTE])
+    db.session.commit()
+
+class Captura:
+    """Guarda os SELECTs executados pelo engine enquanto está ativa."""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.consultas = []
+        self.ativa = False
+        event.listen(engine, 'before_cursor_execute', self._registrar)
+
+    def _registrar(self, conn, cursor, statement, parameters, context, executemany):
+        if self.ativa and not executemany and statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            self.consultas.append((statement, parameters))
+
+def problemas(plano, tabelas):
+    """Linhas do plano com varredura completa de uma tabela do banco ou B-tree temporária."""
+    encontrados = []
+    for detalhe in plano:
+        partes = detalhe.split()
+        if partes[:1] == ['SCAN'] and len(partes) > 1 and partes[1] in tabelas and 'USING' not in partes:
+            encontrados.append(detalhe)
+        elif 'USE TEMP B-TREE' in detalhe:
+            encontrados.append(detalhe)
+    return encontrados
+
+def explicar(conn, consultas, tabelas):
+    resultado = []
+    for sql, parametros in consultas:
+        linhas = conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}', parametros).all()
+        plano = [linha[-1] for linha in linhas]
+        resultado.append({'sql': ' '.join(sql.split()), 'plano': plano, 'problemas': problemas(plano, tabelas)})
+    return resultado
+
+def verificar(app, captura, caminho, orcamento_ms, repeticoes):
+    from app import cache, db
+
+    cliente = app.test_client()
+    cache.limpar()
+    captura.consultas = []
+    captura.ativa = True
+    resposta = cliente.get(caminho)
+    captura.ativa = False
+    if resposta.status_code != 200:
+        raise RuntimeError(f'{caminho} respondeu {resposta.status_code}')
+
+    tempos = []
+    for _ in range(repeticoes):
+        cache.limpar()
+        inicio = time.perf_counter()
+        cliente.get(caminho)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+
+    with app.app_context():
+        tabelas = set(db.metadata.tables)
+        with db.engine.connect() as conn:
+            consultas = explicar(conn, captura.consultas, tabelas)
+    mediana = statistics.median(tempos)
+    return {
+        'caminho': caminho,
+        'mediana_ms': round(mediana, 2),
+        'orcamento_ms': orcamento_ms,
+        'acima_do_orcamento': mediana > orcamento_ms,
+        'consultas': consultas,
+        'ok': mediana <= orcamento_ms and not any(c['problemas'] for c in consultas),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.planos', description='Planos de consulta e tempos dos endpoints quentes.')
+    parser.add_argument('--linhas', type=int, default=100_000, help='Imóveis sintéticos no banco (padrão: 100000)')
+    parser.add_argument('--repeticoes', type=int, default=REPETICOES, help='Medições por endpoint (padrão: 5)')
+    parser.add_argument('--escala-orcamento', type=float, default=1.0, help='Multiplica os orçamentos (ex.: máquina lenta)')
+    parser.add_argument('--mostrar-planos', action='store_true', help='Imprime o plano de todas as consultas')
+    parser.add_argument('--saida', help='Arquivo JSON com planos e tempos')
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.WARNING)
+    resultados = []
+    try:
+        with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as pasta:
+            os.environ['IMOVEIS_DATABASE_URI'] = f"sqlite:///{os.path.join(pasta, 'planos.db')}"
+            from app import create_app, db
+
+            app = create_app()
+            with app.app_context():
+                inicio = time.perf_counter()
+                semear(args.linhas)
+                print(f'{args.linhas} imóveis semeados em {time.perf_counter() - inicio:.1f}s', flush=True)
+                captura = Captura(db.engine)
+            for caminho, orcamento in ENDPOINTS:
+                resultado = verificar(app, captura, caminho, orcamento * args.escala_orcamento, args.repeticoes)
+                resultados.append(resultado)
+                situacao = 'ok' if resultado['ok'] else 'FALHA'
+                print(f"  {situacao:<5} {resultado['mediana_ms']:>8.1f} ms (orçamento {resultado['orcamento_ms']:.0f})  {caminho}", flush=True)
+                for consulta in resultado['consultas']:
+                    if args.mostrar_planos or consulta['problemas']:
+                        print(f"        {consulta['sql'][:160]}")
+                        for detalhe in consulta['plano']:
+                            marca = '!!' if detalhe in consulta['problemas'] else '  '
+                            print(f'        {marca} {detalhe}')
+            with app.app_context():
+                db.engine.dispose()
+    finally:
+        logging.disable(logging.NOTSET)
+
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump({
+                'gerado_em': datetime.now().isoformat(timespec='seconds'),
+                'linhas': args.linhas,
+                'resultados': resultados,
+            }, f, indent=2, ensure_ascii=False)
+        print(f'Resultados gravados em {args.saida}')
+
+    falhas = [r for r in resultados if not r['ok']]
+    for r in falhas:
+        motivos = sorted({p for c in r['consultas'] for p in c['problemas']})
+        if r['acima_do_orcamento']:
+            motivos.append(f"{r['mediana_ms']} ms > {r['orcamento_ms']:.0f} ms")
+        print(f"FALHA {r['caminho']}: {'; '.join(motivos)}", file=sys.stderr)
+    return 1 if falhas else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""
+Vazão da raspagem contra o simulador local: baixa a lista e busca as páginas
+de detalhe com diferentes quantidades de workers, sob a latência, erros e
+limites configurados. Não usa banco de dados.
+
+    python -m benchmarks.raspagem --workers 1,4,8,16 --imoveis 500 --latencia-ms 80 --taxa-429 0.05 --limite-rps 30
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from benchmarks import simulador as simulador_local
+
+UF_BENCHMARK = 'ZZ'
+
+def medir(simulador, workers):
+    """Roda download + raspagem de UF_BENCHMARK e devolve as medidas da rodada."""
+    from app import metricas, scraper
+
+    simulador.zerar_estatisticas()
+    paginas_antes = {r: metricas.PAGINAS.valor(uf=UF_BENCHMARK, resultado=r) for r in ('ok', 'erro')}
+    with tempfile.TemporaryDirectory() as pasta:
+        scraper.PASTA_TEMPORARIOS = pasta
+        scraper.URL_BASE = simulador.url_base
+
+        inicio = time.perf_counter()
+        eventos = list(scraper.baixar_listas_por_estados([UF_BENCHMARK]))
+        download = time.perf_counter() - inicio
+        erros = [e['message'] for e in eventos if e.get('type') == 'error']
+        if erros:
+            raise RuntimeError(erros[0])
+
+        inicio = time.perf_counter()
+        for _ in scraper.processar_arquivos_csv([os.path.join(pasta, f'{UF_BENCHMARK}.csv')], max_workers=workers):
+            pass
+        raspagem = time.perf_counter() - inicio
+
+    paginas = {r: metricas.PAGINAS.valor(uf=UF_BENCHMARK, resultado=r) - paginas_antes[r] for r in ('ok', 'erro')}
+    total = paginas['ok'] + paginas['erro']
+    return {
+        'workers': workers,
+        'download_segundos': round(download, 3),
+        'raspagem_segundos': round(raspagem, 3),
+        'paginas': total,
+        'paginas_por_segundo': round(total / raspagem, 2) if raspagem else None,
+        'paginas_com_falha': paginas['erro'],
+        'respostas_servidor': simulador.resumo(),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.raspagem', description='Vazão da raspagem contra o simulador.')
+    parser.add_argument('--workers', default='1,4,8', help='Quantidades de workers a medir, separadas por vírgula')
+    parser.add_argument('--saida', help='Arquivo JSON com os resultados')
+    simulador_local.adicionar_argumentos(parser)
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.WARNING)
+    simulador = simulador_local.a_partir_de_argumentos(args).iniciar()
+    resultados = []
+    try:
+        for workers in [int(w) for w in args.workers.split(',') if w.strip()]:
+            r = medir(simulador, workers)
+            resultados.append(r)
+            print(
+                f"workers={workers:<3} {r['paginas_por_segundo']:>8} páginas/s  "
+                f"falhas={r['paginas_com_falha']:<5} servidor={r['respostas_servidor']}",
+                flush=True
+            )
+    finally:
+        simulador.parar()
+        logging.disable(logging.NOTSET)
+
+    if args.saida:
+        parametros = {k: v for k, v in vars(args).items() if k not in ('saida', 'workers')}
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump({'parametros': parametros, 'resultados': resultados}, f, indent=2, ensure_ascii=False)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
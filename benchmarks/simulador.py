@@ -0,0 +1,212 @@
+"""
+Servidor HTTP local que imita o site de venda de imóveis da Caixa: entrega
+as listas /listaweb/Lista_imoveis_XX.csv e as páginas de detalhe (leilão,
+licitação e venda direta) geradas por benchmarks.dados. Latência, erros,
+respostas 429 e um teto de requisições por segundo são configuráveis, para
+medir a vazão do scraper sem tocar no site real.
+
+    python -m benchmarks.simulador --porta 8765 --imoveis 1000 --latencia-ms 80 --taxa-429 0.05 --limite-rps 20
+    CAIXA_BASE_URL=http://127.0.0.1:8765 python -m app.cli refresh --states SP --workers 8
+
+GET /__estatisticas devolve as contagens de respostas por status.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from collections import Counter
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from benchmarks import dados
+
+class Simulador:
+    """
+    Estado do servidor. Parâmetros de comportamento:
+      latencia_ms / variacao_ms  atraso de cada resposta (média e variação uniforme)
+      taxa_erro                  fração de páginas de detalhe respondidas com 503
+      taxa_429                   fração de páginas de detalhe respondidas com 429 + Retry-After
+      limite_rps                 teto de requisições por segundo (None = sem teto)
+      modo_limite                'atrasar' enfileira o excesso; 'rejeitar' responde 429
+    """
+
+    def __init__(self, imoveis_por_uf=1000, porta=0, latencia_ms=0, variacao_ms=0, taxa_erro=0.0,
+                 taxa_429=0.0, limite_rps=None, modo_limite='atrasar', retry_after=1, semente=42):
+        self.imoveis_por_uf = imoveis_por_uf
+        self.latencia_ms = latencia_ms
+        self.variacao_ms = variacao_ms
+        self.taxa_erro = taxa_erro
+        self.taxa_429 = taxa_429
+        self.limite_rps = limite_rps
+        self.modo_limite = modo_limite
+        self.retry_after = retry_after
+        self.estatisticas = Counter()
+        self.servidor = ThreadingHTTPServer(('127.0.0.1', porta), _Handler)
+        self.servidor.daemon_threads = True
+        self.servidor.simulador = self
+        self._aleatorio = random.Random(semente)
+        self._csvs = {}
+        self._lock = threading.Lock()
+        self._proximo_horario = 0.0
+        self._thread = None
+
+    @property
+    def url_base(self):
+        host, porta = self.servidor.server_address[:2]
+        return f'http://{host}:{porta}'
+
+    def lista_csv(self, uf):
+        with self._lock:
+            if uf not in self._csvs:
+                with tempfile.TemporaryDirectory() as pasta:
+                    caminho = dados.gerar_csv(os.path.join(pasta, f'{uf}.csv'), self.imoveis_por_uf, uf, self.url_base)
+                    with open(caminho, 'rb') as f:
+                        self._csvs[uf] = f.read()
+            return self._csvs[uf]
+
+    def _sortear(self):
+        with self._lock:
+            return self._aleatorio.random(), self._aleatorio.uniform(-1, 1)
+
+    def reservar_vaga(self):
+        """
+        Aplica o teto de requisições por segundo. Devolve quanto esperar
+        (segundos) ou None quando a requisição deve ser rejeitada.
+        """
+        if not self.limite_rps:
+            return 0.0
+        intervalo = 1.0 / self.limite_rps
+        with self._lock:
+            agora = time.monotonic()
+            horario = max(agora, self._proximo_horario)
+            if horario > agora and self.modo_limite == 'rejeitar':
+                return None
+            self._proximo_horario = horario + intervalo
+            return horario - agora
+
+    def atraso(self):
+        _, variacao = self._sortear()
+        return max(0.0, self.latencia_ms + variacao * self.variacao_ms) / 1000
+
+    def falha_sorteada(self):
+        """Status de falha a simular para uma página de detalhe, ou None."""
+        sorteio, _ = self._sortear()
+        if sorteio < self.taxa_429:
+            return 429
+        if sorteio < self.taxa_429 + self.taxa_erro:
+            return 503
+        return None
+
+    def contar(self, status):
+        with self._lock:
+            self.estatisticas[status] += 1
+
+    def resumo(self):
+        with self._lock:
+            return {str(status): n for status, n in sorted(self.estatisticas.items())}
+
+    def zerar_estatisticas(self):
+        with self._lock:
+            self.estatisticas.clear()
+
+    def iniciar(self):
+        self._thread = threading.Thread(target=self.servidor.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def parar(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Cabeçalhos e corpo saem em escritas separadas: com Nagle ligado, uma conexão
+    # keep-alive esperaria o ACK atrasado do cliente (~40 ms) a cada resposta.
+    disable_nagle_algorithm = True
+
+    def log_message(self, formato, *args):
+        pass
+
+    def _responder(self, status, corpo, tipo, cabecalhos=None):
+        self.server.simulador.contar(status)
+        self.send_response(status)
+        self.send_header('Content-Type', tipo)
+        self.send_header('Content-Length', str(len(corpo)))
+        for nome, valor in (cabecalhos or {}).items():
+            self.send_header(nome, valor)
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def do_GET(self):
+        simulador = self.server.simulador
+        url = urlparse(self.path)
+        if url.path == '/__estatisticas':
+            self._responder(200, json.dumps(simulador.resumo()).encode('utf-8'), 'application/json')
+            return
+
+        espera = simulador.reservar_vaga()
+        if espera is None:
+            self._responder(429, b'limite de requisicoes', 'text/plain', {'Retry-After': str(simulador.retry_after)})
+            return
+        time.sleep(espera + simulador.atraso())
+
+        if url.path.startswith('/listaweb/Lista_imoveis_') and url.path.endswith('.csv'):
+            uf = url.path.rsplit('_', 1)[-1][:-4].upper()
+            self._responder(200, simulador.lista_csv(uf), 'text/csv; charset=iso-8859-1')
+        elif url.path == dados.CAMINHO_DETALHE:
+            falha = simulador.falha_sorteada()
+            if falha == 429:
+                self._responder(429, b'muitas requisicoes', 'text/plain', {'Retry-After': str(simulador.retry_after)})
+                return
+            if falha:
+                self._responder(falha, b'servico indisponivel', 'text/plain')
+                return
+            try:
+                numero = int(parse_qs(url.query)['hdnimovel'][0])
+            except (KeyError, ValueError):
+                self._responder(400, b'hdnimovel invalido', 'text/plain')
+                return
+            indice = numero - dados.numero_imovel(0)
+            modalidade = dados.MODALIDADES[indice % len(dados.MODALIDADES)]
+            html = dados.pagina_detalhe(numero, modalidade).encode('utf-8')
+            self._responder(200, html, 'text/html; charset=utf-8')
+        else:
+            self._responder(404, b'nao encontrado', 'text/plain')
+
+def adicionar_argumentos(parser):
+    """Opções de comportamento do simulador, compartilhadas com benchmarks.raspagem."""
+    parser.add_argument('--imoveis', type=int, default=1000, help='Imóveis por lista de UF (padrão: 1000)')
+    parser.add_argument('--latencia-ms', type=float, default=0, help='Latência média por resposta em ms')
+    parser.add_argument('--variacao-ms', type=float, default=0, help='Variação uniforme (±) da latência em ms')
+    parser.add_argument('--taxa-erro', type=float, default=0.0, help='Fração de páginas de detalhe com 503')
+    parser.add_argument('--taxa-429', type=float, default=0.0, help='Fração de páginas de detalhe com 429')
+    parser.add_argument('--limite-rps', type=float, help='Teto de requisições por segundo')
+    parser.add_argument('--modo-limite', choices=['atrasar', 'rejeitar'], default='atrasar',
+                        help='Excesso sobre o teto: enfileirar ou responder 429 (padrão: atrasar)')
+    parser.add_argument('--retry-after', type=int, default=1, help='Valor do cabeçalho Retry-After nas respostas 429')
+
+def a_partir_de_argumentos(args, porta=0):
+    return Simulador(
+        imoveis_por_uf=args.imoveis, porta=porta, latencia_ms=args.latencia_ms, variacao_ms=args.variacao_ms,
+        taxa_erro=args.taxa_erro, taxa_429=args.taxa_429, limite_rps=args.limite_rps,
+        modo_limite=args.modo_limite, retry_after=args.retry_after
+    )
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.simulador', description='Simulador local do site da Caixa.')
+    parser.add_argument('--porta', type=int, default=8765)
+    adicionar_argumentos(parser)
+    args = parser.parse_args(argv)
+    simulador = a_partir_de_argumentos(args, args.porta)
+    print(f'Simulador em {simulador.url_base}', flush=True)
+    try:
+        simulador.servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulador.servidor.server_close()
+
+if __name__ == '__main__':
+    main()
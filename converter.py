@@ -1,13 +1,17 @@
 import pandas as pd
 import os
-import re
-import unidecode
-from app import db
-from app.models import Imovel, Atualizacao
+import time
+from collections import Counter
+from app import db, analise, buscas_salvas, cache, historico, identidade, metricas
+from app.models import Imovel, Atualizacao, converter_data
 import logging
 
 logging.basicConfig(level=logging.INFO)
 
+# Valores por consulta IN ao procurar os imóveis da planilha no banco (o
+# SQLite limita as variáveis de um comando).
+TAMANHO_BLOCO = 500
+
 def _clean_currency(value):
     """Limpa e converte valores monetários para float."""
     if not isinstance(value, str):
@@ -28,23 +32,30 @@ def _clean_area(value):
     except (ValueError, TypeError):
         return None
 
-def _generate_address_initials(address):
-    """Gera as 3 primeiras iniciais do endereço em maiúsculas, ignorando acentos e símbolos."""
-    if not isinstance(address, str) or not address.strip():
-        return ''
-    normalized_address = unidecode.unidecode(address).upper()
-    cleaned_address = re.sub(r'[^A-Z\s]', '', normalized_address)
-    words = cleaned_address.split()
-    initials = [word[0] for word in words if word]
-    return "".join(initials[:3])
+def _imoveis_da_planilha(ufs, matriculas, numeros, chaves):
+    """
+    Imóveis das UFs da planilha que podem corresponder às linhas dela: pela
+    chave composta, pelo número da Caixa ou pelo endereço normalizado (os
+    candidatos de IndiceEquivalencia), em vez de todos os imóveis das UFs.
+    """
+    encontrados = {}
+    for coluna, valores in ((Imovel.MATRICULA, matriculas), (Imovel.NUMERO_CAIXA, numeros), (Imovel.CHAVE_ENDERECO, chaves)):
+        valores = sorted(valores)
+        for inicio in range(0, len(valores), TAMANHO_BLOCO):
+            bloco = valores[inicio:inicio + TAMANHO_BLOCO]
+            for imovel in Imovel.query.filter(Imovel.UF.in_(ufs), coluna.in_(bloco)):
+                encontrados[(imovel.UF, imovel.MATRICULA)] = imovel
+    return encontrados
 
 def process_excel_file(file_path):
     """Processa um arquivo Excel com uma chave única e previne duplicatas na mesma execução."""
     try:
+        inicio = time.perf_counter()
         df = pd.read_excel(file_path)
         column_mapping = {
             'MATRICULA': 'MATRICULA', 'TIPO': 'TIPO', 'UF': 'UF', 'CIDADE': 'CIDADE',
             'BAIRRO': 'BAIRRO', 'ENDERECO': 'ENDERECO', 'ENDEREÇO': 'ENDERECO',
+            'DESCRICAO': 'DESCRICAO', 'DESCRIÇÃO': 'DESCRICAO', 'Descrição': 'DESCRICAO',
             'Área privativa': 'AREA_PRIVATIVA', 'Area_privativa': 'AREA_PRIVATIVA', 'AREA_PRIVATIVA': 'AREA_PRIVATIVA',
             'Área do terreno': 'AREA_DO_TERRENO', 'Area_do_terreno': 'AREA_DO_TERRENO', 'AREA_DO_TERRENO': 'AREA_DO_TERRENO',
             'DATA DISPUTA': 'DATA_DISPUTA', 'DESCONTO': 'DESCONTO', 'PRECO': 'PRECO', 'PREÇO': 'PRECO',
@@ -56,61 +67,91 @@ def process_excel_file(file_path):
         ufs_no_arquivo = [str(uf).strip().upper() for uf in df['UF'].dropna().unique()]
         if ufs_no_arquivo:
             Atualizacao.query.filter(Atualizacao.UF.in_(ufs_no_arquivo)).delete(synchronize_session=False)
-            db.session.commit()
+        execucao_id = historico.iniciar_execucao('excel', ufs_no_arquivo)
+        db.session.commit()
 
+        alteracoes_historico = []
         processed_ids = set() 
         processed_count = 0
-        
-        for _, row in df.iterrows():
-            if pd.isna(row.get('MATRICULA')) or pd.isna(row.get('UF')) or pd.isna(row.get('ENDERECO')):
-                continue
+        contagem = Counter()
 
-            original_matricula = str(row['MATRICULA']).strip()
+        # Chaves calculadas de uma vez para a planilha toda, e os imóveis que
+        # correspondem a elas carregados em poucas consultas em vez de uma por linha.
+        validas = df[df['MATRICULA'].notna() & df['UF'].notna() & df['ENDERECO'].notna()]
+        enderecos = validas['ENDERECO'].astype(str)
+        ids = identidade.gerar_ids(validas['UF'].astype(str), validas['MATRICULA'].astype(str), enderecos)
+        chaves = identidade.chaves_endereco(enderecos)
+        numeros = (identidade.numeros_caixa(validas['LINK']) if 'LINK' in validas.columns
+                   else pd.Series(None, index=validas.index, dtype=object))
+        existentes = _imoveis_da_planilha(
+            ufs_no_arquivo, set(ids), {n for n in numeros if isinstance(n, str)}, {c for c in chaves if isinstance(c, str)}
+        )
+        equivalencias = identidade.IndiceEquivalencia(existentes.values())
+
+        for indice, row in validas.iterrows():
             uf = str(row['UF']).strip().upper()
-            endereco = str(row['ENDERECO'])
+            unique_matricula_id = ids[indice]
+            numero, chave = numeros[indice], chaves[indice]
+            numero = numero if isinstance(numero, str) else None
+
+            imovel_existente = existentes.get((uf, unique_matricula_id))
+            if imovel_existente is None:
+                # Mesmo imóvel com outra chave (ex.: planilha exportada pelo próprio
+                # dashboard, que já traz a MATRICULA composta).
+                imovel_existente = equivalencias.buscar(uf, numero, row.get('CIDADE'), chave)
+                if imovel_existente is not None:
+                    unique_matricula_id = imovel_existente.MATRICULA
 
-            address_initials = _generate_address_initials(endereco)
-            unique_matricula_id = f"{uf}{original_matricula}{address_initials}"
-            
             if unique_matricula_id in processed_ids:
                 continue
             processed_ids.add(unique_matricula_id)
 
             imovel_dict = {}
             for col in df.columns:
-                if col in Imovel.__table__.columns.keys() and pd.notna(row.get(col)):
-                    if col in ['PRECO', 'AVALIACAO']:
+                if col in Imovel.__table__.columns.keys() and col != 'DATA_DISPUTA_DT' and pd.notna(row.get(col)):
+                    if col in ['PRECO', 'AVALIACAO', 'PRECO_LEILAO_1', 'PRECO_LEILAO_2']:
                         imovel_dict[col] = _clean_currency(row[col])
                     elif col in ['AREA_PRIVATIVA', 'AREA_DO_TERRENO']:
                         imovel_dict[col] = _clean_area(row[col])
+                    elif col in ['DATA_LEILAO_1', 'DATA_LEILAO_2']:
+                        imovel_dict[col] = converter_data(row[col])
                     else:
                         imovel_dict[col] = str(row[col]).strip()
             
             imovel_dict['MATRICULA'] = unique_matricula_id
             imovel_dict['UF'] = uf
-
-            imovel_existente = db.session.query(Imovel).filter_by(UF=uf, MATRICULA=unique_matricula_id).first()
+            imovel_dict['NUMERO_CAIXA'] = numero
+            imovel_dict['CHAVE_ENDERECO'] = chave if isinstance(chave, str) else None
 
             if not imovel_existente:
                 imovel_dict['Status'] = 'Novo'
                 novo_imovel = Imovel(**imovel_dict)
                 db.session.add(novo_imovel)
+                existentes[(uf, unique_matricula_id)] = novo_imovel
+                equivalencias.adicionar(novo_imovel)
+                historico.registrar(alteracoes_historico, uf, unique_matricula_id, 'Status', None, 'Novo')
+                historico.registrar(alteracoes_historico, uf, unique_matricula_id, 'PRECO', None, imovel_dict.get('PRECO'))
                 
                 atualizacao = Atualizacao(
                     UF=uf,
                     MATRICULA=unique_matricula_id,
                     Change='Novo',
-                    ChangedFields=",".join([k for k in imovel_dict.keys() if k not in ['UF', 'MATRICULA']])
+                    ChangedFields=",".join([k for k in imovel_dict.keys() if k not in ['UF', 'MATRICULA'] and k not in identidade.COLUNAS])
                 )
                 for field in ['TIPO', 'CIDADE', 'PRECO', 'LINK']:
                     if field in imovel_dict:
                         setattr(atualizacao, field, imovel_dict[field])
                 db.session.add(atualizacao)
                 processed_count += 1
+                contagem[(uf, 'nova')] += 1
             else:
                 changed_fields = []
                 for key, value in imovel_dict.items():
-                    if key not in ['UF', 'MATRICULA']: 
+                    if key in identidade.COLUNAS:
+                        # Chaves secundárias não são mudança do imóvel: só completa as que faltam.
+                        if value and getattr(imovel_existente, key) != value:
+                            setattr(imovel_existente, key, value)
+                    elif key not in ['UF', 'MATRICULA']: 
                         current_value = getattr(imovel_existente, key)
                         if key in ['AREA_PRIVATIVA', 'AREA_DO_TERRENO']:
                             current_value = current_value if current_value is not None else None
@@ -121,7 +162,9 @@ def process_excel_file(file_path):
                 
                 if changed_fields:
                     for key in changed_fields:
+                        historico.registrar(alteracoes_historico, uf, unique_matricula_id, key, getattr(imovel_existente, key), imovel_dict[key])
                         setattr(imovel_existente, key, imovel_dict[key])
+                    historico.registrar(alteracoes_historico, uf, unique_matricula_id, 'Status', imovel_existente.Status, 'Atualizado')
                     imovel_existente.Status = 'Atualizado'
                     
                     atualizacao = Atualizacao(
@@ -135,11 +178,29 @@ def process_excel_file(file_path):
                             setattr(atualizacao, field, imovel_dict[field])
                     db.session.add(atualizacao)
                     processed_count += 1
+                    contagem[(uf, 'atualizada')] += 1
                 else:
                     if imovel_existente.Status == 'Novo':
                         imovel_existente.Status = 'Existente'
+                    contagem[(uf, 'inalterada')] += 1
 
+        historico.gravar(execucao_id, alteracoes_historico)
+        duracao = time.perf_counter() - inicio
+        historico.finalizar_execucao(execucao_id, {
+            'sincronizacao_segundos': round(duracao, 3),
+            'linhas_lidas': len(df),
+            'linhas_sincronizadas': len(processed_ids),
+            'linhas_por_segundo': round(len(processed_ids) / duracao, 2) if duracao else None,
+            'novas_ou_atualizadas': processed_count,
+        })
+        historico.compactar()
+        analise.recalcular(ufs_no_arquivo)
+        buscas_salvas.atualizar(execucao_id)
+        cache.incrementar_versao()
         db.session.commit()
+        for (uf, resultado), n in contagem.items():
+            metricas.LINHAS_SINCRONIZADAS.inc(n, origem='excel', uf=uf, resultado=resultado)
+        metricas.SYNC_SEGUNDOS.observar(duracao, origem='excel')
         
         logging.info(f"Arquivo processado. {processed_count} imóveis novos/atualizados de {len(df)} linhas lidas.")
         return True, f"Sucesso! {processed_count} imóveis foram adicionados ou atualizados."
@@ -1,20 +1,66 @@
+"""
+Inicia o dashboard. Por padrão usa o waitress (servidor WSGI de produção,
+com várias threads) quando ele está instalado; sem ele, cai no servidor de
+desenvolvimento do Flask em modo multithread.
+
+    python run.py                                  # waitress, 16 threads, abre o navegador
+    python run.py --servidor dev                   # servidor de desenvolvimento do Flask
+    python run.py --host 0.0.0.0 --threads 32 --sem-navegador
+
+Cada stream SSE (/processar, /api/tarefas/<id>/eventos) ocupa uma thread
+enquanto está aberto, então --threads deve cobrir os streams simultâneos mais
+as chamadas de API do dashboard. Em Linux também dá para usar o gunicorn:
+
+    gunicorn -w 2 -k gthread --threads 16 -b 0.0.0.0:5000 'app:create_app()'
+
+Os jobs de raspagem são coordenados pelo banco, então vários workers não
+disparam a mesma UF duas vezes.
+"""
+import argparse
+import logging
 import webbrowser
 import threading
 import os
-from app import create_app, db
+from app import create_app
 
 app = create_app()
 
-def abrir_navegador():
+def abrir_navegador(url):
     """Função para abrir o navegador na página inicial da aplicação."""
-    webbrowser.open_new('http://127.0.0.1:5000/')
+    webbrowser.open_new(url)
+
+def servir(servidor, host, porta, threads):
+    if servidor == 'waitress':
+        try:
+            from waitress import serve
+        except ImportError:
+            logging.warning("waitress não está instalado (pip install waitress); usando o servidor de desenvolvimento.")
+        else:
+            logging.info(f"Servindo com waitress em http://{host}:{porta}/ ({threads} threads).")
+            # channel_timeout acima do keep-alive das SSE (15s) para não derrubar streams ociosos.
+            serve(app, host=host, port=porta, threads=threads, channel_timeout=120, ident='Bot-Caixa')
+            return
+    app.run(host=host, port=porta, debug=False, threaded=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Dashboard de imóveis da Caixa.')
+    parser.add_argument('--servidor', choices=['waitress', 'dev'], default=os.environ.get('IMOVEIS_SERVIDOR', 'waitress'),
+                        help='waitress (padrão, produção) ou dev (servidor do Flask)')
+    parser.add_argument('--host', default=os.environ.get('IMOVEIS_HOST', '127.0.0.1'))
+    parser.add_argument('--porta', type=int, default=int(os.environ.get('IMOVEIS_PORTA', 5000)))
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('IMOVEIS_THREADS', 16)),
+                        help='Threads do waitress (padrão: 16)')
+    parser.add_argument('--sem-navegador', action='store_true', help='Não abre o navegador ao iniciar')
+    args = parser.parse_args(argv)
 
-if __name__ == '__main__':
     os.makedirs('temporarios', exist_ok=True)
-    
-    with app.app_context():
-        db.create_all()
-    thread_navegador = threading.Timer(1.25, abrir_navegador)
-    thread_navegador.daemon = True 
-    thread_navegador.start()
-    app.run(port=5000, debug=False)
\ No newline at end of file
+
+    if not args.sem_navegador:
+        endereco = '127.0.0.1' if args.host in ('0.0.0.0', '::') else args.host
+        thread_navegador = threading.Timer(1.25, abrir_navegador, args=(f'http://{endereco}:{args.porta}/',))
+        thread_navegador.daemon = True
+        thread_navegador.start()
+    servir(args.servidor, args.host, args.porta, args.threads)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+import logging
+import pytest
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """Aplicação com um banco SQLite vazio em tmp_path, já migrado."""
+    monkeypatch.setenv('IMOVEIS_DATABASE_URI', f"sqlite:///{tmp_path / 'imoveis.db'}")
+    from app import busca, cache, create_app, db
+
+    logging.disable(logging.WARNING)
+    cache.limpar()
+    monkeypatch.setattr(busca, '_fts_disponivel', None)
+    app = create_app()
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+    cache.limpar()
+    logging.disable(logging.NOTSET)
+
+@pytest.fixture
+def inserir(app):
+    """Grava imóveis direto na tabela: inserir(MATRICULA='1', UF='SP', ...)."""
+    from app import db
+    from app.models import Imovel
+
+    def inserir(**campos):
+        campos.setdefault('UF', 'SP')
+        campos.setdefault('Status', 'Existente')
+        imovel = Imovel(**campos)
+        db.session.add(imovel)
+        db.session.commit()
+        return imovel
+    return inserir
@@ -0,0 +1,61 @@
+import pytest
+from app import busca, db
+from app.models import Imovel
+
+@pytest.mark.parametrize('texto, esperado', [
+    ('rua flo', '"rua"* "flo"*'),
+    ('  Rua   das Flores ', '"rua"* "das"* "flores"*'),
+    ('São Paulo', '"são"* "paulo"*'),
+    # Operadores e aspas do FTS5 não passam para a expressão.
+    ('casa OR "apto" NEAR(x) -centro*', '"casa"* "or"* "apto"* "near"* "x"* "centro"*'),
+    ('apto 302-B', '"apto"* "302"* "b"*'),
+    ('', ''),
+    ('"*()-', ''),
+])
+def test_montar_expressao_fts(texto, esperado):
+    assert busca.montar_expressao_fts(texto) == esperado
+
+def _matriculas(texto):
+    query, _ = busca.filtrar_por_texto(db.session.query(Imovel.MATRICULA), texto)
+    return sorted(matricula for matricula, in query)
+
+@pytest.fixture
+def imoveis(inserir):
+    inserir(MATRICULA='1', ENDERECO='RUA DAS FLORES, 10', BAIRRO='CENTRO', CIDADE='SÃO PAULO', DESCRICAO='Casa, 2 qto(s)')
+    inserir(MATRICULA='2', ENDERECO='AV. PAULISTA, 900', BAIRRO='BELA VISTA', CIDADE='SAO PAULO', DESCRICAO='Apartamento, 1 qto(s)')
+    inserir(MATRICULA='3', ENDERECO='RUA FLORIANO PEIXOTO', BAIRRO='CENTRO', CIDADE='CAMPINAS', DESCRICAO='Casa, 3 qto(s)')
+
+def test_filtrar_por_texto_fts(imoveis):
+    assert busca.fts_disponivel()
+    assert _matriculas('rua flo') == ['1', '3']
+    assert _matriculas('casa centro campinas') == ['3']
+    # remove_diacritics: "sao" casa com "SÃO".
+    assert _matriculas('sao paulo') == ['1', '2']
+    assert _matriculas('inexistente') == []
+
+def test_filtrar_por_texto_segue_alteracoes(imoveis):
+    imovel = db.session.get(Imovel, ('SP', '2'))
+    imovel.ENDERECO = 'RUA DAS FLORES, 20'
+    db.session.delete(db.session.get(Imovel, ('SP', '1')))
+    db.session.commit()
+    assert _matriculas('flores') == ['2']
+
+def test_filtrar_por_texto_sem_termos_nao_filtra(imoveis):
+    query, relevancia = busca.filtrar_por_texto(db.session.query(Imovel.MATRICULA), ' -* ')
+    assert relevancia is None
+    assert query.count() == 3
+
+def test_filtrar_por_texto_sem_fts_usa_like(imoveis, monkeypatch):
+    monkeypatch.setattr(busca, '_fts_disponivel', False)
+    query, relevancia = busca.filtrar_por_texto(db.session.query(Imovel.MATRICULA), 'rua flo')
+    assert relevancia is None
+    assert sorted(m for m, in query) == ['1', '3']
+
+def test_indice_reconstruido_apos_compactar(imoveis):
+    from app import migracoes
+
+    db.session.execute(db.text("DELETE FROM imoveis WHERE MATRICULA = '1'"))
+    db.session.commit()
+    db.session.remove()
+    migracoes.compactar(db.engine)
+    assert _matriculas('rua') == ['3']
@@ -0,0 +1,106 @@
+import pytest
+from app import buscas_salvas, datalogic, db, identidade, reprocessamento, scraper
+from app.models import BuscaSalva, PaginaPendente, ResultadoBusca
+
+def _linha(numero, **campos):
+    linha = {
+        'UF': 'SP', 'MATRICULA': f'SP{numero}', 'CIDADE': 'CAMPINAS', 'BAIRRO': 'CENTRO',
+        'ENDERECO': f'RUA A, {numero}', 'DESCRICAO': 'Casa', 'TIPO': 'Casa', 'PRECO': 100000.0 + numero,
+        'AVALIACAO': 200000.0, 'DESCONTO': '50%', 'MODALIDADE': 'Venda Online',
+        'LINK': f'http://caixa/detalhe?hdnimovel={numero}', 'FGTS': 'SIM', 'FINANCIAMENTO': 'SIM',
+        'DATA_DISPUTA': '10/11/2026',
+    }
+    linha.update(campos)
+    return linha
+
+def _sincronizar(*linhas):
+    sincronizacao = datalogic.Sincronizacao(['SP'])
+    sincronizacao.processar_lote(list(linhas))
+    return sincronizacao.finalizar()
+
+def _resultados(busca_salva):
+    return sorted(matricula for _, matricula in db.session.query(ResultadoBusca.UF, ResultadoBusca.MATRICULA).filter_by(busca_id=busca_salva.id))
+
+def _recalculados(busca_salva):
+    """Resultados de uma avaliação completa, para comparar com a incremental."""
+    return sorted(matricula for _, matricula in buscas_salvas._atendem(busca_salva))
+
+def _novos(busca_salva):
+    return {item['id']: item['novos'] for item in buscas_salvas.listar()}[busca_salva.id]
+
+@pytest.mark.parametrize('filtros', [
+    {'cor': 'azul'},
+    {'status': 'Vendidos'},
+    {'preco_min': 'barato'},
+    {'data_inicio': '31/02/2026'},
+    ['uf', 'SP'],
+])
+def test_validar_filtros_rejeita_invalidos(filtros):
+    with pytest.raises(ValueError):
+        buscas_salvas.validar_filtros(filtros)
+
+def test_validar_filtros_descarta_vazios():
+    assert buscas_salvas.validar_filtros({'uf': ' sp ', 'cidade': '', 'q': None, 'preco_max': 150000}) == {
+        'uf': 'sp', 'preco_max': '150000',
+    }
+
+def test_busca_criada_tem_os_mesmos_imoveis_de_api_data(app):
+    _sincronizar(_linha(1), _linha(2, CIDADE='SANTOS'), _linha(3, PRECO=300000.0), _linha(4))
+    filtros = {'uf': 'SP', 'cidade': 'campinas', 'preco_max': '200000'}
+    busca_salva = buscas_salvas.criar('Campinas', filtros)
+    registros = app.test_client().get('/api/data', query_string=filtros).get_json()
+    assert _resultados(busca_salva) == sorted(r['MATRICULA'] for r in registros) == ['SP1', 'SP4']
+    # Os que já atendiam ao criar a busca não contam como novos.
+    assert _novos(busca_salva) == 0
+
+def test_sincronizacao_confere_so_o_que_gravou(app):
+    _sincronizar(_linha(1), _linha(2), _linha(3))
+    busca_salva = buscas_salvas.criar('Ativos até 150 mil', {'status': 'Ativos', 'preco_max': '150000'})
+    assert _resultados(busca_salva) == ['SP1', 'SP2', 'SP3']
+
+    # SP1 sobe de preço, SP3 expira, SP4 é novo e SP2 não muda.
+    _sincronizar(_linha(1, PRECO=180000.0), _linha(2), _linha(4))
+    assert _resultados(busca_salva) == _recalculados(busca_salva) == ['SP2', 'SP4']
+    assert _novos(busca_salva) == 1
+
+    buscas_salvas.marcar_visualizada(busca_salva)
+    assert _novos(busca_salva) == 0
+
+def test_reprocessamento_confere_as_buscas(app, monkeypatch):
+    _sincronizar(_linha(1, FALHA_DETALHE='timeout', FGTS='NÃO'), _linha(2, FGTS='NÃO'))
+    busca_salva = buscas_salvas.criar('Aceita FGTS', {'fgts': 'SIM'})
+    assert _resultados(busca_salva) == []
+    assert PaginaPendente.query.count() == 1
+
+    monkeypatch.setattr(scraper, 'extrair_dados_pagina_imovel', lambda link, modalidade, uf: {'FGTS': 'SIM'})
+    assert reprocessamento.reprocessar_pendentes()['atualizadas'] == 1
+    assert _resultados(busca_salva) == _recalculados(busca_salva) == ['SP1']
+    assert _novos(busca_salva) == 1
+
+def test_rotas_de_buscas_salvas(app, inserir):
+    inserir(MATRICULA='SP1', PRECO=100000.0)
+    cliente = app.test_client()
+    assert cliente.post('/api/saved', json={'filtros': {'uf': 'SP'}}).status_code == 400
+    assert cliente.post('/api/saved', json={'nome': 'SP', 'filtros': {'cor': 'azul'}}).status_code == 400
+
+    resposta = cliente.post('/api/saved', json={'nome': 'SP', 'filtros': {'uf': 'SP'}})
+    assert resposta.status_code == 201
+    busca_id = resposta.get_json()['busca']['id']
+    detalhe = cliente.get(f'/api/saved/{busca_id}').get_json()
+    assert detalhe['total'] == 1
+    assert [imovel['MATRICULA'] for imovel in detalhe['imoveis']] == ['SP1']
+
+    assert cliente.delete(f'/api/saved/{busca_id}').status_code == 200
+    assert cliente.delete(f'/api/saved/{busca_id}').status_code == 404
+    assert BuscaSalva.query.count() == 0
+    assert ResultadoBusca.query.count() == 0
+
+def test_mesclar_duplicatas_leva_os_resultados_junto(app, inserir):
+    inserir(MATRICULA='SP1ABC', NUMERO_CAIXA='1', PRECO=100000.0, Status='Existente')
+    inserir(MATRICULA='SP1', NUMERO_CAIXA='1', PRECO=100000.0, Status='Expirado')
+    busca_salva = buscas_salvas.criar('SP', {'uf': 'SP'})
+    assert _resultados(busca_salva) == ['SP1', 'SP1ABC']
+
+    assert identidade.mesclar_duplicatas() == 1
+    db.session.commit()
+    assert _resultados(busca_salva) == ['SP1ABC']
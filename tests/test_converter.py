@@ -0,0 +1,56 @@
+import pandas as pd
+import converter
+from app import db
+from app.models import Imovel
+
+def _planilha(tmp_path, *linhas):
+    caminho = tmp_path / 'imoveis.xlsx'
+    pd.DataFrame(list(linhas)).to_excel(caminho, index=False)
+    return str(caminho)
+
+def _linha(matricula, uf='SP', **campos):
+    linha = {
+        'MATRICULA': matricula, 'UF': uf, 'CIDADE': 'CAMPINAS', 'BAIRRO': 'CENTRO', 'ENDERECO': 'RUA A, 10',
+        'TIPO': 'Casa', 'PRECO': 'R$ 100.000,00', 'AVALIACAO': 'R$ 200.000,00', 'MODALIDADE': 'Venda Online',
+        'LINK': f'http://caixa/detalhe?hdnimovel={matricula}',
+    }
+    linha.update(campos)
+    return linha
+
+def _imoveis():
+    return {(uf, matricula): (status, preco) for uf, matricula, status, preco in db.session.query(Imovel.UF, Imovel.MATRICULA, Imovel.Status, Imovel.PRECO)}
+
+def test_planilha_reconhece_imovel_gravado_com_outra_chave(app, tmp_path, inserir):
+    inserir(MATRICULA='SP123RA', NUMERO_CAIXA='123', ENDERECO='RUA A, 10', CIDADE='CAMPINAS', PRECO=100000.0)
+    inserir(MATRICULA='SP999RB', NUMERO_CAIXA='999', ENDERECO='RUA B, 20', CIDADE='CAMPINAS', PRECO=50000.0)
+    # A planilha exportada pelo dashboard já traz a MATRICULA composta.
+    sucesso, _ = converter.process_excel_file(_planilha(
+        tmp_path,
+        _linha('SP123RA', LINK='http://caixa/detalhe?hdnimovel=123', PRECO='R$ 90.000,00'),
+        _linha('456', ENDERECO='RUA C, 30'),
+    ))
+    assert sucesso
+    db.session.expire_all()
+    assert _imoveis() == {
+        ('SP', 'SP123RA'): ('Atualizado', 90000.0),
+        ('SP', 'SP999RB'): ('Existente', 50000.0),
+        ('SP', 'SP456RC'): ('Novo', 100000.0),
+    }
+
+def test_planilha_conta_linhas_por_uf_e_resultado(app, tmp_path):
+    from app import metricas
+
+    converter.process_excel_file(_planilha(tmp_path, _linha('1'), _linha('2', uf='RJ')))
+    antes = dict(metricas.LINHAS_SINCRONIZADAS.valores)
+    converter.process_excel_file(_planilha(
+        tmp_path,
+        _linha('1', PRECO='R$ 90.000,00'), _linha('3', ENDERECO='RUA C, 30'),
+        _linha('2', uf='RJ'), _linha('4', uf='RJ', ENDERECO='RUA D, 40'),
+    ))
+
+    def incremento(uf, resultado):
+        rotulos = {'origem': 'excel', 'uf': uf, 'resultado': resultado}
+        return metricas.LINHAS_SINCRONIZADAS.valor(**rotulos) - antes.get(metricas._chave_rotulos(rotulos), 0)
+    # Uma série por UF, com os mesmos resultados da sincronização.
+    assert [incremento('SP', r) for r in ('nova', 'atualizada', 'inalterada')] == [1, 1, 0]
+    assert [incremento('RJ', r) for r in ('nova', 'atualizada', 'inalterada')] == [1, 0, 1]
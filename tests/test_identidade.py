@@ -0,0 +1,34 @@
+import json
+from datetime import datetime, timedelta
+from app import db, identidade
+from app.models import HistoricoAlteracao, Imovel
+
+def _mudancas(app, since):
+    resposta = app.test_client().get('/api/changes', query_string={'since': since})
+    return [json.loads(linha) for linha in resposta.get_data(as_text=True).splitlines()]
+
+def test_mesclar_duplicatas_avisa_a_remocao_em_api_changes(app, inserir):
+    inserir(MATRICULA='SP1ABC', NUMERO_CAIXA='1', Status='Existente')
+    inserir(MATRICULA='SP1', NUMERO_CAIXA='1', Status='Expirado')
+    inserir(UF='RJ', MATRICULA='RJ2', NUMERO_CAIXA='2')
+    antes = (datetime.utcnow() - timedelta(seconds=1)).isoformat()
+
+    assert identidade.mesclar_duplicatas() == 1
+    db.session.commit()
+    assert [i.MATRICULA for i in Imovel.query.filter_by(UF='SP')] == ['SP1ABC']
+    assert [(h.MATRICULA, h.valor_antigo, h.valor_novo) for h in HistoricoAlteracao.query] == [('SP1', 'Expirado', 'Removido')]
+
+    *registros, checkpoint = _mudancas(app, antes)
+    removidos = [r for r in registros if r['op'] == 'deleted']
+    assert [(r['UF'], r['MATRICULA']) for r in removidos] == [('SP', 'SP1')]
+    assert checkpoint['count'] == len(registros)
+    assert checkpoint['since'] >= removidos[0]['updated_at']
+    depois = (datetime.utcnow() + timedelta(seconds=1)).isoformat()
+    assert [r['op'] for r in _mudancas(app, depois)] == ['checkpoint']
+
+def test_mesclar_duplicatas_sem_duplicados_nao_cria_execucao(app, inserir):
+    from app.models import Execucao
+
+    inserir(MATRICULA='SP1', NUMERO_CAIXA='1')
+    assert identidade.mesclar_duplicatas() == 0
+    assert Execucao.query.count() == 0
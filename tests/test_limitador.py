@@ -0,0 +1,145 @@
+import threading
+import time
+import pytest
+import requests
+from app import limitador, scraper
+
+def test_limitador_sobe_aditivamente_ate_o_maximo():
+    atual = limitador.LimitadorAdaptativo(taxa_inicial=1.0, taxa_maxima=2.0, incremento=0.5, nome='teste')
+    atual.registrar_sucesso(0.1)
+    assert atual.taxa == 1.5
+    atual.registrar_sucesso(0.1)
+    atual.registrar_sucesso(0.1)
+    assert atual.taxa == 2.0
+
+def test_limitador_reduz_com_latencia_alta_e_respeita_o_minimo():
+    atual = limitador.LimitadorAdaptativo(taxa_inicial=4.0, taxa_minima=1.5, latencia_alvo=1.0, nome='teste')
+    atual.registrar_sucesso(2.0)
+    assert atual.taxa == 2.0
+    atual._ultima_reducao = 0.0
+    atual.reduzir()
+    assert atual.taxa == 1.5
+
+def test_limitador_falhas_simultaneas_contam_como_um_corte():
+    atual = limitador.LimitadorAdaptativo(taxa_inicial=8.0, nome='teste')
+    for _ in range(5):
+        atual.reduzir()
+    assert atual.taxa == 4.0
+
+def test_limitador_pausa_atrasa_a_proxima_vez():
+    atual = limitador.LimitadorAdaptativo(taxa_inicial=50.0, taxa_maxima=50.0, nome='teste')
+    atual.reduzir(pausa=0.2)
+    inicio = time.monotonic()
+    atual.aguardar_vez()
+    assert time.monotonic() - inicio >= 0.15
+
+def _aberto(pausa=0.05, **opcoes):
+    disjuntor = limitador.Disjuntor(limiar_falhas=2, pausa=pausa, nome='teste', **opcoes)
+    disjuntor.registrar_falha()
+    assert disjuntor.estado == 'fechado'
+    disjuntor.registrar_falha()
+    assert disjuntor.estado == 'aberto'
+    return disjuntor
+
+def test_disjuntor_aberto_bloqueia_ate_a_espera_maxima():
+    disjuntor = _aberto(pausa=10.0)
+    with pytest.raises(limitador.CircuitoAberto):
+        disjuntor.aguardar(espera_maxima=0.1)
+
+def test_disjuntor_teste_com_sucesso_fecha():
+    disjuntor = _aberto()
+    disjuntor.aguardar(espera_maxima=1.0)
+    assert disjuntor.estado == 'meio_aberto'
+    disjuntor.registrar_sucesso()
+    assert disjuntor.estado == 'fechado'
+    disjuntor.aguardar(espera_maxima=0)
+
+def test_disjuntor_meio_aberto_deixa_passar_um_teste_por_vez():
+    disjuntor = _aberto()
+    disjuntor.aguardar(espera_maxima=1.0)
+    with pytest.raises(limitador.CircuitoAberto):
+        disjuntor.aguardar(espera_maxima=0.1)
+
+def test_disjuntor_teste_com_falha_reabre_com_pausa_dobrada():
+    disjuntor = _aberto(pausa=0.05, pausa_maxima=0.08)
+    disjuntor.aguardar(espera_maxima=1.0)
+    disjuntor.registrar_falha()
+    assert disjuntor.estado == 'aberto'
+    assert disjuntor._pausa == 0.08
+
+def test_disjuntor_libera_threads_em_espera_ao_fechar():
+    disjuntor = _aberto()
+    disjuntor.aguardar(espera_maxima=1.0)
+    liberadas = []
+    threads = [threading.Thread(target=lambda: liberadas.append(disjuntor.aguardar(espera_maxima=2.0))) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    disjuntor.registrar_sucesso()
+    for thread in threads:
+        thread.join(3)
+    assert len(liberadas) == 3
+
+@pytest.fixture
+def requisitar(monkeypatch):
+    """scraper._requisitar com disjuntor e limitador próprios e um GET configurável."""
+    monkeypatch.setattr(scraper, '_disjuntor', limitador.Disjuntor(limiar_falhas=1, pausa=0.05, nome='teste'))
+    monkeypatch.setattr(scraper, '_limitador', limitador.LimitadorAdaptativo(taxa_inicial=50.0, nome='teste'))
+    monkeypatch.setattr(scraper, 'ESPERA_MAXIMA_DISJUNTOR', 1.0)
+    respostas = []
+
+    def get(url, timeout, uf=None):
+        resposta = respostas.pop(0)
+        if isinstance(resposta, Exception):
+            raise resposta
+        return resposta
+    monkeypatch.setattr(scraper.cliente_http, 'get', get)
+    return respostas
+
+class _Resposta:
+    status_code = 200
+    headers = {}
+    content = b'ok'
+
+def test_requisitar_falha_inesperada_no_teste_nao_prende_o_disjuntor(requisitar):
+    requisitar.extend([
+        requests.ConnectionError('fora do ar'),
+        requests.exceptions.ChunkedEncodingError('conexão cortada'),
+        _Resposta(),
+    ])
+    with pytest.raises(requests.ConnectionError):
+        scraper._requisitar('http://caixa/1', 1, tentativas=1)
+    assert scraper._disjuntor.estado == 'aberto'
+    # A requisição de teste (meio aberto) falha com uma exceção fora das previstas...
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        scraper._requisitar('http://caixa/2', 1, tentativas=1)
+    assert scraper._disjuntor.estado == 'aberto'
+    # ...e o disjuntor volta a testar depois da pausa, em vez de esperar para sempre.
+    assert scraper._requisitar('http://caixa/3', 1, tentativas=1).content == b'ok'
+    assert scraper._disjuntor.estado == 'fechado'
+
+def test_requisitar_repete_status_repetiveis(requisitar):
+    erro = _Resposta()
+    erro.status_code = 503
+    requisitar.extend([erro, _Resposta()])
+    scraper._disjuntor.limiar_falhas = 5
+    assert scraper._requisitar('http://caixa/1', 1, tentativas=2).status_code == 200
+
+def test_requisitar_sem_limitador_nao_ajusta_a_taxa(requisitar, monkeypatch):
+    scraper._limitador.latencia_alvo = 0.01
+    taxa = scraper._limitador.taxa
+    erro = _Resposta()
+    erro.status_code = 503
+    requisitar.extend([requests.Timeout('lento'), erro])
+    scraper._disjuntor.limiar_falhas = 5
+    get = scraper.cliente_http.get
+
+    def get_lento(url, timeout, uf=None):
+        if not requisitar:
+            time.sleep(0.05)
+            return _Resposta()
+        return get(url, timeout, uf)
+    monkeypatch.setattr(scraper.cliente_http, 'get', get_lento)
+    # Timeout, 503 e um download acima da latência alvo: nada disso é do limitador.
+    assert scraper._requisitar('http://caixa/lista.csv', 1, tentativas=3, usar_limitador=False).content == b'ok'
+    assert scraper._limitador.taxa == taxa
+    assert scraper._disjuntor.estado == 'fechado'
@@ -0,0 +1,98 @@
+import pytest
+from app import datalogic, db
+from app.models import Atualizacao, ChaveExecucao, HistoricoAlteracao, Imovel, PaginaPendente
+
+def _linha(numero, uf='SP', **campos):
+    linha = {
+        'UF': uf, 'MATRICULA': f'{uf}{numero}', 'CIDADE': 'CAMPINAS', 'BAIRRO': 'CENTRO',
+        'ENDERECO': f'RUA A, {numero}', 'DESCRICAO': 'Casa', 'TIPO': 'Casa', 'PRECO': 100000.0 + numero,
+        'AVALIACAO': 200000.0, 'DESCONTO': '50%', 'MODALIDADE': 'Venda Online',
+        'LINK': f'http://caixa/detalhe?hdnimovel={numero}', 'FGTS': 'SIM', 'FINANCIAMENTO': 'SIM',
+        'DATA_DISPUTA': '10/11/2026',
+    }
+    linha.update(campos)
+    return linha
+
+def _sincronizar(*lotes, ufs=('SP',)):
+    sincronizacao = datalogic.Sincronizacao(ufs)
+    for lote in lotes:
+        sincronizacao.processar_lote(lote)
+    return sincronizacao, sincronizacao.finalizar()
+
+def _imoveis():
+    return {matricula: (status, preco) for matricula, status, preco in db.session.query(Imovel.MATRICULA, Imovel.Status, Imovel.PRECO)}
+
+def _historico(execucao_id):
+    return sorted(
+        (h.MATRICULA, h.campo, h.valor_novo)
+        for h in HistoricoAlteracao.query.filter_by(execucao_id=execucao_id)
+    )
+
+def test_primeira_sincronizacao_insere_em_lotes(app):
+    sincronizacao, execucao_id = _sincronizar([_linha(1), _linha(2)], [_linha(3)])
+    assert _imoveis() == {'SP1': ('Novo', 100001.0), 'SP2': ('Novo', 100002.0), 'SP3': ('Novo', 100003.0)}
+    assert sincronizacao.contagem[('SP', 'nova')] == 3
+    assert ('SP1', 'Status', 'Novo') in _historico(execucao_id)
+    assert Atualizacao.query.count() == 3
+    # As chaves da execução são só de trabalho.
+    assert ChaveExecucao.query.count() == 0
+
+def test_sincronizacao_atualiza_mantem_e_expira(app):
+    _sincronizar([_linha(1), _linha(2), _linha(3)])
+    sincronizacao, execucao_id = _sincronizar([_linha(1, PRECO=90000.0)], [_linha(2), _linha(4)])
+    assert _imoveis() == {
+        'SP1': ('Atualizado', 90000.0), 'SP2': ('Existente', 100002.0),
+        'SP3': ('Expirado', 100003.0), 'SP4': ('Novo', 100004.0),
+    }
+    assert {resultado: n for (_, resultado), n in sincronizacao.contagem.items()} == {
+        'atualizada': 1, 'inalterada': 1, 'nova': 1, 'expirada': 1,
+    }
+    historico = _historico(execucao_id)
+    assert ('SP1', 'PRECO', '90000') in historico
+    assert ('SP3', 'Status', 'Expirado') in historico
+
+def test_sincronizacao_nao_expira_outras_ufs(app):
+    _sincronizar([_linha(1), _linha(1, uf='RJ')], ufs=('SP', 'RJ'))
+    _sincronizar([_linha(2)])
+    assert _imoveis()['RJ1'] == ('Novo', 100001.0)
+    assert _imoveis()['SP1'][0] == 'Expirado'
+
+def test_chave_repetida_em_lotes_diferentes_conta_uma_vez(app):
+    sincronizacao, _ = _sincronizar([_linha(1)], [_linha(1, PRECO=1.0)])
+    assert _imoveis() == {'SP1': ('Novo', 100001.0)}
+    assert sincronizacao.contagem[('SP', 'nova')] == 1
+
+def test_insercao_com_erro_descarta_so_a_propria_linha(app):
+    _sincronizar([_linha(1), _linha(2)])
+    # Um valor que o SQLite não aceita quebra só o INSERT de SP4.
+    lote = [_linha(1, PRECO=80000.0), _linha(3), _linha(4, PRECO={'invalido': True}), _linha(5)]
+    sincronizacao, execucao_id = _sincronizar(lote + [_linha(2)])
+    assert _imoveis() == {
+        'SP1': ('Atualizado', 80000.0), 'SP2': ('Existente', 100002.0),
+        'SP3': ('Novo', 100003.0), 'SP5': ('Novo', 100005.0),
+    }
+    assert sincronizacao.contagem[('SP', 'nova')] == 2
+    assert sincronizacao.contagem[('SP', 'atualizada')] == 1
+    historico = _historico(execucao_id)
+    assert ('SP1', 'PRECO', '80000') in historico
+    assert not [h for h in historico if h[0] == 'SP4']
+    assert not Atualizacao.query.filter_by(MATRICULA='SP4').count()
+
+def test_lote_com_erro_ao_gravar_nao_deixa_linhas_pela_metade(app, monkeypatch):
+    from app import historico
+
+    sincronizacao = datalogic.Sincronizacao(['SP'])
+
+    def falhar(*args):
+        raise RuntimeError('disco cheio')
+    monkeypatch.setattr(historico, 'gravar', falhar)
+    # A primeira linha do lote é um INSERT em SAVEPOINT: ele não pode gravar
+    # sozinho no banco quando o resto do lote é desfeito.
+    with pytest.raises(RuntimeError):
+        sincronizacao.processar_lote([_linha(1), _linha(2)])
+    assert _imoveis() == {}
+
+def test_pagina_com_falha_vai_para_a_fila_de_pendentes(app):
+    _sincronizar([_linha(1, FALHA_DETALHE='timeout'), _linha(2)])
+    pendentes = PaginaPendente.query.all()
+    assert [(p.MATRICULA, p.ultimo_erro) for p in pendentes] == [('SP1', 'timeout')]
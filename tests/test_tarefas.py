@@ -0,0 +1,38 @@
+from datetime import datetime
+from app import cli, db, reprocessamento, scraper, tarefas
+from app.models import Imovel, PaginaPendente, Tarefa
+
+def _tarefa_ativa(tipo, uf='SP'):
+    db.session.add(Tarefa(tipo=tipo, UF=uf, status='executando', atualizado_em=datetime.utcnow()))
+    db.session.commit()
+
+def test_cli_enriquecer_nao_roda_junto_com_job_do_dashboard(app, monkeypatch):
+    _tarefa_ativa('enriquecimento')
+    chamadas = []
+    monkeypatch.setattr(reprocessamento, 'enriquecer_estado', lambda uf, **opcoes: chamadas.append(uf) or iter(()))
+    assert cli.main(['enriquecer', '--states', 'SP']) == 1
+    assert chamadas == []
+
+def test_cli_reprocessar_nao_roda_junto_com_outro_job(app, monkeypatch):
+    _tarefa_ativa('reprocessamento')
+    chamadas = []
+    monkeypatch.setattr(reprocessamento, 'reprocessar_pendentes', lambda *args, **opcoes: chamadas.append(args))
+    assert cli.main(['reprocessar', '--states', 'SP']) == 1
+    assert chamadas == []
+
+def test_cli_reprocessar_registra_um_job_por_uf(app, inserir, monkeypatch, capsys):
+    for uf in ('SP', 'RJ'):
+        inserir(UF=uf, MATRICULA=f'{uf}1', MODALIDADE='Venda Online', FGTS='NÃO')
+        db.session.add(PaginaPendente(UF=uf, MATRICULA=f'{uf}1', LINK=f'http://caixa/{uf}1', MODALIDADE='Venda Online'))
+    db.session.commit()
+    monkeypatch.setattr(scraper, 'extrair_dados_pagina_imovel', lambda link, modalidade, uf: {'FGTS': 'SIM'})
+
+    assert cli.main(['reprocessar']) == 0
+    assert '2 páginas pendentes: 2 recuperadas, 0 ainda com falha, 2 imóveis atualizados.' in capsys.readouterr().out
+    db.session.expire_all()
+    assert sorted((t.tipo, t.UF, t.status) for t in Tarefa.query) == [
+        ('reprocessamento', 'RJ', 'concluida'), ('reprocessamento', 'SP', 'concluida'),
+    ]
+    assert {i.FGTS for i in Imovel.query} == {'SIM'}
+    assert PaginaPendente.query.count() == 0
+    assert tarefas.listar()[0]['mensagem'].startswith('Reprocessamento de')